@@ -0,0 +1,195 @@
+"""
+Async access to the SQLite database for the FastAPI routes.
+
+Two backends have the same fetch_all, fetch_one, execute and close coroutines:
+
+ExecutorDatabase runs the blocking sqlite3 calls on a dedicated executor with a
+database_controller.ConnectionPool, so queries do not take slots from the threadpool FastAPI
+runs sync routes in. AiosqliteDatabase uses aiosqlite, which is optional, with one background
+thread per connection. Which one get_database returns is set by config DB_BACKEND.
+"""
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app import database_controller
+from app.config import get_config
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+class ExecutorDatabase(object):
+
+    def __init__(self, db_file: str, size: int = database_controller.POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self.pool = database_controller.ConnectionPool(db_file, size)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The database executor, started again on first use after close."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='database')
+            return self._executor
+
+    def _call(self, func, *args):
+        with self.pool.connection() as conn:
+            return func(conn, *args)
+
+    async def run(self, func, *args):
+        """Run func(conn, *args) with a pooled connection on the database executor."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, func, *args)
+
+    async def fetch_all(self, sql: str, params: dict = None) -> list:
+        return await self.run(database_controller.execute_sql, sql, params or {})
+
+    async def fetch_one(self, sql: str, params: dict = None):
+        rows = await self.fetch_all(sql, params)
+        return rows[0] if rows else None
+
+    async def execute(self, sql: str, params: dict = None) -> int:
+        """Run a write in its own transaction and return the number of rows changed."""
+        return await self.run(_execute, sql, params or {})
+
+    async def close(self):
+        """
+        Stop the executor and close the idle connections. The database stays usable, the routes hold on
+        to it and under Mangum the app is started and shut down again for every invocation.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.pool.close()
+
+
+class AiosqliteDatabase(object):
+
+    def __init__(self, db_file: str, size: int = database_controller.POOL_SIZE):
+        if aiosqlite is None:
+            raise RuntimeError('DB_BACKEND aiosqlite needs the aiosqlite package installed')
+        self.db_file = db_file
+        self.size = size
+        self._idle = []
+        self._created = 0
+        # futures of coroutines waiting for a connection. They may belong to different event loops,
+        # so the pool is guarded by a threading lock instead of asyncio primitives.
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        for pragma in database_controller.PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._created < self.size:
+                self._created += 1
+                waiter = None
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            return await waiter
+
+        try:
+            return await self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, conn):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    try:
+                        waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter, conn)
+                        return
+                    except RuntimeError:  # the waiter's event loop has been closed
+                        pass
+            self._idle.append(conn)
+
+    def _hand_over(self, waiter: asyncio.Future, conn):
+        if waiter.done():  # cancelled while the connection was on its way
+            self._release(conn)
+        else:
+            waiter.set_result(conn)
+
+    async def fetch_all(self, sql: str, params: dict = None) -> list:
+        conn = await self._acquire()
+        try:
+            async with conn.execute(sql, params or {}) as cur:
+                return list(await cur.fetchall())
+        finally:
+            self._release(conn)
+
+    async def fetch_one(self, sql: str, params: dict = None):
+        rows = await self.fetch_all(sql, params)
+        return rows[0] if rows else None
+
+    async def execute(self, sql: str, params: dict = None) -> int:
+        conn = await self._acquire()
+        try:
+            try:
+                cur = await conn.execute(sql, params or {})
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            return cur.rowcount
+        finally:
+            self._release(conn)
+
+    async def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            await conn.close()
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params: dict) -> int:
+    with conn:
+        return conn.execute(sql, params).rowcount
+
+
+BACKENDS = {
+    'executor': ExecutorDatabase,
+    'aiosqlite': AiosqliteDatabase,
+}
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_file: str, backend: str = None):
+    """The shared async database for a file and backend, created on first use."""
+    backend = backend or get_config().DB_BACKEND
+    with _databases_lock:
+        if (db_file, backend) not in _databases:
+            _databases[(db_file, backend)] = BACKENDS[backend](db_file)
+        return _databases[(db_file, backend)]
+
+
+async def close_databases():
+    """Close every shared database, they are kept so the routes' references still work when used again."""
+    with _databases_lock:
+        databases = list(_databases.values())
+    for database in databases:
+        await database.close()
@@ -1,50 +1,52 @@
 import logging
 import time
-from fake_useragent import UserAgent, FakeUserAgentError
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, InvalidSelectorException
-from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from urllib.parse import urljoin
+from selenium.common.exceptions import NoSuchElementException, InvalidSelectorException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+from app.browser_pool import BrowserPool, create_driver
 from app.util import decrypt
 from app.config import get_config, AppConfig
+from app.throttle import GearboxThrottle
+
+# Gearbox uses codenames for BL titles.
+GAME_CODES = {
+    'Borderlands: Game of the Year Edition': 'Mopane',
+    'Borderlands 2': 'Willow2',
+    'Borderlands: The Pre-Sequel': 'Cork',
+    'Borderlands 3': 'Oak',
+    'Tiny Tina\'s Wonderlands': 'Daffodil'
+}
+
+# Cookie fields selenium accepts in add_cookie
+COOKIE_KEYS = {'name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry'}
 
 
 class BorderlandsCrawler(object):
     name = "borderlands_spider"
     start_url = 'https://google.com'
-    GEARBOX_URL = 'https://shift.gearboxsoftware.com/home'
-    BORDERLANDS_REWARDS_URL = 'https://shift.gearboxsoftware.com/rewards'
+    LOGIN_BUTTON_XPATH = '/html/body/div[1]/div[2]/div[2]/div[1]/div/div[1]/form/div[7]/input'
+    SIGN_OUT_XPATH = '/html/body/div[2]/nav/div/div[2]/ul[2]/li[2]/a'
+    LOGIN_FAILED_MESSAGE = 'Incorrect email or password.'
 
-    def __init__(self, user: dict, browser: str = 'firefox', headless: bool = True, config: AppConfig = get_config()):
+    def __init__(self, user: dict, browser: str = 'firefox', headless: bool = True, config: AppConfig = get_config(),
+                 pool: BrowserPool = None, throttle: GearboxThrottle = None, base_url: str = None):
         self.user = user
-        # Gearbox uses codenames for BL titles.
-        self.game_codes = {
-            'Borderlands: Game of the Year Edition': 'Mopane',
-            'Borderlands 2': 'Willow2',
-            'Borderlands: The Pre-Sequel': 'Cork',
-            'Borderlands 3': 'Oak',
-            'Tiny Tina\'s Wonderlands': 'Daffodil'
-        }
+        self.game_codes = GAME_CODES
         self.config = config
-
-        self.options = FirefoxOptions()
-        if headless:
-            self.options.add_argument('-headless')
-
-        binary = FirefoxBinary(f'/usr/bin/{browser}')  # firefox for laptop, firefox-esr for pi
-        # self.options.add_argument('--proxy-server=%s' % PROXY)
-
-        try:
-            ua = UserAgent()
-            useragent = ua.random
-            self.options.add_argument(f'user-agent={useragent}')
-        except FakeUserAgentError:
-            pass
-
-        self.driver = webdriver.Firefox(firefox_binary=binary, firefox_options=self.options,
-                                        executable_path='/usr/local/share/gecko_driver/geckodriver')
-        self.driver.set_window_size(1500, 1000)
-        self.driver.get(self.start_url)
+        base_url = base_url or config.GEARBOX_BASE_URL
+        self.gearbox_url = urljoin(base_url, '/home')
+        self.rewards_url = urljoin(base_url, '/rewards')
+        self.throttle = throttle or GearboxThrottle()
+
+        # A pooled driver is already running, otherwise launch one for this crawler only.
+        self.pool = pool
+        if pool:
+            self.driver = pool.acquire()
+        else:
+            self.driver = create_driver(browser, headless)
+            self.driver.get(self.start_url)
 
     def click(self, xpath: str) -> bool:
         try:
@@ -72,37 +74,60 @@ class BorderlandsCrawler(object):
         except Exception as e:
             print(e)
 
+    def wait_for(self, condition, description: str, timeout: float = None):
+        """
+        Poll the page until condition(driver) returns a truthy value and log how long that took.
+
+        :param condition: callable taking the driver, e.g. a selenium expected_conditions instance
+        :param description: what is being waited for, used in the log message
+        :param timeout: seconds before giving up, defaults to config CRAWLER_WAIT_TIMEOUT
+        :return: the value returned by condition, or None if it timed out
+        """
+        timeout = timeout or self.config.CRAWLER_WAIT_TIMEOUT
+        start = time.monotonic()
+        try:
+            value = WebDriverWait(self.driver, timeout, poll_frequency=self.config.CRAWLER_WAIT_POLL).until(condition)
+            logging.debug(f'Waited {time.monotonic() - start:.2f}s for {description}.')
+            return value
+        except TimeoutException:
+            logging.warning(f'Timed out after {timeout}s waiting for {description}.')
+            return None
+
     def login_gearbox(self):
-        self.driver.get(self.GEARBOX_URL)
-        time.sleep(2)
+        self.throttle.before_request()
+        self.driver.get(self.gearbox_url)
+        self.wait_for(expected_conditions.element_to_be_clickable((By.ID, 'user_email')), 'login form')
 
         try:
             user_email = self.user['gearbox_email']
             user_password = decrypt(self.user['gearbox_password'].encode(), self.config.ENCRYPTION_KEY.encode()).decode()
         except Exception:  # todo: raise exceptions when accessing user details
-            raise Exception('Issue accessing User information.')
+            raise GearboxLoginError('Issue accessing User information.')
 
         if user_email and user_password:
             try:
                 self.input("user_email", user_email)
                 self.input("user_password", user_password)
-                self.click('/html/body/div[1]/div[2]/div[2]/div[1]/div/div[1]/form/div[7]/input')
+                self.throttle.before_request()
+                self.click(self.LOGIN_BUTTON_XPATH)
                 return self.check_logged_in()
             except InvalidSelectorException as exc:
                 logging.debug(exc)
                 logging.debug('Error logging into Gearbox')
                 raise GearboxLoginError('Error logging into Gearbox')
         else:
-            raise Exception('User information not set.')
+            raise GearboxLoginError('User information not set.')
 
     def check_logged_in(self) -> bool:
         """Checks page source if login was successful"""
-        if "Incorrect email or password." in self.driver.page_source:  # failed login
+        self.wait_for(lambda driver: self.LOGIN_FAILED_MESSAGE in driver.page_source
+                      or driver.find_elements_by_xpath(self.SIGN_OUT_XPATH), 'login result')
+        if self.LOGIN_FAILED_MESSAGE in self.driver.page_source:  # failed login
             print(f"User details for {self.user['gearbox_email']} are incorrect.")
             return False
 
         try:
-            sign_out_btn = self.driver.find_element_by_xpath('/html/body/div[2]/nav/div/div[2]/ul[2]/li[2]/a')
+            sign_out_btn = self.driver.find_element_by_xpath(self.SIGN_OUT_XPATH)
             if 'Sign Out' in sign_out_btn.text:
                 return True
         except NoSuchElementException:
@@ -110,24 +135,50 @@ class BorderlandsCrawler(object):
 
         return False
 
+    def get_session_cookies(self) -> list:
+        return self.driver.get_cookies()
+
+    def restore_session(self, cookies: list) -> bool:
+        """Load saved cookies and check Gearbox still has them signed in, True if it does."""
+        self.throttle.before_request()
+        self.driver.get(self.gearbox_url)  # cookies can only be added for the domain of the current page
+        for cookie in cookies:
+            self.driver.add_cookie({key: value for key, value in cookie.items()
+                                    if key in COOKIE_KEYS and value is not None})
+        self.throttle.before_request()
+        self.driver.get(self.rewards_url)
+        self.wait_for(page_loaded, 'rewards page')
+        return any('Sign Out' in elem.text for elem in self.driver.find_elements_by_xpath(self.SIGN_OUT_XPATH))
+
     def input_shift_code(self, code: str):
-        time.sleep(1)
-        self.driver.get(self.BORDERLANDS_REWARDS_URL)
-        time.sleep(3)
+        self.throttle.before_request()
+        self.driver.get(self.rewards_url)
+        self.wait_for(expected_conditions.element_to_be_clickable((By.ID, 'shift_code_input')), 'code input')
         self.input('shift_code_input', code)
+        self.throttle.before_request()
         self.click('//*[@id="shift_code_check"]')
+        self.wait_for(code_check_finished, f'code check of {code}')
         self.check_code_error(code)
 
         return True
 
     def redeem_shift_code(self, code: str, game: str, platform: str) -> bool:
-        time.sleep(1)
         game_code = self.game_codes[game].lower()
         # Select redeem button for the game on the platform option in from user_game table.
-        if not self.click(f'//input[@value="{game_code}"]/following-sibling::input[@class="submit_button redeem_button"'
-                          f' and contains(@value,"{platform}")]'):
+        # The code check has already loaded the results, so a missing button means the platform is not offered.
+        xpath = (f'//input[@value="{game_code}"]/following-sibling::input[@class="submit_button redeem_button"'
+                 f' and contains(@value,"{platform}")]')
+        button = None
+        if self.driver.find_elements_by_xpath(xpath):
+            button = self.wait_for(expected_conditions.element_to_be_clickable((By.XPATH, xpath)),
+                                   f'{platform} redeem button for {game}')
+        if not button:
             raise PlatformOptionNotFoundException(f'Could not redeem code {code} for '
                                                   f'{game} on {platform}')
+        self.throttle.before_request()
+        button.click()
+        self.wait_for(expected_conditions.staleness_of(button), f'redemption of {code} to submit')
+        self.wait_for(page_loaded, f'redemption result of {code}')
         self.check_code_error(code)
 
         return True
@@ -149,29 +200,50 @@ class BorderlandsCrawler(object):
         # check button clicked, checks if code is valid, if not raise exception
         if self.driver.find_element_by_xpath('//*[@id="shift_code_instructions"]').is_displayed():
             raise InvalidCodeException(f"SHiFT code: {code} is not a valid SHiFT code")
-        if "This SHiFT code has expired" in self.driver.page_source:
-            raise CodeExpiredException(f"SHiFT code: {code}, has expired")
-        if "Failed to redeem your SHiFT code" in self.driver.page_source:  # unknown why this happens
-            raise CodeFailedException(f'Code {code} failed to be redeemed')
-        if 'This SHiFT code has already been redeemed' in self.driver.page_source:
-            # success, user has already used this code
-            raise ShiftCodeAlreadyRedeemedException(f'Code {code} has already been redeemed')
-        if 'This code is not available for your account' in self.driver.page_source:
-            # valid, but cannot be redeemed for user
-            raise CodeNotAvailableException(f'Code {code} is not available for your account')
-        if 'Unexpected Error Occurred' in self.driver.page_source:  # probably a gearbox related issue
-            raise GearboxUnexpectedError('Gearbox ran into and unexpected error.')
-        if 'To continue to redeem SHiFT codes, please launch a SHiFT-enabled title first!' in \
-                self.driver.page_source:  # rate limit hit, cannot continue to redeem codes
-            raise GearboxShiftError(f'Cannot continue to input shift codes on this account {self.user[1]}')
+        check_page_errors(self.driver.page_source, code, self.user.get('gearbox_email'))
 
     def tear_down(self):
-        self.driver.quit()
+        if self.pool:
+            self.pool.release(self.driver)
+        else:
+            self.driver.quit()
 
     def screenshot(self):
         self.driver.save_screenshot("screenshot.png")
 
 
+def check_page_errors(page_source: str, code: str, account: str) -> None:
+    """Raise the exception matching a Gearbox error message in the page, shared by every redemption backend."""
+    if "This SHiFT code has expired" in page_source:
+        raise CodeExpiredException(f"SHiFT code: {code}, has expired")
+    if "Failed to redeem your SHiFT code" in page_source:  # unknown why this happens
+        raise CodeFailedException(f'Code {code} failed to be redeemed')
+    if 'This SHiFT code has already been redeemed' in page_source:
+        # success, user has already used this code
+        raise ShiftCodeAlreadyRedeemedException(f'Code {code} has already been redeemed')
+    if 'This code is not available for your account' in page_source:
+        # valid, but cannot be redeemed for user
+        raise CodeNotAvailableException(f'Code {code} is not available for your account')
+    if 'Unexpected Error Occurred' in page_source:  # probably a gearbox related issue
+        raise GearboxUnexpectedError('Gearbox ran into and unexpected error.')
+    if 'To continue to redeem SHiFT codes, please launch a SHiFT-enabled title first!' in \
+            page_source:  # rate limit hit, cannot continue to redeem codes
+        raise GearboxShiftError(f'Cannot continue to input shift codes on this account {account}')
+
+
+def code_check_finished(driver) -> bool:
+    """The code check request has filled the results container, or shown the invalid code instructions."""
+    results = driver.find_elements_by_id('code_results')
+    if results and results[0].text.strip():
+        return True
+    instructions = driver.find_elements_by_id('shift_code_instructions')
+    return bool(instructions) and instructions[0].is_displayed()
+
+
+def page_loaded(driver) -> bool:
+    return driver.execute_script('return document.readyState') == 'complete'
+
+
 class PlatformOptionNotFoundException(Exception):
     pass
 
@@ -0,0 +1,218 @@
+"""
+Pool of warm Firefox sessions shared by BorderlandsCrawler instances.
+
+Starting geckodriver and Firefox is the largest fixed cost of a crawl, so drivers are
+kept running between users. Cookies and web storage are cleared when a driver is handed
+back, and drivers are recycled after a number of uses, when they crash or when the pool
+uses more memory than allowed.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from fake_useragent import UserAgent, FakeUserAgentError
+from selenium import webdriver
+from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+GECKODRIVER_PATH = '/usr/local/share/gecko_driver/geckodriver'
+
+
+@lru_cache(maxsize=1)
+def load_user_agents():
+    """fake_useragent downloads its browser list when created, do that once per process. None if it failed."""
+    try:
+        return UserAgent()
+    except FakeUserAgentError:
+        return None
+
+
+def random_user_agent():
+    """A random browser user agent, or None if the list could not be loaded."""
+    user_agents = load_user_agents()
+    try:
+        return user_agents.random if user_agents else None
+    except FakeUserAgentError:
+        return None
+
+
+def create_driver(browser: str = 'firefox', headless: bool = True):
+    """Launch a new Firefox session."""
+    options = FirefoxOptions()
+    if headless:
+        options.add_argument('-headless')
+
+    binary = FirefoxBinary(f'/usr/bin/{browser}')  # firefox for laptop, firefox-esr for pi
+    # options.add_argument('--proxy-server=%s' % PROXY)
+
+    useragent = random_user_agent()
+    if useragent:
+        options.add_argument(f'user-agent={useragent}')
+
+    driver = webdriver.Firefox(firefox_binary=binary, firefox_options=options,
+                               executable_path=GECKODRIVER_PATH)
+    driver.set_window_size(1500, 1000)
+    return driver
+
+
+def process_tree_rss_mb(pid: int) -> float:
+    """Resident memory in MB of a process and all of its descendants, 0 if /proc is unavailable."""
+    children = {}
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # the process name can contain spaces, the ppid is the second field after it
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    rss_kb, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+
+    return rss_kb / 1024
+
+
+def driver_rss_mb(driver) -> float:
+    """Memory used by geckodriver and the Firefox processes it started."""
+    try:
+        return process_tree_rss_mb(driver.service.process.pid)
+    except AttributeError:
+        return 0
+
+
+class BrowserPool(object):
+    """
+    Hands out pre-launched Firefox drivers.
+
+    :param size: maximum number of drivers alive at once
+    :param max_uses: a driver is quit and replaced after handing it out this many times
+    :param max_memory_mb: drivers are quit instead of kept warm while the pool uses more than this
+    """
+
+    def __init__(self, size: int, browser: str = 'firefox', headless: bool = True,
+                 max_uses: int = 20, max_memory_mb: int = 1500):
+        self.size = size
+        self.browser = browser
+        self.headless = headless
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+
+        self._idle = []
+        self._uses = {}
+        self._created = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float = None):
+        """Return a warm driver, launching one if the pool is not full, otherwise wait for a release."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Browser pool is closed.')
+            while not self._idle and self._created >= self.size:
+                if not self._condition.wait(timeout):
+                    raise TimeoutError(f'No browser available after {timeout} seconds.')
+            if self._idle:
+                driver = self._idle.pop()
+                self._uses[driver] += 1
+                return driver
+            self._created += 1
+
+        try:
+            driver = create_driver(self.browser, self.headless)
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._uses[driver] = 1
+        return driver
+
+    def release(self, driver) -> None:
+        """Return a driver to the pool, resetting it for the next user or quitting it if it must be recycled."""
+        with self._condition:
+            keep = not self._closed and self._uses.get(driver, 0) < self.max_uses
+        # resetting talks to the browser, so it is done without holding the lock
+        keep = keep and self.reset(driver)
+        if keep and self.max_memory_mb and self.memory_mb() > self.max_memory_mb:
+            logging.info(f'Browser pool is over {self.max_memory_mb}MB, recycling driver.')
+            keep = False
+
+        with self._condition:
+            keep = keep and not self._closed  # the pool may have been closed while the driver was reset
+            if keep:
+                self._idle.append(driver)
+                self._condition.notify()
+                return
+
+        self.quit(driver)
+        with self._condition:
+            self._uses.pop(driver, None)
+            self._created -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def session(self, timeout: float = None):
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    @staticmethod
+    def reset(driver) -> bool:
+        """Clear cookies and storage of the page the driver is on. False if the driver has crashed."""
+        try:
+            driver.delete_all_cookies()
+            driver.execute_script('try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}')
+            driver.get('about:blank')
+            return True
+        except Exception as e:  # WebDriverException, or a connection error if geckodriver has died
+            logging.info(f'Discarding browser that could not be reset: {e}')
+            return False
+
+    @staticmethod
+    def quit(driver) -> None:
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug(f'Error quitting browser: {e}')
+
+    def memory_mb(self) -> float:
+        with self._condition:
+            drivers = list(self._uses)
+        return sum(driver_rss_mb(driver) for driver in drivers)
+
+    def open(self) -> None:
+        """Hand out drivers again after close, e.g. when the API starts up again in the same process."""
+        with self._condition:
+            self._closed = False
+
+    def close(self) -> None:
+        """Quit every idle driver. Drivers still in use are quit when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for driver in idle:
+                self._uses.pop(driver, None)
+            self._created -= len(idle)
+            self._condition.notify_all()
+
+        for driver in idle:
+            self.quit(driver)
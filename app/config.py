@@ -16,6 +16,33 @@ class AppConfig:
     REDOC_URL = BASE_PATH + "/redoc"
     OPENAPI_URL = BASE_PATH + "/openapi.json"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
+    CRAWLER_WORKERS = 4
+    BROWSER_MAX_USES = 20
+    BROWSER_POOL_MAX_MEMORY_MB = 1500
+    VERIFY_BROWSER_POOL_SIZE = 1
+    VERIFY_WORKERS = 1  # more than VERIFY_BROWSER_POOL_SIZE only waits for a browser
+    VERIFY_JOB_TTL_MINUTES = 60
+    CRAWLER_WAIT_TIMEOUT = 15
+    CRAWLER_WAIT_POLL = 0.1
+    REDEMPTION_BACKEND = 'selenium'  # selenium or http
+    GEARBOX_BASE_URL = 'https://shift.gearboxsoftware.com'
+    HTTP_TIMEOUT = 30
+    # Limits shared by the crawl workers, see app/throttle.py. 0 turns a limit off.
+    GEARBOX_REQUESTS_PER_SECOND = 2
+    GEARBOX_REQUEST_BURST = 5
+    GEARBOX_ACCOUNT_QUOTA = 40  # redemptions per account per run
+    GEARBOX_FAILURE_THRESHOLD = 3  # unexpected errors in a row before every worker pauses
+    GEARBOX_FAILURE_COOLDOWN = 300
+    CODE_GAMES_CACHE_TTL_HOURS = 24
+    CRAWL_RUN_RESUME_HOURS = 24  # unfinished runs older than this are abandoned, not resumed
+    CRAWL_TASK_MAX_ATTEMPTS = 3
+    CRAWL_TASK_RETRY_SECONDS = 60  # doubled after each failed attempt
+    CRAWL_TASK_LEASE_SECONDS = 300  # remote workers heartbeat to keep their task, see app/crawl_worker.py
+    CRAWL_WORKER_TOKEN = None  # bearer token for the crawl task API, the API is disabled if not set
+    WRITE_BUFFER_SIZE = 25  # crawl results written per transaction, see app/write_buffer.py
+    GEARBOX_SESSION_TTL_HOURS = 24  # cap on how long saved login cookies are reused
+    RESPONSE_CACHE_SIZE = 256
+    DB_BACKEND = 'executor'  # executor or aiosqlite
 
     def __init__(self):
         env_vars = [
@@ -41,6 +68,19 @@ class AppConfig:
         # Encryption Key
         self.ENCRYPTION_KEY = os.getenv('BORDERLANDS_ENCRYPTION_KEY')
 
+        # Number of users redeemed concurrently by start_crawlers
+        self.CRAWLER_WORKERS = int(os.getenv('BORDERLANDS_CRAWLER_WORKERS', self.CRAWLER_WORKERS))
+        # Drive a browser (selenium) or send the requests directly (http) when redeeming codes
+        self.REDEMPTION_BACKEND = os.getenv('BORDERLANDS_REDEMPTION_BACKEND', self.REDEMPTION_BACKEND)
+        # How the API routes reach SQLite, see app/async_database.py
+        self.DB_BACKEND = os.getenv('BORDERLANDS_DB_BACKEND', self.DB_BACKEND)
+        # Shared secret of the crawl workers on other hosts
+        self.CRAWL_WORKER_TOKEN = os.getenv('BORDERLANDS_CRAWL_WORKER_TOKEN', self.CRAWL_WORKER_TOKEN)
+        # Where the redeemers find Gearbox, e.g. a local stub, and how fast they may go
+        self.GEARBOX_BASE_URL = os.getenv('BORDERLANDS_GEARBOX_BASE_URL', self.GEARBOX_BASE_URL)
+        self.GEARBOX_REQUESTS_PER_SECOND = float(os.getenv('BORDERLANDS_GEARBOX_REQUESTS_PER_SECOND',
+                                                           self.GEARBOX_REQUESTS_PER_SECOND))
+
 
 class DevelopAppConfig(AppConfig):
     env_name = "DEVELOP"
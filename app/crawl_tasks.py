@@ -0,0 +1,105 @@
+"""
+What happens to a crawl task during and after an attempt, shared by start_crawlers, which runs tasks in
+its own threads, the crawl task API remote workers claim tasks from (app/routes/crawl_tasks.py) and the
+workers themselves (app/crawl_worker.py).
+"""
+import json
+import logging
+import threading
+from sqlite3 import Connection
+
+from app import database_controller
+from app.config import AppConfig
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+class Heartbeat(object):
+    """
+    Renews a task's lease every interval seconds in a background thread while the task runs. If the lease
+    is lost the lost event is set, the crawl checks it before each code and stops.
+    """
+
+    def __init__(self, renew, task_id: int, interval: float):
+        """:param renew: called with the task id, raises LeaseLostError if the lease is no longer held"""
+        self.renew = renew
+        self.task_id = task_id
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat_{task_id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.renew(self.task_id)
+            except LeaseLostError as e:
+                logging.warning(f'{e}, another worker may crawl it again.')
+                self.lost.set()
+                return
+            except Exception as e:  # try again on the next beat, the lease may still hold
+                logging.warning(f'Heartbeat for crawl task {self.task_id} failed: {e!r}')
+
+
+def retry_backoff(attempts: int, config: AppConfig) -> float:
+    """Seconds to wait before retrying a task after its attempts so far, doubling with each one."""
+    return config.CRAWL_TASK_RETRY_SECONDS * 2 ** max(attempts - 1, 0)
+
+
+def record_task_result(conn: Connection, task_id: int, attempts: int, result: dict, config: AppConfig,
+                       worker: str = None):
+    """
+    Save the result of an attempt at a task. A result asking for a retry puts the task back to pending
+    with a backoff, until it has had CRAWL_TASK_MAX_ATTEMPTS attempts and is failed. A permanent error,
+    such as Gearbox rejecting the user's details, fails it straight away.
+
+    :param worker: the worker reporting the result, which must still hold the task's lease
+    :return: the task's new status, or None if the worker had lost the lease
+    """
+    retry_seconds = None
+    if result.get('permanent'):
+        status = 'failed'
+    elif not result.get('retry'):
+        status = 'done'
+    elif attempts < config.CRAWL_TASK_MAX_ATTEMPTS:
+        status, retry_seconds = 'pending', retry_backoff(attempts, config)
+    else:
+        status = 'failed'
+
+    if not database_controller.update_crawl_task(conn, task_id, status, json.dumps(result), retry_seconds, worker):
+        return None
+    return status
+
+
+def task_payload(conn: Connection, task) -> dict:
+    """
+    Everything a remote worker needs to crawl a claimed task: the user without their site password, the
+    games they redeem for and the task's codes they have not used yet.
+    """
+    user = database_controller.select_user_by_id(conn, task['user_id'])
+    if user is None:
+        return None
+
+    user = dict(user)
+    user['password'] = ''
+    games = {row['game']: row['platform'] for row in database_controller.get_user_games(conn, task['user_id'])}
+    codes = [dict(row) for row in database_controller.select_unused_codes(conn, task['user_id'], task['code_ids'])]
+    return {
+        'task_id': task['_id'],
+        'run_id': task['run_id'],
+        'attempts': task['attempts'],
+        'lease_expires': task['lease_expires'],
+        'user': user,
+        'games': games,
+        'codes': codes,
+    }
@@ -0,0 +1,150 @@
+"""
+Crawl worker for a host without the database.
+
+Claims crawl tasks from the crawl task API (app/routes/crawl_tasks.py) of the host that runs the run,
+crawls each task's user with input_borderlands_codes and sends the results back. Start as many workers,
+on as many hosts, as Gearbox allows:
+
+    python -m app.crawl_worker --api http://crawler-host:8000 --worker worker-1
+
+The worker needs the same BORDERLANDS_ENCRYPTION_KEY as the API to decrypt the gearbox passwords and
+BORDERLANDS_CRAWL_WORKER_TOKEN to use the API. Its code_game lookups and gearbox sessions are cached in a
+local SQLite file, and its GearboxThrottle only limits the worker's own requests.
+"""
+import argparse
+import logging
+import socket
+import time
+
+import requests
+
+from app import database_controller
+from app import input_borderlands_codes as ibc
+from app.browser_pool import BrowserPool
+from app.config import get_config
+from app.crawl_tasks import Heartbeat, LeaseLostError
+from app.throttle import GearboxThrottle
+from app.write_buffer import WriteBuffer
+
+
+class CrawlApiClient(object):
+
+    def __init__(self, base_url: str, token: str, worker: str, timeout: float = 30):
+        self.url = base_url.rstrip('/') + get_config().BASE_PATH + '/crawl/tasks'
+        self.worker = worker
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def _post(self, path: str, **body) -> requests.Response:
+        response = self.session.post(f'{self.url}/{path}', json={'worker': self.worker, **body}, timeout=self.timeout)
+        if response.status_code == 409:
+            raise LeaseLostError(response.json()['detail'])
+        response.raise_for_status()
+        return response
+
+    def claim(self) -> dict:
+        """Lease the next task. :return: the task from task_payload, None if there is nothing to do"""
+        response = self._post('claim')
+        if response.status_code == 204:
+            return None
+        return response.json()
+
+    def heartbeat(self, task_id: int) -> str:
+        return self._post(f'{task_id}/heartbeat').json()['lease_expires']
+
+    def write(self, task_id: int, user_codes: list, invalid_code_ids: list, notify_launch_game: dict) -> int:
+        response = self._post(f'{task_id}/writes', user_codes=user_codes, invalid_code_ids=invalid_code_ids,
+                              notify_launch_game=notify_launch_game)
+        return response.json()['created']
+
+    def complete(self, task_id: int, result: dict) -> str:
+        return self._post(f'{task_id}/complete', result=result).json()['status']
+
+
+def setup_cache(cache_db: str) -> None:
+    """Create the tables the crawl reads and writes locally."""
+    conn = database_controller.create_connection(cache_db)
+    try:
+        database_controller.create_code_game_table(conn)
+        database_controller.create_gearbox_session_table(conn)
+    finally:
+        conn.close()
+
+
+def run_claimed_task(client: CrawlApiClient, payload: dict, cache_db: str, pool: BrowserPool = None,
+                     throttle: GearboxThrottle = None) -> str:
+    """
+    Crawl a claimed task and report the result.
+    :return: the task's new status, None if the lease was lost before the result was reported
+    """
+    config = get_config()
+    task_id = payload['task_id']
+    writes = WriteBuffer(size=config.WRITE_BUFFER_SIZE,
+                         write=lambda user_codes, invalid_code_ids, notify_launch_game:
+                         client.write(task_id, user_codes, invalid_code_ids, notify_launch_game))
+    print(f'Crawl task {task_id} claimed with {len(payload["codes"])} codes for user {payload["user"]["_id"]}.')
+
+    try:
+        with Heartbeat(client.heartbeat, task_id, config.CRAWL_TASK_LEASE_SECONDS / 3) as heartbeat:
+            result = ibc.crawl_user(cache_db, payload['user'], payload['games'], pool, throttle, payload['codes'],
+                                    writes, cancel=heartbeat.lost)
+    except LeaseLostError as e:
+        logging.warning(f'{e}, stopping its crawl.')
+        return None
+
+    try:
+        status = client.complete(task_id, result)
+    except LeaseLostError as e:
+        logging.warning(f'{e}, dropping its result.')
+        return None
+    print(f'Crawl task {task_id} {status}: {result["redeemed"]} redeemed, {result["failed"]} failed.')
+    return status
+
+
+def run_worker(client: CrawlApiClient, cache_db: str, until_idle: bool = False, poll_seconds: float = 30) -> int:
+    """
+    Claim and crawl tasks one at a time, waiting poll_seconds whenever there are none.
+    :param until_idle: return the first time there is no task to claim instead of waiting for more
+    :return: the number of tasks crawled
+    """
+    config = get_config()
+    setup_cache(cache_db)
+    pool = None
+    if config.REDEMPTION_BACKEND != 'http':
+        pool = BrowserPool(size=1, headless=False, max_uses=config.BROWSER_MAX_USES,
+                           max_memory_mb=config.BROWSER_POOL_MAX_MEMORY_MB)
+    throttle = GearboxThrottle.from_config(config)
+
+    crawled = 0
+    try:
+        while True:
+            payload = client.claim()
+            if payload is None:
+                if until_idle:
+                    return crawled
+                time.sleep(poll_seconds)
+                continue
+
+            run_claimed_task(client, payload, cache_db, pool, throttle)
+            crawled += 1
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl tasks claimed from the crawl task API.')
+    parser.add_argument('--api', required=True, help='base url of the API, e.g. http://localhost:8000')
+    parser.add_argument('--worker', default=socket.gethostname(), help='name the worker leases tasks under')
+    parser.add_argument('--cache', default='crawl_worker_cache.db', help='local SQLite cache file')
+    parser.add_argument('--poll', type=float, default=30, help='seconds to wait when there is no task')
+    parser.add_argument('--until-idle', action='store_true', help='exit once there is no task to claim')
+    args = parser.parse_args()
+
+    ibc.setup_logger()
+    worker_config = get_config()
+    if not worker_config.CRAWL_WORKER_TOKEN:
+        raise SystemExit('BORDERLANDS_CRAWL_WORKER_TOKEN must be set.')
+    api_client = CrawlApiClient(args.api, worker_config.CRAWL_WORKER_TOKEN, args.worker)
+    run_worker(api_client, args.cache, until_idle=args.until_idle, poll_seconds=args.poll)
@@ -1,6 +1,23 @@
 import logging
+import queue
 import sqlite3
-from sqlite3 import Error, Connection
+import threading
+from contextlib import contextmanager
+from sqlite3 import Error, Connection, Cursor
+
+POOL_SIZE = 8
+POOL_TIMEOUT = 30
+
+# WAL lets API reads carry on while the crawler or ingestion scripts write, busy_timeout makes
+# writers wait for the lock instead of failing with "database is locked".
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 67108864',
+    'PRAGMA temp_store = MEMORY',
+)
 
 
 def create_connection(db_file):
@@ -9,12 +26,78 @@ def create_connection(db_file):
     try:
         conn = sqlite3.connect(db_file, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        configure_connection(conn)
     except Error as e:
         print(e)
 
     return conn
 
 
+def configure_connection(conn: Connection):
+    cur = conn.cursor()
+    for pragma in PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of connections to one database file. A connection is used by one thread at a
+    time and handed back when the with block exits, instead of a single connection being shared
+    by every thread.
+    """
+
+    def __init__(self, db_file: str, size: int = POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self, timeout: float = POOL_TIMEOUT):
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError(f'No connection to {self.db_file} available after {timeout} seconds')
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = create_connection(self.db_file)
+
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """The shared connection pool for a database file, created on first use."""
+    with _pools_lock:
+        if db_file not in _pools:
+            _pools[db_file] = ConnectionPool(db_file)
+        return _pools[db_file]
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+
+
 def execute_sql(conn: Connection, sql: str, params: dict = None):
     """
     Query all rows in the codes table
@@ -25,6 +108,35 @@ def execute_sql(conn: Connection, sql: str, params: dict = None):
     return cur.fetchall()
 
 
+def iter_rows(conn: Connection, sql: str, params: dict = None, batch_size: int = 500):
+    """
+    Run a query and yield its rows in lists of up to batch_size, so a large result is never
+    held in memory at once. The cursor is closed when the generator finishes or is closed.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params or {})
+        yield from fetch_batches(cur, batch_size)
+    finally:
+        cur.close()
+
+
+def fetch_batches(cur: Cursor, batch_size: int = 500):
+    """Yield the rows left in an executed cursor in lists of up to batch_size."""
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def add_column(conn: Connection, table: str, column: str, definition: str):
+    """Add a column to a table created before the column existed, nothing is done if it is already there."""
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        create_table(conn, f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
 def create_user_table(conn: Connection):
     sql = """CREATE TABLE IF NOT EXISTS user(
                 _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
@@ -77,12 +189,158 @@ def create_user_code_table(conn: Connection):
                 game TEXT,
                 platform TEXT,
                 is_redeem_success INTEGER NOT NULL,
+                redeemed_at TEXT,
                 UNIQUE(user_id, code_id, game, platform),
                 FOREIGN KEY (code_id) REFERENCES code (_id),
                 FOREIGN KEY (user_id) REFERENCES user (_id)
             )"""
 
     create_table(conn, sql)
+    # rows created before redeemed_at was added have no redemption time
+    add_column(conn, 'user_code', 'redeemed_at', 'TEXT')
+
+
+def create_code_game_table(conn: Connection):
+    """
+    Cache of the games Gearbox lists for a SHiFT code. The games are the same for every
+    account, so they are looked up once and shared by all users' crawlers.
+    """
+    sql = """CREATE TABLE IF NOT EXISTS code_game(
+                code TEXT NOT NULL,
+                game TEXT NOT NULL,
+                observed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY(code, game)
+            )"""
+
+    create_table(conn, sql)
+
+
+def create_checkpoint_table(conn: Connection):
+    """Named values kept between runs of the code scrapers, e.g. the last ETag of the JSON archive."""
+    sql = """CREATE TABLE IF NOT EXISTS checkpoint(
+                name TEXT PRIMARY KEY NOT NULL,
+                value TEXT,
+                updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )"""
+
+    create_table(conn, sql)
+
+
+def create_gearbox_session_table(conn: Connection):
+    """Logged in Gearbox session cookies per account, Fernet encrypted, see app/gearbox_session.py."""
+    sql = """CREATE TABLE IF NOT EXISTS gearbox_session(
+                gearbox_email TEXT PRIMARY KEY NOT NULL,
+                cookies TEXT NOT NULL,
+                expires TEXT NOT NULL,
+                updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )"""
+
+    create_table(conn, sql)
+
+
+def create_crawl_tables(conn: Connection):
+    """
+    A crawl_run row per start_crawlers run, with a crawl_task per user it planned to crawl. Tasks are
+    pending, running, done or failed, code_ids is the JSON list of the code ids planned for the user.
+    An unfinished run is resumed by the next start_crawlers, see input_borderlands_codes.start_crawl_run.
+    Tasks claimed by remote workers through the crawl task API hold a lease until lease_expires.
+    """
+    create_table(conn, """CREATE TABLE IF NOT EXISTS crawl_run(
+                            _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                            status TEXT NOT NULL DEFAULT 'running',
+                            started TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            finished TEXT
+                        )""")
+    create_table(conn, """CREATE TABLE IF NOT EXISTS crawl_task(
+                            _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                            run_id INTEGER NOT NULL,
+                            user_id INTEGER NOT NULL,
+                            code_ids TEXT NOT NULL,
+                            status TEXT NOT NULL DEFAULT 'pending',
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            next_attempt TEXT,
+                            result TEXT,
+                            lease_owner TEXT,
+                            lease_expires TEXT,
+                            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            UNIQUE(run_id, user_id),
+                            FOREIGN KEY (run_id) REFERENCES crawl_run (_id),
+                            FOREIGN KEY (user_id) REFERENCES user (_id)
+                        )""")
+    # tables created before tasks could be leased
+    add_column(conn, 'crawl_task', 'lease_owner', 'TEXT')
+    add_column(conn, 'crawl_task', 'lease_expires', 'TEXT')
+
+
+def create_data_version_table(conn: Connection):
+    """
+    A counter bumped by triggers on every write to the code and user_code tables, from any
+    process. The API uses it to tell when its cached responses are stale.
+    Must be created after the code and user_code tables.
+    """
+    create_table(conn, """CREATE TABLE IF NOT EXISTS data_version(
+                            _id INTEGER PRIMARY KEY CHECK (_id = 1),
+                            version INTEGER NOT NULL DEFAULT 0
+                        )""")
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO data_version(_id, version) VALUES(1, 0)")
+
+    for table in ('code', 'user_code'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            create_table(conn, f"""CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_data_version
+                                   AFTER {event} ON {table}
+                                   BEGIN
+                                       UPDATE data_version SET version = version + 1 WHERE _id = 1;
+                                   END""")
+
+
+SELECT_DATA_VERSION = "SELECT version FROM data_version WHERE _id = 1"
+
+
+def get_data_version(conn: Connection) -> int:
+    cur = conn.cursor()
+    cur.execute(SELECT_DATA_VERSION)
+    row = cur.fetchone()
+    cur.close()
+
+    return row['version'] if row else 0
+
+
+def create_indexes(conn: Connection):
+    """
+    Indexes for the per-user code queries. idx_code_valid only holds valid codes so the
+    crawler does not walk expired ones, idx_user_code_user_success covers the user_code
+    lookups by user and redemption result. idx_code_game_page and idx_code_game (both end in the
+    rowid, _id) give the GET /codes pages in order, without and with a game filter, idx_code_expires
+    serves its expiry range filters. idx_user_code_user gives a user's export its _id order.
+    """
+    create_table(conn, 'CREATE INDEX IF NOT EXISTS idx_code_valid ON code(_id) WHERE is_valid = 1')
+    create_table(conn, 'CREATE INDEX IF NOT EXISTS idx_user_code_user_success '
+                       'ON user_code(user_id, is_redeem_success, code_id)')
+    create_table(conn, 'CREATE INDEX IF NOT EXISTS idx_code_game ON code(game)')
+    create_table(conn, "CREATE INDEX IF NOT EXISTS idx_code_game_page ON code(COALESCE(game, ''))")
+    create_table(conn, 'CREATE INDEX IF NOT EXISTS idx_code_expires ON code(expires)')
+    create_table(conn, 'CREATE INDEX IF NOT EXISTS idx_user_code_user ON user_code(user_id)')
+    # the exports read in time order before they read in _id order
+    create_table(conn, 'DROP INDEX IF EXISTS idx_code_time_gathered')
+    create_table(conn, 'DROP INDEX IF EXISTS idx_user_code_user_redeemed')
+
+
+def create_schema(conn: Connection):
+    """
+    Create every table, trigger and index, adding the columns a database made by an older
+    version is missing. Safe to run on a database that is already up to date.
+    """
+    create_code_table(conn)
+    create_user_table(conn)
+    create_user_code_table(conn)
+    create_user_game_table(conn)
+    create_code_game_table(conn)
+    create_checkpoint_table(conn)
+    create_gearbox_session_table(conn)
+    create_data_version_table(conn)
+    create_crawl_tables(conn)
+    create_indexes(conn)
 
 
 def create_table(conn: Connection, sql: str):
@@ -126,6 +384,44 @@ def create_code(conn: Connection, code_data: dict):
     return cur.lastrowid
 
 
+def create_codes_bulk(conn: Connection, codes, update: bool = True) -> dict:
+    """
+    Insert many codes into the code table in a single transaction.
+
+    :param conn: db connection
+    :param codes: iterable of code dicts with the keys taken by create_code
+    :param update: for codes already in the table, replace the reward and expiry when the new values are known
+        and differ. Otherwise existing codes are skipped.
+    :return: counts of inserted, updated and skipped codes
+    """
+    insert_sql = '''INSERT INTO code(game, platform, code, type, reward, time_gathered, expires)
+                    VALUES(:game, :platform, :code, :type, :reward, :time_gathered, :expires)
+                    ON CONFLICT(game, code) DO NOTHING'''
+    # 'Unknown' never overwrites a value from another source
+    update_sql = '''UPDATE code SET reward = COALESCE(NULLIF(:reward, 'Unknown'), reward),
+                                   expires = COALESCE(NULLIF(:expires, 'Unknown'), expires)
+                    WHERE game = :game AND code = :code
+                      AND (COALESCE(NULLIF(:reward, 'Unknown'), reward) IS NOT reward
+                           OR COALESCE(NULLIF(:expires, 'Unknown'), expires) IS NOT expires)'''
+
+    codes = list(codes)
+    cur = conn.cursor()
+    # the counts come from each statement's own changes, both in the one transaction
+    with conn:
+        cur.executemany(insert_sql, codes)
+        inserted = cur.rowcount
+        updated = 0
+        if update:
+            cur.executemany(update_sql, codes)
+            updated = cur.rowcount
+    cur.close()
+
+    counts = {'inserted': inserted, 'updated': updated, 'skipped': len(codes) - inserted - updated}
+    print(f'Bulk created codes: {counts["inserted"]} inserted, {counts["updated"]} updated, '
+          f'{counts["skipped"]} skipped.')
+    return counts
+
+
 def update_invalid_code(conn: Connection, code_id: int):
     """
     update the validity of the code
@@ -137,6 +433,8 @@ def update_invalid_code(conn: Connection, code_id: int):
     cur = conn.cursor()
     with conn:
         cur.execute(sql, (code_id, ))
+        # the games listed for an invalid or expired code are no longer useful
+        cur.execute('DELETE FROM code_game WHERE code IN (SELECT code FROM code WHERE _id = ?)', (code_id, ))
     cur.close()
 
 
@@ -176,6 +474,16 @@ def select_valid_codes(conn: Connection):
     return rows
 
 
+def select_code_keys(conn: Connection) -> set:
+    """The (game, code) pair of every code in the code table."""
+    cur = conn.cursor()
+    cur.execute("SELECT game, code FROM code")
+    keys = {(row['game'], row['code']) for row in cur}
+    cur.close()
+
+    return keys
+
+
 def select_code_by_id(conn: Connection, code_id: int):
     cur = conn.cursor()
     cur.execute("SELECT * FROM code WHERE _id=?", (code_id, ))
@@ -184,6 +492,77 @@ def select_code_by_id(conn: Connection, code_id: int):
     return rows
 
 
+def select_code_games(conn: Connection, code: str, max_age_hours: float):
+    """
+    Games a code can be redeemed for, as last seen on Gearbox.
+    :return: list of game titles, or None if the code has not been looked up in the last max_age_hours
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT game FROM code_game WHERE code = ? AND observed_at >= datetime('now', ?) ORDER BY rowid",
+                (code, f'-{max_age_hours} hours'))
+    rows = cur.fetchall()
+    cur.close()
+
+    return [row['game'] for row in rows] or None
+
+
+def set_code_games(conn: Connection, code: str, games: list) -> None:
+    """Replace the cached games of a code with the games just seen on Gearbox."""
+    cur = conn.cursor()
+    with conn:
+        cur.execute('DELETE FROM code_game WHERE code = ?', (code, ))
+        cur.executemany('INSERT OR IGNORE INTO code_game(code, game) VALUES(?, ?)',
+                        [(code, game) for game in games])
+    cur.close()
+
+
+def get_checkpoint(conn: Connection, name: str):
+    """:return: the value stored under name, or None if it has not been set"""
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM checkpoint WHERE name = ?", (name, ))
+    row = cur.fetchone()
+    cur.close()
+
+    return row['value'] if row else None
+
+
+def set_checkpoint(conn: Connection, name: str, value) -> None:
+    sql = """INSERT INTO checkpoint(name, value) VALUES(?, ?)
+             ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated = CURRENT_TIMESTAMP"""
+    cur = conn.cursor()
+    with conn:
+        cur.execute(sql, (name, value))
+    cur.close()
+
+
+def select_gearbox_session(conn: Connection, gearbox_email: str):
+    """:return: the encrypted cookies saved for the account, or None if there are none or they have expired"""
+    cur = conn.cursor()
+    cur.execute("SELECT cookies FROM gearbox_session WHERE gearbox_email = ? AND expires > datetime('now')",
+                (gearbox_email, ))
+    row = cur.fetchone()
+    cur.close()
+
+    return row['cookies'] if row else None
+
+
+def set_gearbox_session(conn: Connection, gearbox_email: str, cookies: str, expires: str) -> None:
+    sql = """INSERT INTO gearbox_session(gearbox_email, cookies, expires) VALUES(?, ?, ?)
+             ON CONFLICT(gearbox_email) DO UPDATE SET cookies = excluded.cookies, expires = excluded.expires,
+                                                      updated = CURRENT_TIMESTAMP"""
+    cur = conn.cursor()
+    with conn:
+        cur.execute(sql, (gearbox_email, cookies, expires))
+    cur.close()
+
+
+def delete_gearbox_session(conn: Connection, gearbox_email: str) -> None:
+    cur = conn.cursor()
+    with conn:
+        cur.execute("DELETE FROM gearbox_session WHERE gearbox_email = ?", (gearbox_email, ))
+    cur.close()
+
+
 def create_user(conn: Connection, user_data: dict):
     sql = '''INSERT INTO user(email, password, gearbox_email, gearbox_password)
                  VALUES(:email, :password, :gearbox_email, :gearbox_password)'''
@@ -268,8 +647,8 @@ def create_user_code(conn: Connection, user_id: int, code_id: int,
     :param is_success: an int representing a bool if the code was successfully redeemed or not
     :return: the id of the last row created
     """
-    sql = '''INSERT INTO user_code(user_id, code_id, game, platform, is_redeem_success)
-                     VALUES(:user_id, :code_id, :game, :platform, :is_success)'''
+    sql = '''INSERT INTO user_code(user_id, code_id, game, platform, is_redeem_success, redeemed_at)
+                     VALUES(:user_id, :code_id, :game, :platform, :is_success, CURRENT_TIMESTAMP)'''
     cur = conn.cursor()
 
     try:
@@ -291,6 +670,33 @@ def create_user_code(conn: Connection, user_id: int, code_id: int,
     return cur.lastrowid
 
 
+def write_crawl_results(conn: Connection, user_codes: list, invalid_code_ids: list,
+                        notify_launch_game: dict) -> int:
+    """
+    Save what a crawler has found in a single transaction, see app/write_buffer.py.
+    :param conn: db connection
+    :param user_codes: (user_id, code_id, game, platform, is_success) tuples, ones already in user_code are skipped
+    :param invalid_code_ids: ids of codes Gearbox says are invalid or expired
+    :param notify_launch_game: user id -> value to set notify_launch_game to
+    :return: the number of user_code rows created
+    """
+    sql = '''INSERT INTO user_code(user_id, code_id, game, platform, is_redeem_success, redeemed_at)
+                     VALUES(?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+             ON CONFLICT(user_id, code_id, game, platform) DO NOTHING'''
+    invalid = [(code_id, ) for code_id in invalid_code_ids]
+    cur = conn.cursor()
+    with conn:
+        cur.executemany(sql, user_codes)
+        created = max(cur.rowcount, 0)
+        cur.executemany('UPDATE code SET is_valid = 0 WHERE _id = ?', invalid)
+        cur.executemany('DELETE FROM code_game WHERE code IN (SELECT code FROM code WHERE _id = ?)', invalid)
+        cur.executemany('UPDATE user SET notify_launch_game = ? WHERE _id = ?',
+                        [(launch_bool, user_id) for user_id, launch_bool in notify_launch_game.items()])
+    cur.close()
+
+    return created
+
+
 def get_user_codes_by_id(conn: Connection, user_id: int):
     cur = conn.cursor()
     cur.execute('SELECT * FROM user_code WHERE user_id=?', (user_id, ))
@@ -299,24 +705,249 @@ def get_user_codes_by_id(conn: Connection, user_id: int):
 
 def get_valid_codes_by_user(conn: Connection, user_id: int):
     cur = conn.cursor()
-    cur.execute('SELECT * FROM code WHERE _id NOT IN ('
-                'SELECT code_id FROM user_code WHERE user_id=?1)'
-                'AND is_valid = 1', (user_id,))
+    cur.execute('SELECT * FROM code c WHERE c.is_valid = 1 AND NOT EXISTS ('
+                'SELECT 1 FROM user_code uc WHERE uc.user_id = ? AND uc.code_id = c._id)', (user_id,))
     return cur.fetchall()
 
 
+def select_redemption_work(conn: Connection, max_age_hours: float):
+    """
+    Every (user, code) pair a crawl could redeem, in the order they should be tried, see
+    input_borderlands_codes.plan_redemptions.
+
+    Users without gearbox details or without any user_game, codes that are invalid and codes the user
+    already has a user_code for are left out. When code_game has the games of a code from the last
+    max_age_hours, the code is only kept for users with a platform set for one of those games, with a row
+    per game in planned_game and planned_platform. Otherwise the games are not known until the code is
+    checked and planned_game is NULL.
+
+    Codes that expire soonest come first, then codes without an expiry (NULL or 'Unknown'), then codes
+    past their expiry (they are still tried, some are redeemable after it). Ties go to the most recently gathered code.
+    :return: rows of user_id, every code column, planned_game and planned_platform
+    """
+    sql = """WITH fresh_code_game AS (
+                SELECT code, game FROM code_game WHERE observed_at >= datetime('now', :max_age)
+             )
+             SELECT u._id AS user_id, c.*, ug.game AS planned_game, ug.platform AS planned_platform
+             FROM user u
+             JOIN code c ON c.is_valid = 1
+             LEFT JOIN fresh_code_game cg ON cg.code = c.code
+             LEFT JOIN user_game ug ON ug.user_id = u._id AND ug.game = cg.game
+             WHERE u.gearbox_email IS NOT NULL AND u.gearbox_password IS NOT NULL
+               AND EXISTS (SELECT 1 FROM user_game WHERE user_id = u._id)
+               AND NOT EXISTS (SELECT 1 FROM user_code uc WHERE uc.user_id = u._id AND uc.code_id = c._id)
+               AND (cg.code IS NULL OR ug._id IS NOT NULL)
+             ORDER BY CASE WHEN c.expires IS NULL OR c.expires = 'Unknown' THEN 1
+                           WHEN c.expires < datetime('now') THEN 2 ELSE 0 END,
+                      COALESCE(c.expires, 'Unknown'),
+                      c.time_gathered = 'Unknown', c.time_gathered DESC,
+                      c._id DESC, u._id"""
+    cur = conn.cursor()
+    cur.execute(sql, {'max_age': f'-{max_age_hours} hours'})
+    rows = cur.fetchall()
+    cur.close()
+
+    return rows
+
+
+def create_crawl_run(conn: Connection, tasks: list) -> int:
+    """
+    Record a new crawl run and its tasks in one transaction.
+    :param tasks: (user_id, code_ids JSON) tuples
+    :return: the id of the run
+    """
+    cur = conn.cursor()
+    with conn:
+        cur.execute("INSERT INTO crawl_run DEFAULT VALUES")
+        run_id = cur.lastrowid
+        cur.executemany("INSERT INTO crawl_task(run_id, user_id, code_ids) VALUES(?, ?, ?)",
+                        [(run_id, user_id, code_ids) for user_id, code_ids in tasks])
+    cur.close()
+
+    return run_id
+
+
+def select_unfinished_crawl_run(conn: Connection, max_age_hours: float):
+    """
+    The latest run started in the last max_age_hours that has not finished, or None. Older unfinished runs
+    are marked abandoned.
+    """
+    cur = conn.cursor()
+    with conn:
+        cur.execute("""UPDATE crawl_run SET status = 'abandoned', finished = CURRENT_TIMESTAMP
+                       WHERE status = 'running' AND started < datetime('now', ?)""", (f'-{max_age_hours} hours', ))
+    cur.execute("SELECT * FROM crawl_run WHERE status = 'running' ORDER BY _id DESC LIMIT 1")
+    row = cur.fetchone()
+    cur.close()
+
+    return row
+
+
+def finish_crawl_run(conn: Connection, run_id: int) -> bool:
+    """Mark the run finished if none of its tasks are pending or running. :return: True if it was"""
+    sql = """UPDATE crawl_run SET status = 'finished', finished = CURRENT_TIMESTAMP
+             WHERE _id = :run_id AND status = 'running' AND NOT EXISTS (
+                SELECT 1 FROM crawl_task WHERE run_id = :run_id AND status IN ('pending', 'running'))"""
+    cur = conn.cursor()
+    with conn:
+        cur.execute(sql, {'run_id': run_id})
+        finished = cur.rowcount > 0
+    cur.close()
+
+    return finished
+
+
+def select_unfinished_crawl_tasks(conn: Connection, run_id: int):
+    """The run's pending and running tasks, in the order they were planned."""
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM crawl_task WHERE run_id = ? AND status IN ('pending', 'running') ORDER BY _id",
+                (run_id, ))
+    rows = cur.fetchall()
+    cur.close()
+
+    return rows
+
+
+# a task a worker can lease: pending and due, or running on a lease that has expired
+EXPIRED_CRAWL_TASK = "status = 'running' AND lease_expires < datetime('now')"
+CLAIMABLE_CRAWL_TASK = f"""((status = 'pending' AND (next_attempt IS NULL OR next_attempt <= datetime('now')))
+                            OR ({EXPIRED_CRAWL_TASK}))"""
+
+
+def start_crawl_task(conn: Connection, task_id: int, worker: str, lease_seconds: float) -> int:
+    """
+    Lease a task to the worker and mark it running, if it could be claimed by claim_crawl_task.
+    :return: the number of attempts made at it, including this one, or None if another worker holds its lease
+    """
+    cur = conn.cursor()
+    with conn:
+        # the write lock is held from the update to the read, RETURNING needs SQLite 3.35
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute(f"""UPDATE crawl_task SET status = 'running', attempts = attempts + 1, lease_owner = :worker,
+                                              lease_expires = datetime('now', :lease), updated = CURRENT_TIMESTAMP
+                        WHERE _id = :task_id AND {CLAIMABLE_CRAWL_TASK}""",
+                    {'worker': worker, 'lease': f'+{lease_seconds} seconds', 'task_id': task_id})
+        attempts = None
+        if cur.rowcount > 0:
+            cur.execute("SELECT attempts FROM crawl_task WHERE _id = ?", (task_id, ))
+            attempts = cur.fetchone()[0]
+    cur.close()
+
+    return attempts
+
+
+def update_crawl_task(conn: Connection, task_id: int, status: str, result: str = None,
+                      retry_seconds: float = None, worker: str = None) -> bool:
+    """
+    Set a task's status and the JSON result of its last attempt, and release its lease.
+    :param retry_seconds: for a pending task, how long to wait before it is tried again
+    :param worker: only update the task if this worker holds its lease
+    :return: False if the task was not updated because the worker does not hold its lease
+    """
+    sql = """UPDATE crawl_task SET status = :status, result = COALESCE(:result, result), updated = CURRENT_TIMESTAMP,
+                                   next_attempt = CASE WHEN :retry IS NULL THEN NULL ELSE datetime('now', :delay) END,
+                                   lease_owner = NULL, lease_expires = NULL
+             WHERE _id = :task_id"""
+    if worker is not None:
+        sql += " AND status = 'running' AND lease_owner = :worker"
+    cur = conn.cursor()
+    with conn:
+        cur.execute(sql, {'status': status, 'result': result, 'retry': retry_seconds,
+                          'delay': f'+{retry_seconds or 0} seconds', 'task_id': task_id, 'worker': worker})
+        updated = cur.rowcount > 0
+    cur.close()
+
+    return updated
+
+
+def claim_crawl_task(conn: Connection, worker: str, lease_seconds: float, max_attempts: int):
+    """
+    Lease the first task of an unfinished run that is pending and due, or running on a lease that has
+    expired, to the worker. Expired tasks that have had max_attempts are marked failed instead.
+    :return: the claimed task, or None if there are none to claim
+    """
+    cur = conn.cursor()
+    with conn:
+        # another worker cannot claim the task between the select and the update, RETURNING needs SQLite 3.35
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute(f"""UPDATE crawl_task SET status = 'failed', lease_owner = NULL, lease_expires = NULL,
+                                              updated = CURRENT_TIMESTAMP
+                        WHERE {EXPIRED_CRAWL_TASK} AND attempts >= ?""", (max_attempts, ))
+        cur.execute(f"""SELECT _id FROM crawl_task
+                        WHERE run_id IN (SELECT _id FROM crawl_run WHERE status = 'running') AND {CLAIMABLE_CRAWL_TASK}
+                        ORDER BY _id LIMIT 1""")
+        row = cur.fetchone()
+        task = None
+        if row is not None:
+            cur.execute(f"""UPDATE crawl_task SET status = 'running', attempts = attempts + 1, lease_owner = :worker,
+                                                  lease_expires = datetime('now', :lease), updated = CURRENT_TIMESTAMP
+                            WHERE _id = :task_id AND {CLAIMABLE_CRAWL_TASK}""",
+                        {'worker': worker, 'lease': f'+{lease_seconds} seconds', 'task_id': row['_id']})
+            if cur.rowcount > 0:
+                cur.execute("SELECT * FROM crawl_task WHERE _id = ?", (row['_id'], ))
+                task = cur.fetchone()
+    cur.close()
+
+    return task
+
+
+def renew_crawl_task_lease(conn: Connection, task_id: int, worker: str, lease_seconds: float):
+    """:return: when the renewed lease expires, or None if the worker no longer holds the task's lease"""
+    sql = """UPDATE crawl_task SET lease_expires = datetime('now', ?), updated = CURRENT_TIMESTAMP
+             WHERE _id = ? AND status = 'running' AND lease_owner = ?"""
+    cur = conn.cursor()
+    with conn:
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute(sql, (f'+{lease_seconds} seconds', task_id, worker))
+        row = None
+        if cur.rowcount > 0:
+            cur.execute("SELECT lease_expires FROM crawl_task WHERE _id = ?", (task_id, ))
+            row = cur.fetchone()
+    cur.close()
+
+    return row[0] if row else None
+
+
+def select_crawl_task(conn: Connection, task_id: int):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM crawl_task WHERE _id = ?", (task_id, ))
+    row = cur.fetchone()
+    cur.close()
+
+    return row
+
+
+def select_unused_codes(conn: Connection, user_id: int, code_ids: str):
+    """
+    The valid codes in code_ids the user has no user_code for, in the order of code_ids.
+    :param code_ids: JSON list of code ids, as in crawl_task
+    """
+    sql = """SELECT c.* FROM json_each(?) j JOIN code c ON c._id = j.value
+             WHERE c.is_valid = 1
+               AND NOT EXISTS (SELECT 1 FROM user_code uc WHERE uc.user_id = ? AND uc.code_id = c._id)
+             ORDER BY j.key"""
+    cur = conn.cursor()
+    cur.execute(sql, (code_ids, user_id))
+    rows = cur.fetchall()
+    cur.close()
+
+    return rows
+
+
 def get_successful_codes_by_user_id(conn: Connection, user_id: int):
     cur = conn.cursor()
-    cur.execute('SELECT * FROM code WHERE _id IN ('
-                'SELECT code_id FROM user_code WHERE user_id=? AND is_redeem_success = 1)'
-                'ORDER BY game DESC', (user_id,))
+    cur.execute('SELECT c.* FROM code c JOIN ('
+                'SELECT DISTINCT code_id FROM user_code WHERE user_id = ? AND is_redeem_success = 1'
+                ') uc ON c._id = uc.code_id '
+                'ORDER BY c.game DESC', (user_id,))
     return cur.fetchall()
 
 
 def get_unsuccessful_codes_by_user_id(conn: Connection, user_id: int):
     cur = conn.cursor()
-    cur.execute('SELECT * FROM code WHERE _id IN ('
-                'SELECT code_id FROM user_code WHERE user_id=? AND is_redeem_success = 0)', (user_id,))
+    cur.execute('SELECT c.* FROM code c JOIN ('
+                'SELECT DISTINCT code_id FROM user_code WHERE user_id = ? AND is_redeem_success = 0'
+                ') uc ON c._id = uc.code_id', (user_id,))
     return cur.fetchall()
 
 
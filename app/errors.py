@@ -4,9 +4,10 @@ from app.models.schemas import ErrorResponse, ErrorDetails
 
 
 class InvalidParameterError(Exception):
-    def __init__(self, request: Request, params: []):
+    def __init__(self, request: Request, params: [], msg: str = 'parameter is not expected'):
         self.request = request
         self.params = params
+        self.msg = msg
 
     def response(self):
         response_data = {
@@ -19,7 +20,7 @@ class InvalidParameterError(Exception):
         for param in self.params:
             err_data = {
                 'param': param,
-                'msg': 'parameter is not expected',
+                'msg': self.msg,
             }
 
             error_detail = ErrorDetails(**err_data)
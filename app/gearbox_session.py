@@ -0,0 +1,77 @@
+"""
+Gearbox session cookies kept between runs so a redeemer can skip the login form.
+
+After a successful login the redeemer's cookies are stored in the gearbox_session table, encrypted
+with the ENCRYPTION_KEY, until the first of them expires or GEARBOX_SESSION_TTL_HOURS has passed.
+The next login restores them and only submits the login form if Gearbox no longer shows the
+sign-out link. Both redemption backends keep cookies as dicts with the keys selenium uses: name,
+value, domain, path, secure, httpOnly and expiry (seconds since the epoch, or None).
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlite3 import Connection
+
+from app import database_controller
+from app.config import get_config, AppConfig
+from app.util import encrypt, decrypt
+
+
+def session_expiry(cookies: list, ttl_hours: float) -> datetime:
+    """When the saved session should stop being used, in UTC."""
+    expires = datetime.utcnow() + timedelta(hours=ttl_hours)
+    for cookie in cookies:
+        if cookie.get('expiry'):
+            expires = min(expires, datetime.utcfromtimestamp(cookie['expiry']))
+
+    return expires
+
+
+def save_session(conn: Connection, gearbox_email: str, cookies: list, config: AppConfig = None) -> None:
+    config = config or get_config()
+    token = encrypt(json.dumps(cookies).encode(), config.ENCRYPTION_KEY.encode()).decode()
+    expires = session_expiry(cookies, config.GEARBOX_SESSION_TTL_HOURS)
+    database_controller.set_gearbox_session(conn, gearbox_email, token, expires.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def load_session(conn: Connection, gearbox_email: str, config: AppConfig = None):
+    """:return: the unexpired cookies saved for the account, or None"""
+    config = config or get_config()
+    token = database_controller.select_gearbox_session(conn, gearbox_email)
+    if not token:
+        return None
+
+    try:
+        cookies = json.loads(decrypt(token.encode(), config.ENCRYPTION_KEY.encode()))
+    except Exception as e:  # saved with another key, or corrupt
+        logging.warning(f'Could not read saved Gearbox session for {gearbox_email}: {e!r}')
+        return None
+
+    now = time.time()
+    return [cookie for cookie in cookies if not cookie.get('expiry') or cookie['expiry'] > now]
+
+
+def login(conn: Connection, redeemer, config: AppConfig = None) -> bool:
+    """
+    Log the redeemer in to Gearbox, with its saved session if that is still signed in.
+
+    :param redeemer: BorderlandsCrawler or ShiftClient
+    :return: True if logged in
+    """
+    gearbox_email = redeemer.user['gearbox_email']
+    cookies = load_session(conn, gearbox_email, config)
+    if cookies:
+        if redeemer.restore_session(cookies):
+            logging.debug(f'Restored Gearbox session for {gearbox_email}')
+            return True
+        database_controller.delete_gearbox_session(conn, gearbox_email)
+
+    logged_in = redeemer.login_gearbox()
+    if logged_in:
+        try:
+            save_session(conn, gearbox_email, redeemer.get_session_cookies(), config)
+        except Exception as e:  # the login still worked, it will be done again next run
+            logging.warning(f'Could not save Gearbox session for {gearbox_email}: {e!r}')
+
+    return logged_in
@@ -7,26 +7,53 @@ from app.util import convert_date
 database = "borderlands_codes.db"
 conn = database_controller.create_connection(database)
 
-
-def json_archive(conn: Connection):
-    url = 'https://shift.orcicorn.com/shift-code/index.json'
+ARCHIVE_URL = 'https://shift.orcicorn.com/shift-code/index.json'
+ETAG_CHECKPOINT = 'orcicorn_etag'
+LAST_MODIFIED_CHECKPOINT = 'orcicorn_last_modified'
+
+
+def json_archive(conn: Connection, url: str = ARCHIVE_URL, session: requests.Session = None) -> dict:
+    """
+    Add the codes in the orcicorn archive that are not in the code table yet.
+
+    The archive's ETag and Last-Modified are kept as checkpoints and sent back on the next run,
+    so nothing is downloaded or written when the archive has not changed.
+    :return: the counts from create_codes_bulk
+    """
+    headers = {}
+    etag = database_controller.get_checkpoint(conn, ETAG_CHECKPOINT)
+    last_modified = database_controller.get_checkpoint(conn, LAST_MODIFIED_CHECKPOINT)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
 
     # creating HTTP response object from given url
-    resp = requests.get(url)
+    resp = (session or requests).get(url, headers=headers, timeout=30)
+    if resp.status_code == 304:
+        print('Code archive has not changed since the last run.')
+        return {'inserted': 0, 'updated': 0, 'skipped': 0}
+    resp.raise_for_status()
     codes = resp.json()[0]['codes']
 
-    for code in codes:
-        code_data = {
-            'game': code['game'],
-            'platform': code['platform'],
-            'code': code['code'],
-            'type': code['type'],
-            'reward': code['reward'],
-            'time_gathered': convert_date(code['archived']),
-            'expires': convert_date(code['expires'])
-        }
-        database_controller.create_code(conn, code_data)
+    existing = database_controller.select_code_keys(conn)
+    codes_data = ({
+        'game': code['game'],
+        'platform': code['platform'],
+        'code': code['code'],
+        'type': code['type'],
+        'reward': code['reward'],
+        'time_gathered': convert_date(code['archived']),
+        'expires': convert_date(code['expires'])
+    } for code in codes if (code['game'], code['code']) not in existing)
+    counts = database_controller.create_codes_bulk(conn, codes_data, update=False)
+
+    # only saved once the codes are in, a failed run fetches the archive again
+    database_controller.set_checkpoint(conn, ETAG_CHECKPOINT, resp.headers.get('ETag'))
+    database_controller.set_checkpoint(conn, LAST_MODIFIED_CHECKPOINT, resp.headers.get('Last-Modified'))
+    return counts
 
 
 if __name__ == "__main__":
+    database_controller.create_checkpoint_table(conn)
     json_archive(conn)
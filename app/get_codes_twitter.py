@@ -6,7 +6,6 @@ from sqlite3 import Connection
 
 import tweepy
 from tweepy import OAuthHandler
-from tweepy.models import Status
 
 from app import database_controller
 from app.config import get_config, AppConfig
@@ -15,92 +14,159 @@ from app.util import convert_date
 database = "borderlands_codes.db"
 conn = database_controller.create_connection(database)
 
-
-def get_shift_tweets(conn: Connection, config: AppConfig = get_config()):
-    auth = OAuthHandler(config.CONSUMER_KEY, config.CONSUMER_SECRET)
-    auth.set_access_token(config.ACCESS_TOKEN, config.ACCESS_TOKEN_SECRET)
-
-    api = tweepy.API(auth)
-    tweets = api.user_timeline(screen_name='dgSHiFTCodes', count=200,
-                               exclude_replies=True, include_rts=False, tweet_mode='extended')
-
+SCREEN_NAME = 'dgSHiFTCodes'
+PAGE_SIZE = 200
+SINCE_ID_CHECKPOINT = 'twitter_since_id'
+
+
+def get_shift_tweets(conn: Connection, config: AppConfig = get_config(), api: tweepy.API = None):
+    """
+    Add the codes from tweets posted since the last run. The id of the newest tweet processed is
+    kept in the twitter_since_id checkpoint.
+    :return: the counts from create_codes_bulk
+    """
+    if api is None:
+        auth = OAuthHandler(config.CONSUMER_KEY, config.CONSUMER_SECRET)
+        auth.set_access_token(config.ACCESS_TOKEN, config.ACCESS_TOKEN_SECRET)
+        api = tweepy.API(auth)
+
+    since_id = database_controller.get_checkpoint(conn, SINCE_ID_CHECKPOINT)
+    tweets = fetch_new_tweets(api, int(since_id) if since_id else None)
+    if not tweets:
+        print(f'No new tweets from {SCREEN_NAME}.')
+        return {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+    codes = []
     for tweet in tweets:
-        code_type, code, game, reward, platform, expires = None, None, None, None, None, None
-
         try:
-            game, code_type, code, reward, expires = parse_tweet(tweet)
-        except KeyError as e:
+            tweet_codes = parse_tweet_codes(tweet.full_text)
+        except Exception as e:
             msg = f'Error on_data: {str(e)},\n data: {tweet}'
             print(msg)
             logging.error(msg, exc_info=True)
-
-        # if tweet contains relevant information, create code
-        if code_type and code:
-            if code_type == "shift" and not platform and game in ["Borderlands 3", 'Wonderlands']:
-                platform = "Universal"
-            else:
-                platform = "Xbox"
-
-            code_data = {
-                'game': game,
-                'platform': platform,
-                'code': code,
-                'type': code_type,
-                'reward': reward,
-                'time_gathered': datetime.now(),
-                'expires': expires
-            }
-            database_controller.create_code(conn, code_data)
+            continue
+
+        for code in tweet_codes:
+            code['time_gathered'] = datetime.now()
+            codes.append(code)
+
+    counts = database_controller.create_codes_bulk(conn, codes)
+    database_controller.set_checkpoint(conn, SINCE_ID_CHECKPOINT, str(max(tweet.id for tweet in tweets)))
+    return counts
+
+
+def fetch_new_tweets(api: tweepy.API, since_id: int = None, page_size: int = PAGE_SIZE) -> list:
+    """
+    Tweets newer than since_id, newest first. The timeline is paged back with max_id until it
+    reaches since_id, so nothing is missed when more than a page of tweets came in between runs.
+    Without a since_id only the latest page is fetched.
+    """
+    tweets, max_id = [], None
+    while True:
+        page = api.user_timeline(screen_name=SCREEN_NAME, count=page_size, since_id=since_id, max_id=max_id,
+                                 exclude_replies=True, include_rts=False, tweet_mode='extended')
+        # replies are filtered out after the page is taken, so a short page does not mean the end
+        if not page:
+            break
+        tweets.extend(page)
+        if since_id is None:
+            break
+        max_id = page[-1].id - 1
+
+    return tweets
+
+
+# Every field of a tweet is matched by one pattern so the text is scanned once. Fields and labelled codes
+# start a line. A code anywhere else, after a label the pattern does not know or in running text, is still
+# found by the last alternative, as Universal.
+PLATFORM = r'(?i:all\splatforms|universal|pc|steam|epic|xbox|xb|playstation|ps)'
+TWEET_PATTERN = re.compile(r"""
+      ^Game:\s(?P<game>WONDERLANDS|BORDERLANDS:?\s(?:[2-3]|[A-Z]+-[A-Z]+))
+    | ^Reward:\s(?P<reward>[^\n]+)
+    | ^Expires:\s(?P<expires>[^\n]+)
+    | ^(?:(?P<platform>{platform}(?:[^\S\n]*/[^\S\n]*{platform})*)
+         [^\S\n]*(?:\([^)\n]*\))?:?\s*)?
+      (?P<code>(?:[A-Z\d]{{5}}-){{4}}[A-Z\d]{{5}})
+    | (?<![A-Za-z\d])(?P<unlabelled_code>(?:[A-Z\d]{{5}}-){{4}}[A-Z\d]{{5}})
+""".format(platform=PLATFORM), re.VERBOSE | re.MULTILINE)
+
+PLATFORMS = {
+    'all platforms': 'Universal', 'universal': 'Universal',
+    'pc': 'PC', 'steam': 'PC', 'epic': 'PC',
+    'xbox': 'Xbox', 'xb': 'Xbox',
+    'playstation': 'PlayStation', 'ps': 'PlayStation',
+}
+
+
+def label_platform(label: str) -> str:
+    """The platform of a label before a code. Combined labels, e.g. 'XBOX/PS', are Universal unless they are
+    names of the same platform, e.g. 'Steam/Epic'."""
+    if not label:
+        return 'Universal'
+    platforms = {PLATFORMS[name.strip().lower()] for name in label.split('/')}
+    return platforms.pop() if len(platforms) == 1 else 'Universal'
+
+
+def parse_tweet_codes(text: str) -> list:
+    """
+    Every SHiFT code in a tweet. A code's platform comes from a label before it, e.g. 'PC: ...' or
+    'Universal (Twitter)' on the line above, and is Universal when the tweet does not name one.
+    :return: code dicts with the game, platform, code, type, reward and expires keys of the code table
+    """
+    game, reward, expires = 'Unknown', 'Unknown', None
+    found = []
+    for match in TWEET_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'game':
+            game = match.group('game').title()
+        elif kind == 'reward':
+            reward = match.group('reward')
+        elif kind == 'expires':
+            expires = match.group('expires')
+        elif kind == 'code':
+            found.append((label_platform(match.group('platform')), match.group('code')))
+        else:
+            found.append(('Universal', match.group('unlabelled_code')))
+
+    expires = convert_date(expires)
+    return [{'game': game, 'platform': platform, 'code': code, 'type': 'SHiFT', 'reward': reward,
+             'expires': expires} for platform, code in dict.fromkeys(found)]
+
+
+def first_field(text: str, *fields: str):
+    """The first value of one of the fields of TWEET_PATTERN in the text, None if there is none."""
+    for match in TWEET_PATTERN.finditer(text):
+        if match.lastgroup in fields:
+            return match.group(match.lastgroup)
+
+    return None
 
 
 def get_reward(text: str) -> str:
-    regexp = re.compile(r'Reward: (.*?(?=\n{1,}))')
-    reward_match = re.search(regexp, text)
-    if reward_match:
-        return reward_match.group(1)
-
-    return "Unknown"
+    return first_field(text, 'reward') or "Unknown"
 
 
 def get_game(text: str) -> str:
-    game_regexp = re.compile(r'Game: (WONDERLANDS|BORDERLANDS:?\s([2-3]|[A-Z]+-[A-Z]+))')
-    game_match = re.search(game_regexp, text)
-    if game_match:
-        return game_match.group(1).title()
-
-    return "Unknown"
+    game = first_field(text, 'game')
+    return game.title() if game else "Unknown"
 
 
 def get_code(text: str) -> (str, str):
-    shift_regexp = re.compile(r'[Xbox:\s]?(([A-Z\d]{5}-){4}[A-Z\d]{5})')
-    shift_match = re.search(shift_regexp, text)
-    if shift_match:
-        return "SHiFT", shift_match.group(1)
+    code = first_field(text, 'code', 'unlabelled_code')
+    if code:
+        return "SHiFT", code
 
     return None, None
 
 
 def get_expiration(text: str) -> str:
-    regexp = re.compile(r'Expires: (.*?(?=\n{1,}))')
-    expiry_match = re.search(regexp, text)
-    try:
-        if expiry_match.group(1):
-            return convert_date(expiry_match.group(1))
-    except AttributeError:
-        pass
+    expires = first_field(text, 'expires')
+    if expires:
+        return convert_date(expires)
 
     return "Unknown"
 
 
-def parse_tweet(tweet: Status):
-    text = tweet.full_text
-    game = get_game(text)
-    code_type, code = get_code(text)
-    reward = get_reward(text)
-    expires = get_expiration(text)
-
-    return game, code_type, code, reward, expires
-
-
 if __name__ == "__main__":
+    database_controller.create_checkpoint_table(conn)
     get_shift_tweets(conn)
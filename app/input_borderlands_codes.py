@@ -1,10 +1,25 @@
+import argparse
+import functools
+import json
 import logging
 import logging.handlers
+import os
+import socket
 import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
 from sqlite3 import Connection
 from app.models.schemas import User, Code
 import app.borderlands_crawler as dtc
-from app import database_controller
+from app import database_controller, gearbox_session
+from app.browser_pool import BrowserPool
+from app.config import get_config, AppConfig
+from app.crawl_tasks import Heartbeat, LeaseLostError, record_task_result, retry_backoff
+from app.shift_client import ShiftClient
+from app.throttle import GearboxThrottle, AccountQuotaExceeded
+from app.write_buffer import WriteBuffer
 from app.borderlands_crawler import CodeFailedException, GameNotFoundException, \
     PlatformOptionNotFoundException, GearboxShiftError, GearboxUnexpectedError, \
     ShiftCodeAlreadyRedeemedException, InvalidCodeException, \
@@ -13,69 +28,121 @@ from app.borderlands_crawler import CodeFailedException, GameNotFoundException,
 database = "borderlands_codes.db"
 db_conn = database_controller.create_connection(database)
 
+# the name start_crawlers leases its tasks under, unique to the process so runs started on the same host
+# at the same time do not take each other's tasks. The pid alone repeats, e.g. in containers.
+LOCAL_WORKER = f'start_crawlers@{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
 
-def input_borderlands_codes(conn: Connection, user: tuple, games: dict):
+
+def input_borderlands_codes(conn: Connection, user, games: dict, pool: BrowserPool = None,
+                            throttle: GearboxThrottle = None, codes: list = None, writes: WriteBuffer = None,
+                            cancel: threading.Event = None) -> dict:
+    """
+    Redeem every valid code the user has not used yet.
+
+    :param pool: browser pool the selenium crawler takes its driver from, a new browser is launched if not set
+    :param throttle: limits shared with the other workers, Gearbox is not throttled if not set
+    :param user: user row, or a dict with the same keys
+    :param codes: the code rows to try, in order, from plan_redemptions. Every valid code the user has
+        not used yet if not set
+    :param writes: where the results go, a WriteBuffer on conn if not set
+    :param cancel: set when the lease on the user's crawl task is lost, LeaseLostError is raised before the
+        next code
+
+    :return: a summary of the run for this user, see new_user_result.
+    """
+    result = new_user_result(user['_id'])
     logged_in_borderlands = False
-    valid_codes = database_controller.get_valid_codes_by_user(conn, user[0])
-    if valid_codes:
-        user = User(**user)
-        crawler = dtc.BorderlandsCrawler(user=user.dict(), headless=False)
+    valid_codes = codes if codes is not None else database_controller.get_valid_codes_by_user(conn, user['_id'])
+    if not valid_codes:
+        return result
+
+    config = get_config()
+    throttle = throttle or GearboxThrottle()
+    user = User(**user)
+    # results are written in batches, and whatever is left when the crawl ends however it ends
+    if writes is None:
+        writes = WriteBuffer(conn, config.WRITE_BUFFER_SIZE)
+    crawler = create_redeemer(user.dict(), pool=pool, throttle=throttle)
+    try:
         for row in valid_codes:
+            if cancel is not None and cancel.is_set():
+                raise LeaseLostError(f'Lost the lease on the crawl task of user {user.id}')
             code = Code(**row)
-            shift_code, code_type = code.code, code.type
+            shift_code = code.code
             user_id, code_id = user.id, code.id
 
             # allow all keys for now, even if supposedly expired, may still be redeemable
             try:
                 # for x in range(2):  # attempt to log in to gearbox site twice
                 if not logged_in_borderlands:
-                    logged_in_borderlands = crawler.login_gearbox()
-            except Exception as e:  # catch exceptions when logging into gearbox website
+                    logged_in_borderlands = gearbox_session.login(conn, crawler)
+            except GearboxLoginError:
+                raise
+            except Exception as e:  # e.g. Gearbox not responding, the task is retried
                 print(f'Exception occurred when logging into gearbox site: {e.args}')
+                raise
 
-            if not logged_in_borderlands:  # if still not logged in teardown and raise exception
-                crawler.tear_down()
-                raise GearboxLoginError()
+            if not logged_in_borderlands:  # the details were rejected, crawler is torn down below
+                raise GearboxLoginError(f'Gearbox rejected the details of user {user.id}')
 
             game, platform = None, None
             try:
-                games_available = crawler.get_games_to_redeem_for_code(shift_code)
+                # The games a code applies to are the same for every account, reuse another user's lookup.
+                code_entered = False
+                games_available = database_controller.select_code_games(conn, shift_code,
+                                                                        config.CODE_GAMES_CACHE_TTL_HOURS)
+                if games_available is None:
+                    games_available = crawler.get_games_to_redeem_for_code(shift_code)
+                    throttle.record_success()
+                    code_entered = True
+                    if games_available:
+                        database_controller.set_code_games(conn, shift_code, games_available)
+
                 if games_available:
                     # Sometimes there can be more than 1 title the code can be redeemed
                     # for (ZFKJ3-TT3BB-JTBJT-T3JJT-JWX9H). Loop through the games and redeem for each one.
-                    for idx, game_available in enumerate(games_available):
-                        game = game_available
-                        try:  # find the platform the user wants to redeem the code for
-                            platform = games[game]
-                        except KeyError:
-                            # if no game is found for user to redeem code, throw exception
-                            raise GameNotFoundException(game)
-
-                        if idx > 0:
+                    user_games = [game_available for game_available in games_available if game_available in games]
+                    if not user_games:
+                        # if no game is found for user to redeem code, throw exception
+                        raise GameNotFoundException(games_available)
+
+                    for game in user_games:
+                        platform = games[game]  # the platform the user wants to redeem the code for
+                        if not code_entered:
                             crawler.input_shift_code(shift_code)  # insert the code into the input box
-                        # redeem the code for that platform
-                        result = crawler.redeem_shift_code(shift_code, game, platform)
-                        if result:
+                        code_entered = False  # redeeming leaves the results page
+                        # redeem the code for that platform, if the account has not reached its quota this run
+                        throttle.take_quota(user.gearbox_email)
+                        redeemed = crawler.redeem_shift_code(shift_code, game, platform)
+                        throttle.record_success()
+                        if redeemed:
                             logging.info(f'Redeemed code {shift_code}')
+                            result['redeemed'] += 1
                             # add row to user_code table showing user_id has used a code
-                            user_code_id = database_controller.create_user_code(conn, user_id, code_id,
-                                                                                game, platform, 1)
-                            if user_code_id:
-                                print(f'User {user_id} has successfully used code {code_id}')
+                            writes.add_user_code(user_id, code_id, game, platform, 1)
+                            print(f'User {user_id} has successfully used code {code_id}')
             except GearboxUnexpectedError as e:
                 logging.debug(f'There was an error with gearbox when redeeming code {code_id}, {shift_code}.')
                 logging.debug(e.args[0])
-                return
+                throttle.record_failure()  # enough of these in a row pauses every worker
+                result['error'] = e.args[0]
+                result['retry'] = True
+                return result
+            except AccountQuotaExceeded as e:
+                logging.info(e.args[0])
+                result['error'] = e.args[0]
+                return result
             except GearboxShiftError as e:
                 logging.debug(f'There was an error with gearbox when redeeming code {code_id}, {shift_code}.')
                 logging.debug(e.args[0])
-                database_controller.set_notify_launch_game(conn, 1, user_id)
-                return
+                writes.set_notify_launch_game(1, user_id)
+                result['error'] = e.args[0]
+                return result
             except PlatformOptionNotFoundException as e:
                 logging.info(str(e))
                 logging.info(f'Code {code_id} cannot be redeemed on {platform}.')
-                database_controller.create_user_code(conn, user_id, code_id,
-                                                     game, platform, 0)
+                result['failed'] += 1
+                writes.add_user_code(user_id, code_id, game, platform, 0)
             except GameNotFoundException:
                 logging.info(f'Code {code_id} cannot be redeemed for user {user_id} as '
                              f'they do not have a platform set to redeem it on.')
@@ -85,19 +152,73 @@ def input_borderlands_codes(conn: Connection, user: tuple, games: dict):
                 # this exception currently handles code exceptions that may require different handling.
             except CodeNotAvailableException as e:
                 print(e.args[0])
-                database_controller.create_user_code(conn, user_id, code_id,
-                                                     game, platform, 0)
+                result['failed'] += 1
+                writes.add_user_code(user_id, code_id, game, platform, 0)
             except ShiftCodeAlreadyRedeemedException:
                 print('This Shift code has already been redeemed.')
-                database_controller.create_user_code(conn, user_id, code_id,
-                                                     game, platform, 1)
+                writes.add_user_code(user_id, code_id, game, platform, 1)
             except (InvalidCodeException, CodeExpiredException):
                 print(f"Shift code {code_id} is no longer valid. Setting to invalid.")
-                database_controller.update_invalid_code(conn, code_id)
+                writes.add_invalid_code(code_id)
+            except LeaseLostError:  # a write was refused, another worker has the task
+                raise
             except Exception as e:
                 print(f'Default Exception: {e}')
+    finally:
+        try:
+            writes.flush()
+        finally:
+            crawler.tear_down()
 
-        crawler.tear_down()
+    return result
+
+
+def create_redeemer(user: dict, pool: BrowserPool = None, backend: str = None, throttle: GearboxThrottle = None):
+    """
+    Return the redemption backend set in config REDEMPTION_BACKEND. Both backends have the same
+    login_gearbox, get_session_cookies, restore_session, get_games_to_redeem_for_code,
+    input_shift_code, redeem_shift_code and tear_down methods and raise the same exceptions.
+    """
+    config = get_config()
+    backend = backend or config.REDEMPTION_BACKEND
+    if backend == 'http':
+        return ShiftClient(user=user, config=config, throttle=throttle)
+    return dtc.BorderlandsCrawler(user=user, headless=False, config=config, pool=pool, throttle=throttle)
+
+
+def new_user_result(user_id: int) -> dict:
+    """Summary reported back to start_crawlers by each worker."""
+    return {'user_id': user_id, 'redeemed': 0, 'failed': 0, 'error': None, 'retry': False}
+
+
+def crawl_user(database: str, user, games: dict, pool: BrowserPool = None,
+               throttle: GearboxThrottle = None, codes: list = None, writes: WriteBuffer = None,
+               cancel: threading.Event = None) -> dict:
+    """
+    Worker entry point. Each worker owns its own SQLite connection (and, through
+    input_borderlands_codes, its own BorderlandsCrawler) so nothing is shared between threads.
+    LeaseLostError is raised, the result of a crawl whose task has been lost is not recorded.
+    """
+    conn = database_controller.create_connection(database)
+    try:
+        return input_borderlands_codes(conn, user, games, pool=pool, throttle=throttle, codes=codes, writes=writes,
+                                       cancel=cancel)
+    except LeaseLostError:
+        raise
+    except GearboxLoginError as e:  # trying again with the same details fails the same way
+        logging.error(f'Crawler for user {user["_id"]} cannot log in: {e!r}')
+        result = new_user_result(user['_id'])
+        result['error'] = repr(e)
+        result['permanent'] = True
+        return result
+    except Exception as e:
+        logging.error(f'Crawler for user {user["_id"]} stopped: {e!r}', exc_info=True)
+        result = new_user_result(user['_id'])
+        result['error'] = repr(e)
+        result['retry'] = True
+        return result
+    finally:
+        conn.close()
 
 
 def setup_logger():
@@ -111,27 +232,205 @@ def setup_tables(conn: Connection):
     Create tables in sqlite database
     """
     if conn is not None:
-        database_controller.create_code_table(conn)
-        database_controller.create_user_table(conn)
-        database_controller.create_user_code_table(conn)
-        database_controller.create_user_game_table(conn)
+        database_controller.create_schema(conn)
     else:
         print("Error! cannot create the database connection.")
 
 
-def start_crawlers(conn: Connection):
-    for user in database_controller.select_all_users_with_gearbox(conn):
+def start_crawlers(conn: Connection, db_file: str = database, workers: int = None) -> list:
+    """
+    Redeem codes for every user with gearbox details in a bounded pool of worker threads. Users are
+    queued in the order of plan_redemptions, users with nothing to redeem are not queued.
+
+    The run and a task per user are recorded in the crawl_run and crawl_task tables. If the process stops
+    before the run finishes, the next call resumes it: finished tasks are skipped and the others are run
+    again, those that were in progress once their lease has expired and after a backoff. See start_crawl_run
+    and run_task.
+
+    :param conn: connection used to read the users, workers open their own to db_file
+    :param db_file: database the workers connect to
+    :param workers: maximum number of users crawled at once, defaults to config CRAWLER_WORKERS
+    :return: the per-user results of the tasks run by this call, in the order they finished
+    """
+    config = get_config()
+    workers = workers or config.CRAWLER_WORKERS
+    results = []
+    # when resuming, the codes redeemed before the restart are no longer in the plan
+    plan = plan_redemptions(conn, config.CODE_GAMES_CACHE_TTL_HOURS)
+    run_id = start_crawl_run(conn, plan, config)
+    users = {user['_id']: user for user in database_controller.select_all_users_with_gearbox(conn)}
+    pool = BrowserPool(size=workers, headless=False, max_uses=config.BROWSER_MAX_USES,
+                       max_memory_mb=config.BROWSER_POOL_MAX_MEMORY_MB)
+    throttle = GearboxThrottle.from_config(config)
+
+    waiting = []  # [task, user, games, codes] until the task is due, see run_task
+    for task in database_controller.select_unfinished_crawl_tasks(conn, run_id):
+        if has_lease(task):  # claimed by a remote worker, see app/crawl_worker.py
+            continue
+        user = users.get(task['user_id'])
+        code_ids = set(json.loads(task['code_ids']))
+        codes = [row for row in plan.get(task['user_id'], []) if row['_id'] in code_ids]
+        if user is None or not codes:
+            database_controller.update_crawl_task(conn, task['_id'], 'done')
+            continue
+
         if user[5] == 1:
             print(f'User {user[1]} cannot enter shift codes until they launch a Borderlands title.'
                   f' Sending notification email.')
 
         user_games = parse_user_games(database_controller.get_user_games(conn, user[0]))
-        thread = threading.Thread(target=input_borderlands_codes,
-                                  name=f"borderlands_input_{user[0]}",
-                                  args=(conn, user, user_games))
-        print(f'{thread.name} starting.')
-        thread.start()
-        thread.join()
+        waiting.append([task, user, user_games, codes])
+        print(f'borderlands_input_{user[0]} queued with {len(codes)} codes.')
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='borderlands_input') as executor:
+            futures = {}
+            while waiting or futures:
+                # tasks waiting out a retry backoff do not hold a worker, they are submitted once due
+                for entry in [entry for entry in waiting if is_due(entry[0])]:
+                    waiting.remove(entry)
+                    futures[executor.submit(run_task, db_file, *entry, pool, throttle)] = entry
+
+                if not futures:  # only tasks waiting out a backoff, wait() would return at once
+                    time.sleep(seconds_until_due(waiting))
+                    continue
+                finished, _ = wait(futures, timeout=seconds_until_due(waiting), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task, user, user_games, codes = futures.pop(future)
+                    result, status = future.result()
+                    if status is None:  # another worker has the task, it reports the result
+                        continue
+                    if status == 'pending':
+                        task = database_controller.select_crawl_task(conn, task['_id'])
+                        logging.info(f'Retrying crawl task {task["_id"]} for user {user[0]} at '
+                                     f'{task["next_attempt"]}: {result["error"]}')
+                        # the codes redeemed by the failed attempt are not tried again
+                        used = {row['code_id'] for row in database_controller.get_user_codes_by_id(conn, user[0])}
+                        waiting.append([task, user, user_games, [row for row in codes if row['_id'] not in used]])
+                        continue
+
+                    print(f'borderlands_input_{result["user_id"]} finished: {result["redeemed"]} redeemed, '
+                          f'{result["failed"]} failed{", error: " + result["error"] if result["error"] else ""}.')
+                    results.append(result)
+    finally:
+        pool.close()
+        # only finishes the run if every task is done or failed, otherwise the next call resumes it
+        database_controller.finish_crawl_run(conn, run_id)
+    return results
+
+
+def start_crawl_run(conn: Connection, plan: dict, config: AppConfig) -> int:
+    """
+    Resume the unfinished run started in the last CRAWL_RUN_RESUME_HOURS, or record a new one with a task
+    per user in the plan from plan_redemptions.
+    Tasks left running on an expired lease are put back to pending with a backoff, as their last attempt may
+    have been cut short by Gearbox rather than by the stop. Tasks with an unexpired lease are left to their
+    worker, which may be another run still going. Those of a stopped run are resumed once their lease expires.
+    :return: the id of the run
+    """
+    run = database_controller.select_unfinished_crawl_run(conn, config.CRAWL_RUN_RESUME_HOURS)
+    if run is None:
+        tasks = [(user_id, json.dumps([row['_id'] for row in codes])) for user_id, codes in plan.items()]
+        run_id = database_controller.create_crawl_run(conn, tasks)
+        print(f'Crawl run {run_id} started with {len(tasks)} tasks.')
+        return run_id
+
+    for task in database_controller.select_unfinished_crawl_tasks(conn, run['_id']):
+        if task['status'] == 'running' and not has_lease(task):
+            database_controller.update_crawl_task(conn, task['_id'], 'pending',
+                                                  retry_seconds=retry_backoff(task['attempts'], config))
+    print(f'Resuming crawl run {run["_id"]} started {run["started"]}.')
+    return run['_id']
+
+
+def publish_crawl_run(conn: Connection) -> int:
+    """
+    Plan a run and record its tasks without crawling them, for crawl workers on other hosts to claim
+    through the crawl task API, see app/crawl_worker.py. An unfinished run is resumed instead.
+    :return: the id of the run
+    """
+    config = get_config()
+    return start_crawl_run(conn, plan_redemptions(conn, config.CODE_GAMES_CACHE_TTL_HOURS), config)
+
+
+def has_lease(task) -> bool:
+    """True if a worker holds an unexpired lease on the task."""
+    return bool(task['lease_expires']) and task['lease_expires'] > datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def is_due(task) -> bool:
+    """True if the task is not waiting for the backoff of a retry."""
+    return not task['next_attempt'] or task['next_attempt'] <= datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def seconds_until_due(tasks: list) -> float:
+    """How long until the first of the [task, ...] entries is due, None if there are none."""
+    next_attempts = [datetime.strptime(task['next_attempt'], '%Y-%m-%d %H:%M:%S') for task, *_ in tasks]
+    if not next_attempts:
+        return None
+    return max((min(next_attempts) - datetime.utcnow()).total_seconds(), 0)
+
+
+def run_task(db_file: str, task, user: tuple, games: dict, codes: list, pool: BrowserPool = None,
+             throttle: GearboxThrottle = None) -> tuple:
+    """
+    Worker entry point for a crawl task. Leases the task as LOCAL_WORKER, as claim_crawl_task does for
+    remote workers, runs crawl_user for the task's user once while a Heartbeat renews the lease and records
+    the result in crawl_task. A result asking for a retry leaves the task pending with a backoff,
+    start_crawlers runs it again once it is due so the worker is free for other users in the meantime.
+    :return: the result and the task's new status, None and None if another worker holds the lease
+    """
+    config = get_config()
+    conn = database_controller.create_connection(db_file)
+    try:
+        attempts = database_controller.start_crawl_task(conn, task['_id'], LOCAL_WORKER,
+                                                        config.CRAWL_TASK_LEASE_SECONDS)
+        if attempts is None:
+            logging.info(f'Crawl task {task["_id"]} was claimed by another worker since it was queued.')
+            return None, None
+
+        renew = functools.partial(renew_lease, db_file, LOCAL_WORKER, config.CRAWL_TASK_LEASE_SECONDS)
+        try:
+            with Heartbeat(renew, task['_id'], config.CRAWL_TASK_LEASE_SECONDS / 3) as heartbeat:
+                result = crawl_user(db_file, user, games, pool, throttle, codes, cancel=heartbeat.lost)
+        except LeaseLostError as e:
+            logging.warning(f'{e}, stopping its crawl.')
+            return None, None
+        return result, record_task_result(conn, task['_id'], attempts, result, config, LOCAL_WORKER)
+    finally:
+        conn.close()
+
+
+def renew_lease(db_file: str, worker: str, lease_seconds: float, task_id: int) -> str:
+    """Renew the worker's lease on a task, for a Heartbeat. Raises LeaseLostError if it no longer holds it."""
+    conn = database_controller.create_connection(db_file)
+    try:
+        lease_expires = database_controller.renew_crawl_task_lease(conn, task_id, worker, lease_seconds)
+    finally:
+        conn.close()
+    if lease_expires is None:
+        raise LeaseLostError(f'Crawl task {task_id} is not leased to {worker}')
+    return lease_expires
+
+
+def plan_redemptions(conn: Connection, max_age_hours: float) -> dict:
+    """
+    The codes to try for each user, from one query over every user and code, see
+    database_controller.select_redemption_work. Pairs that cannot be redeemed, such as codes only for
+    games the user has no platform for, are left out before any browser is started.
+
+    :return: user id -> code rows in the order to try them. Users are in the order of their most urgent code,
+        so users with codes about to expire are queued first.
+    """
+    plan = {}
+    planned = set()
+    for row in database_controller.select_redemption_work(conn, max_age_hours):
+        # a code the user can redeem for several of their games has a row per game
+        if (row['user_id'], row['_id']) not in planned:
+            planned.add((row['user_id'], row['_id']))
+            plan.setdefault(row['user_id'], []).append(row)
+
+    return plan
 
 
 def parse_user_games(user_games: list):
@@ -143,6 +442,14 @@ def parse_user_games(user_games: list):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Redeem the valid codes for every user.')
+    parser.add_argument('--publish', action='store_true',
+                        help='only record the run\'s tasks, for crawl workers to claim')
+    args = parser.parse_args()
+
     setup_logger()
     setup_tables(db_conn)
-    start_crawlers(db_conn)
+    if args.publish:
+        publish_crawl_run(db_conn)
+    else:
+        start_crawlers(db_conn)
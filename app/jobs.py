@@ -0,0 +1,123 @@
+"""
+Background jobs for work too slow to do inside an HTTP request, like logging in to Gearbox.
+
+A JobQueue runs the functions submitted to it on a bounded thread pool and keeps each job's status
+and result so clients can poll for them by job id. Submitting with the key of a job that is still
+pending or running returns that job instead of queueing the same work again. Finished jobs are
+forgotten after ttl_seconds.
+
+Jobs live in the memory of one process. On AWS Lambda the process is frozen between invocations and
+may be thrown away, so a job can stall until the next invocation or be lost, and another instance
+knows nothing of it. Work that has to survive that belongs in a table, like the crawl tasks.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Job(object):
+
+    def __init__(self, key: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue(object):
+
+    def __init__(self, workers: int, ttl_seconds: float = 3600, name: str = 'jobs',
+                 error_message: str = 'Job failed'):
+        self.ttl_seconds = ttl_seconds
+        self.error_message = error_message  # shown to clients instead of the exception, which is logged
+        self.workers = workers
+        self.name = name
+        self._executor = None
+        self._jobs = {}
+        self._active = {}  # key -> job still pending or running
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The worker pool, started again on first use after shutdown."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            return self._executor
+
+    def submit(self, key: str, func, *args) -> Job:
+        """Queue func(*args), or return the unfinished job already queued with the same key."""
+        with self._lock:
+            self._prune()
+            if key in self._active:
+                return self._active[key]
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+
+        try:
+            self.executor.submit(self._run, job, func, args)
+        except RuntimeError:  # the executor has been shut down
+            self._finish(job, FAILED, error=self.error_message)
+        return job
+
+    def get(self, job_id: str):
+        """The job with this id, or None if it is unknown or finished more than ttl_seconds ago."""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, func, args):
+        job.status = RUNNING
+        try:
+            result = func(*args)
+        except Exception as e:
+            logging.error(f'Job {job.id} failed: {e}')
+            self._finish(job, FAILED, error=self.error_message)
+        else:
+            self._finish(job, SUCCEEDED, result=result)
+
+    def _finish(self, job: Job, status: str, result=None, error: str = None):
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.finished = time.monotonic()
+            job.status = status
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _prune(self):
+        expired = time.monotonic() - self.ttl_seconds
+        for job_id in [job.id for job in self._jobs.values() if job.done and job.finished <= expired]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+        """
+        Let the workers exit once the queued jobs have run, waiting for that when wait is set. Jobs
+        submitted afterwards start new workers, under Mangum the app is shut down after every invocation.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,33 @@
+"""
+Fast JSON path for the read endpoints.
+
+The code, user_code and user_game columns already have the names and types of the documented
+schemas, so rows are turned into dicts and encoded straight to bytes instead of being built
+into pydantic models and validated again through response_model. The response_model of a
+route is kept for the OpenAPI docs. orjson is used when it is installed.
+"""
+import json
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, separators=(',', ':'), default=str).encode()
+
+
+def row_dicts(rows, columns: list = None) -> list:
+    """The rows as dicts, only with the given columns if set."""
+    if columns:
+        return [{column: row[column] for column in columns} for row in rows]
+    return [dict(row) for row in rows]
+
+
+def json_response(content, headers: dict = None) -> Response:
+    return Response(content=dumps(content), media_type='application/json', headers=headers)
@@ -1,8 +1,14 @@
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
 
+from app import database_controller
+from app.async_database import close_databases
 from app.config import get_config
-from app.routes import codes, user_codes, user_games, login, account
+from app.errors import InvalidParameterError
+from app.routes import codes, user_codes, user_games, login, account, export, crawl_tasks
+
+database = "borderlands_codes.db"
 
 tags_metadata = [
     {
@@ -24,6 +30,15 @@ origins = [
 ]
 
 
+def setup_database():
+    """Bring the database up to the schema the routes query, e.g. the data_version table and redeemed_at."""
+    conn = database_controller.create_connection(database)
+    try:
+        database_controller.create_schema(conn)
+    finally:
+        conn.close()
+
+
 def get_app():
     config = get_config()
 
@@ -43,11 +58,25 @@ def get_app():
         allow_headers=["*"],
     )
 
+    @app.exception_handler(InvalidParameterError)
+    def invalid_parameter_handler(request, exc: InvalidParameterError):
+        return JSONResponse(status_code=422, content=exc.response().dict())
+
     app.include_router(codes.router)
+    app.include_router(export.router)
     app.include_router(user_codes.router)
     app.include_router(user_games.router)
     app.include_router(login.router)
     app.include_router(account.router)
+    app.include_router(crawl_tasks.router)
+
+    app.add_event_handler("startup", setup_database)
+    # Mangum runs the startup and shutdown handlers on every invocation, the pool is reopened each time
+    app.add_event_handler("startup", account.browser_pool.open)
+    app.add_event_handler("shutdown", lambda: account.verify_jobs.shutdown(wait=False))
+    app.add_event_handler("shutdown", account.browser_pool.close)
+    app.add_event_handler("shutdown", database_controller.close_pools)
+    app.add_event_handler("shutdown", close_databases)
 
     return app
 
@@ -27,3 +27,85 @@ user_game_id_path = Path(
     title='User Game ID',
     description='The ID of the user game in the database.'
 )
+
+
+game_query = Query(
+    None,
+    title='Game',
+    description='Only return codes for this game.',
+    example='Borderlands 3'
+)
+
+
+platform_query = Query(
+    None,
+    title='Platform',
+    description='Only return codes for this platform.',
+    example='Universal'
+)
+
+
+is_valid_query = Query(
+    None,
+    title='Is valid',
+    description='1 for codes that can still be redeemed, 0 for codes Gearbox rejected.',
+    ge=0,
+    le=1,
+    example=1
+)
+
+
+expires_after_query = Query(
+    None,
+    title='Expires after',
+    description='Only return codes with a known expiry on or after this UTC time.',
+    example='2022-06-01 00:00:00'
+)
+
+
+expires_before_query = Query(
+    None,
+    title='Expires before',
+    description='Only return codes with a known expiry before this UTC time.',
+    example='2022-07-01 00:00:00'
+)
+
+
+after_query = Query(
+    None,
+    title='After',
+    description='Cursor from the next link of the previous page.'
+)
+
+
+limit_query = Query(
+    100,
+    title='Limit',
+    description='The maximum number of items returned.',
+    ge=1,
+    le=1000
+)
+
+
+fields_query = Query(
+    None,
+    title='Fields',
+    description='Comma separated fields to return for each item.',
+    example='code,game'
+)
+
+
+export_format_query = Query(
+    'ndjson',
+    title='Format',
+    description='ndjson for one JSON object per line, or csv.',
+    regex='^(ndjson|csv)$'
+)
+
+
+export_after_query = Query(
+    None,
+    title='After',
+    description='Only export rows with a greater id, e.g. the last id seen in a previous export.',
+    example=120
+)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -11,6 +13,28 @@ class GearboxFormData(BaseModel):
     gearbox_password: str = Field(..., example='password')
 
 
+class VerifyJob(BaseModel):
+    job_id: str = Field(..., example='3f2a9c1e5b7d4e6f8a0b1c2d3e4f5a6b')
+    status: str = Field(..., example='succeeded')
+    result: bool = Field(None, example=True)
+    error: str = Field(None)
+
+
+class CrawlWorker(BaseModel):
+    worker: str = Field(..., example='raspberrypi-1')
+
+
+class CrawlTaskWrites(CrawlWorker):
+    """Buffered results of a task, see app/write_buffer.py."""
+    user_codes: list[tuple[int, int, Optional[str], Optional[str], int]] = []
+    invalid_code_ids: list[int] = []
+    notify_launch_game: dict[int, int] = {}
+
+
+class CrawlTaskResult(CrawlWorker):
+    result: dict = Field(..., example={'user_id': 1, 'redeemed': 2, 'failed': 0, 'error': None, 'retry': False})
+
+
 class UserGameFormData(BaseModel):
     user_id: int = Field(..., example=1)
     game: str = Field(..., example="Borderlands 3")
@@ -36,6 +60,19 @@ class Code(BaseModel):
     is_valid: int = Field(..., example=1)
 
 
+class PartialCode(BaseModel):
+    """A Code with only the fields asked for with the fields parameter."""
+    id: int = Field(None, example=1, alias="_id")
+    game: str = Field(None, example='Wonderlands')
+    platform: str = Field(None, example='Universal')
+    code: str = Field(None, example='BBF33-TFFWZ-KC3KW-3JJJJ-WCXZR')
+    type: str = Field(None, example='shift')
+    reward: str = Field(None, example='1 skeleton key')
+    time_gathered: str = Field(None, example='2022-06-24 14:41:47')
+    expires: str = Field(None, example='2022-06-30 05:00:01')
+    is_valid: int = Field(None, example=1)
+
+
 class UserGame(BaseModel):
     id: int = Field(..., example=1, alias="_id")
     game: str = Field(..., example='Wonderlands')
@@ -50,6 +87,7 @@ class UserCode(BaseModel):
     user_id: int = Field(..., example=1)
     code_id: int = Field(..., example=110)
     is_redeem_success: int = Field(..., example=1)
+    redeemed_at: str = Field(None, example='2022-06-24 15:02:11')
 
 
 class User(BaseModel):
@@ -76,6 +114,11 @@ class CodeResponse(MinimalResponse):
     data: list[Code] = []
 
 
+class CodePageResponse(MinimalResponse):
+    data: list[PartialCode] = []
+    next: str = None
+
+
 class UserCodeResponse(MinimalResponse):
     data: list[UserCode] = []
 
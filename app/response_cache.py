@@ -0,0 +1,92 @@
+"""
+In-memory cache of serialised API responses.
+
+Responses are keyed by the database's data_version and the request url, so a cached body is
+served until ingestion or the crawler writes to the code or user_code tables. Each response
+carries an ETag built from the same key and a matching If-None-Match gets a 304.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import Request
+from starlette.responses import Response
+
+from app import database_controller
+from app.config import get_config
+from app.json_response import dumps
+
+
+class ResponseCache(object):
+    """LRU of response bodies for one data version, older versions are dropped as soon as a newer one is seen."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, version: int, key: str):
+        with self.lock:
+            if version != self.version:
+                return None
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def set(self, version: int, key: str, body: bytes):
+        with self.lock:
+            if self.version is None or version > self.version:
+                self.version = version
+                self.entries.clear()
+            elif version < self.version:
+                return
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.version = None
+            self.entries.clear()
+
+
+response_cache = ResponseCache(get_config().RESPONSE_CACHE_SIZE)
+
+
+def make_etag(version: int, key: str) -> str:
+    return '"' + hashlib.sha1(f'{version}:{key}'.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags
+
+
+async def cached_response(request: Request, database, build) -> Response:
+    """
+    The response for request, from the cache when the data has not changed since it was built.
+
+    :param database: async database the response is built from, to read its data_version
+    :param build: coroutine function returning the response content when it is not cached
+    """
+    row = await database.fetch_one(database_controller.SELECT_DATA_VERSION)
+    version = row['version'] if row else 0
+
+    key = str(request.url)
+    etag = make_etag(version, key)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(version, key)
+    if body is None:
+        body = dumps(await build())
+        response_cache.set(version, key, body)
+
+    return Response(content=body, media_type='application/json', headers=headers)
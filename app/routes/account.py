@@ -1,14 +1,26 @@
+import hashlib
+import hmac
 import logging
 from fastapi import APIRouter, Request, Depends
 from fastapi.exceptions import HTTPException
-from app import database_controller
+from app import database_controller, gearbox_session
 from app.config import get_config, AppConfig
-from app.models.schemas import GearboxFormData, UserFormData, ErrorResponse
+from app.jobs import JobQueue
+from app.models.schemas import GearboxFormData, UserFormData, ErrorResponse, VerifyJob
 from app.borderlands_crawler import BorderlandsCrawler
+from app.browser_pool import BrowserPool
 from app.util import encrypt
 
 database = "borderlands_codes.db"
-db_conn = database_controller.create_connection(database)
+db_pool = database_controller.get_pool(database)
+
+# Browsers are launched on first use and kept warm between verification requests.
+browser_pool = BrowserPool(size=get_config().VERIFY_BROWSER_POOL_SIZE, max_uses=get_config().BROWSER_MAX_USES,
+                           max_memory_mb=get_config().BROWSER_POOL_MAX_MEMORY_MB)
+
+# Logins run in the background so requests are not held open for the length of a browser session.
+verify_jobs = JobQueue(workers=get_config().VERIFY_WORKERS, ttl_seconds=get_config().VERIFY_JOB_TTL_MINUTES * 60,
+                       name='verify_gearbox', error_message='Error verifying Gearbox account')
 
 
 router = APIRouter()
@@ -17,19 +29,61 @@ router = APIRouter()
 @router.post(
     get_config().BASE_PATH + '/verify_gearbox',
     tags=["account"],
+    status_code=202,
+    response_model=VerifyJob,
     responses={
         422: {"model": ErrorResponse},
     }
 )
 def verify_gearbox(request: Request, gearboxData: GearboxFormData, config: AppConfig = Depends(get_config)):
-    gearboxData.gearbox_password = encrypt(gearboxData.gearbox_password.encode(), config.ENCRYPTION_KEY.encode())
-    crawler = BorderlandsCrawler(user=gearboxData.dict())
-    logged_in_borderlands = crawler.login_gearbox()
-    crawler.tear_down()
+    """Queue a Gearbox login with the details, poll GET /verify_gearbox/{job_id} for the result."""
+    user = gearboxData.dict()
+    user['gearbox_password'] = encrypt(gearboxData.gearbox_password.encode(), config.ENCRYPTION_KEY.encode()).decode()
+    # a second request with the same details while they are still being checked gets the job already queued
+    job = verify_jobs.submit(verify_job_key(gearboxData, config), verify_credentials, user)
+    return job.to_dict()
+
+
+@router.get(
+    get_config().BASE_PATH + '/verify_gearbox/{job_id}',
+    tags=["account"],
+    response_model=VerifyJob,
+    responses={
+        404: {"description": "No verification job with this id, or it finished too long ago"},
+    }
+)
+def get_verify_gearbox(request: Request, job_id: str):
+    job = verify_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Verification job {job_id} not found")
+    return job.to_dict()
+
 
-    if logged_in_borderlands:
-        return True
-    return False
+def verify_job_key(gearboxData: GearboxFormData, config: AppConfig) -> str:
+    """
+    The email with a keyed hash of the password, so a retry with a corrected password is checked
+    rather than given the result for the old one. The password itself is never held as the key.
+    """
+    password_hash = hmac.new(config.ENCRYPTION_KEY.encode(), gearboxData.gearbox_password.encode(),
+                             hashlib.sha256).hexdigest()
+    return f'{gearboxData.gearbox_email.lower()}:{password_hash}'
+
+
+def verify_credentials(user: dict) -> bool:
+    """Log in to Gearbox with a pooled browser, True if the details were correct."""
+    crawler = BorderlandsCrawler(user=user, pool=browser_pool)
+    try:
+        # always submit the form to check the password, the session it starts is kept for the next crawl
+        logged_in = bool(crawler.login_gearbox())
+        if logged_in:
+            try:
+                with db_pool.connection() as db_conn:
+                    gearbox_session.save_session(db_conn, user['gearbox_email'], crawler.get_session_cookies())
+            except Exception as e:
+                logging.warning(f"Could not save Gearbox session for {user['gearbox_email']}: {e!r}")
+        return logged_in
+    finally:
+        crawler.tear_down()  # hands the browser back to the pool
 
 
 @router.post(
@@ -47,7 +101,8 @@ def register(request: Request, formData: UserFormData, config: AppConfig = Depen
         if formData.gearbox_password:
             formData.gearbox_password = encrypt(formData.gearbox_password.encode(), config.ENCRYPTION_KEY.encode())
 
-        user_id = database_controller.create_user(db_conn, formData.dict())
+        with db_pool.connection() as db_conn:
+            user_id = database_controller.create_user(db_conn, formData.dict())
         if not user_id:
             raise Exception
     except Exception as e:
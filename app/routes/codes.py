@@ -1,35 +1,62 @@
+import base64
+import json
 import logging
 
 from fastapi import APIRouter, Request
 from fastapi.exceptions import HTTPException
 
-from app import database_controller
+from app.async_database import get_database
 from app.config import get_config
 from app.errors import InvalidParameterError
-from app.models.queries import code_query
-from app.models.schemas import Code, CodeResponse, ErrorResponse
+from app.models.queries import code_query, game_query, platform_query, is_valid_query, expires_after_query, \
+    expires_before_query, after_query, limit_query, fields_query
+from app.json_response import row_dicts
+from app.models.schemas import CodePageResponse, ErrorResponse
+from app.response_cache import cached_response
 
 database = "borderlands_codes.db"
-db_conn = database_controller.create_connection(database)
+async_db = get_database(database)
 
 PARAM_FILTERS = dict(
-    code="AND CODE = :code",
+    code="AND code = :code",
+    game="AND game = :game",
+    platform="AND platform = :platform",
+    is_valid="AND is_valid = :is_valid",
+    expires_after="AND expires >= :expires_after AND expires <> 'Unknown'",
+    expires_before="AND expires < :expires_before",
+    # keyset pagination, rows after the last one of the previous page in ORDER BY COALESCE(game, '') DESC, _id DESC.
+    # A NULL game sorts as '' as a row value comparison with NULL is never true, which would leave those rows out
+    # of every page. The second comparison lets SQLite seek idx_code_game_page to the cursor.
+    after="AND (COALESCE(game, ''), _id) < (:after_game, :after_id) AND COALESCE(game, '') <= :after_game",
 )
 
+# with a game filter the game is the same on every row, so the pages are in _id order on idx_code_game
+GAME_PAGE_FILTER = "AND _id < :after_id"
+
+# fields that can be asked for, the id is the _id column
+CODE_FIELDS = {'id': '_id', '_id': '_id', 'game': 'game', 'platform': 'platform', 'code': 'code', 'type': 'type',
+               'reward': 'reward', 'time_gathered': 'time_gathered', 'expires': 'expires', 'is_valid': 'is_valid'}
+
 router = APIRouter()
 
 
 @router.get(
     get_config().BASE_PATH + '/codes',
     tags=["code"],
-    response_model=CodeResponse,
+    response_model=CodePageResponse,
+    response_model_exclude_unset=True,
     responses={
+        304: {"description": "Not modified since the ETag sent in If-None-Match"},
         422: {"model": ErrorResponse},
     }
 )
-def get_codes(request: Request, code: str = code_query):
+async def get_codes(request: Request, code: str = code_query, game: str = game_query,
+                    platform: str = platform_query, is_valid: int = is_valid_query,
+                    expires_after: str = expires_after_query, expires_before: str = expires_before_query,
+                    after: str = after_query, limit: int = limit_query, fields: str = fields_query):
     # Validate inputs
-    valid_params = {"code"}
+    valid_params = {"code", "game", "platform", "is_valid", "expires_after", "expires_before", "after", "limit",
+                    "fields"}
     request_params = set(request.query_params.keys())
     bad_params = request_params - valid_params
     if bad_params:
@@ -37,27 +64,42 @@ def get_codes(request: Request, code: str = code_query):
 
     # Collect parameters used in this request
     request_params = {}
-    for param_name in valid_params:
+    for param_name in valid_params - {"after", "fields"}:
         if locals()[param_name] is not None:
             request_params[param_name] = locals()[param_name]
 
+    try:
+        columns = prepare_columns(fields)
+    except ValueError:
+        raise InvalidParameterError(request=request, params=['fields'], msg='unknown field')
+    if after is not None:
+        try:
+            request_params['after_game'], request_params['after_id'] = decode_cursor(after)
+        except ValueError:
+            raise InvalidParameterError(request=request, params=['after'], msg='invalid cursor')
+
+    return await cached_response(request, async_db,
+                                 lambda: build_response(request, request_params, columns, limit))
+
+
+async def build_response(request: Request, request_params: dict, columns: list, limit: int) -> dict:
     # Query database
     try:
-        rows = query_database(request_params)
+        rows = await query_database(request_params, columns)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
 
     # Parse results
     try:
-        data = parse_results(rows)
+        data, next_cursor = parse_results(rows, limit, columns)
     except Exception as e:  # noqa
         logging.error(e)
         raise HTTPException(status_code=500, detail="Parsing error")
 
     # Prepare response
     try:
-        response = prepare_response(request, data)
+        response = prepare_response(request, data, next_cursor)
     except Exception as e:  # noqa
         logging.error(e)
         raise HTTPException(status_code=500, detail="Response preparation error")
@@ -65,43 +107,87 @@ def get_codes(request: Request, code: str = code_query):
     return response
 
 
-def prepare_select_codes_query(params: list) -> str:
+def prepare_columns(fields: str = None) -> list:
+    """Columns for the fields parameter, all columns if it is not set. Raises ValueError for unknown fields."""
+    if not fields:
+        return list(dict.fromkeys(CODE_FIELDS.values()))
+
+    names = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = set(names) - CODE_FIELDS.keys()
+    if unknown:
+        raise ValueError(f'Unknown fields {unknown}')
+    return list(dict.fromkeys(CODE_FIELDS[name] for name in names))
+
+
+def encode_cursor(row) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row['game'] or '', row['_id']]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        game, code_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(f'Invalid cursor {cursor}')
+    if not isinstance(game, str) or not isinstance(code_id, int):
+        raise ValueError(f'Invalid cursor {cursor}')
+
+    return game, code_id
+
+
+def prepare_select_codes_query(params: list, columns: list = None) -> str:
     filters = {}
     for filter_name in PARAM_FILTERS:
-        if filter_name in params:
+        param_name = 'after_id' if filter_name == 'after' else filter_name
+        if param_name in params:
             filters[filter_name] = PARAM_FILTERS[filter_name]
         else:
             filters[filter_name] = ''
 
-    template = """SELECT * FROM code
+    order_by = "COALESCE(game, '') DESC, _id DESC"
+    if 'game' in params:
+        order_by = '_id DESC'
+        if filters['after']:
+            filters['after'] = GAME_PAGE_FILTER
+
+    # the cursor is taken from the game and _id of the last row, so they are always selected
+    columns = list(dict.fromkeys(['_id', 'game'] + columns)) if columns else ['*']
+
+    template = """SELECT {columns} FROM code
                     WHERE 1 = 1
                     {code}
-                    ORDER BY game DESC
+                    {game}
+                    {platform}
+                    {is_valid}
+                    {expires_after}
+                    {expires_before}
+                    {after}
+                    ORDER BY {order_by}
+                    LIMIT :limit + 1
     """
 
-    return template.format(**filters)
+    return template.format(columns=', '.join(columns), order_by=order_by, **filters)
 
 
-def query_database(request_params):
+async def query_database(request_params, columns: list = None):
     """Query database and return rows."""
-    sql = prepare_select_codes_query(request_params.keys())
-    rows = database_controller.execute_sql(db_conn, sql=sql, params=request_params)
-
-    return rows
+    sql = prepare_select_codes_query(request_params.keys(), columns)
+    return await async_db.fetch_all(sql, params=request_params)
 
 
-def parse_results(rows):
-    """Parse rows into schema objects and get total rows"""
-    return [Code(**row) for row in rows]
+def parse_results(rows, limit: int, columns: list):
+    """Parse rows into PartialCode dicts, with the cursor of the next page if there is one"""
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return row_dicts(rows[:limit], columns), next_cursor
 
 
-def prepare_response(request, data):
-    """Package the data into a Response schema object"""
+def prepare_response(request, data, next_cursor: str = None) -> dict:
+    """Package the data as a CodePageResponse"""
     response_data = {
         'msg': f'{len(data)} items returned',
         'type': 'success',
         'self': str(request.url),
         'data': data,
+        'next': str(request.url.include_query_params(after=next_cursor)) if next_cursor else None,
     }
 
-    return CodeResponse(**response_data)
+    return response_data
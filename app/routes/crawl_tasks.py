@@ -0,0 +1,132 @@
+"""
+Crawl task API for workers on other hosts, see app/crawl_worker.py.
+
+A worker claims a task, which leases it for CRAWL_TASK_LEASE_SECONDS, heartbeats to renew the lease
+while it crawls, sends its buffered results to writes and reports the outcome to complete. A task whose
+lease runs out is claimed again by the next worker to ask. Every route needs the CRAWL_WORKER_TOKEN
+as a bearer token.
+"""
+import json
+import logging
+import secrets
+
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.exceptions import HTTPException
+
+from app import database_controller
+from app.config import get_config, AppConfig
+from app.crawl_tasks import record_task_result, task_payload
+from app.models.schemas import CrawlTaskResult, CrawlTaskWrites, CrawlWorker, ErrorResponse
+
+database = "borderlands_codes.db"
+db_pool = database_controller.get_pool(database)
+
+router = APIRouter()
+
+
+def verify_worker_token(authorization: str = Header(None), config: AppConfig = Depends(get_config)):
+    if not config.CRAWL_WORKER_TOKEN:
+        raise HTTPException(status_code=503, detail="Crawl task API is not configured")
+    if not secrets.compare_digest(authorization or '', f'Bearer {config.CRAWL_WORKER_TOKEN}'):
+        raise HTTPException(status_code=401, detail="Invalid crawl worker token")
+
+
+@router.post(
+    get_config().BASE_PATH + '/crawl/tasks/claim',
+    tags=["crawl"],
+    dependencies=[Depends(verify_worker_token)],
+    responses={
+        204: {"description": "No task to claim"},
+        422: {"model": ErrorResponse},
+    }
+)
+def claim_task(claim: CrawlWorker, config: AppConfig = Depends(get_config)):
+    with db_pool.connection() as db_conn:
+        while True:
+            task = database_controller.claim_crawl_task(db_conn, claim.worker, config.CRAWL_TASK_LEASE_SECONDS,
+                                                        config.CRAWL_TASK_MAX_ATTEMPTS)
+            if task is None:
+                return Response(status_code=204)
+
+            payload = task_payload(db_conn, task)
+            if payload and payload['codes']:
+                logging.info(f'Crawl task {task["_id"]} leased to {claim.worker}')
+                return payload
+
+            # the user has been removed or has used every code since the run was planned
+            database_controller.update_crawl_task(db_conn, task['_id'], 'done', worker=claim.worker)
+            database_controller.finish_crawl_run(db_conn, task['run_id'])
+
+
+@router.post(
+    get_config().BASE_PATH + '/crawl/tasks/{task_id}/heartbeat',
+    tags=["crawl"],
+    dependencies=[Depends(verify_worker_token)],
+    responses={
+        409: {"description": "The worker no longer holds the task's lease"},
+        422: {"model": ErrorResponse},
+    }
+)
+def heartbeat(task_id: int, claim: CrawlWorker, config: AppConfig = Depends(get_config)):
+    with db_pool.connection() as db_conn:
+        lease_expires = database_controller.renew_crawl_task_lease(db_conn, task_id, claim.worker,
+                                                                   config.CRAWL_TASK_LEASE_SECONDS)
+    if lease_expires is None:
+        raise HTTPException(status_code=409, detail=f"Crawl task {task_id} is not leased to {claim.worker}")
+
+    return {'task_id': task_id, 'lease_expires': lease_expires}
+
+
+@router.post(
+    get_config().BASE_PATH + '/crawl/tasks/{task_id}/writes',
+    tags=["crawl"],
+    dependencies=[Depends(verify_worker_token)],
+    responses={
+        403: {"description": "The writes are for another user or codes outside the task"},
+        409: {"description": "The worker no longer holds the task's lease"},
+        422: {"model": ErrorResponse},
+    }
+)
+def write_results(task_id: int, writes: CrawlTaskWrites):
+    with db_pool.connection() as db_conn:
+        task = get_leased_task(db_conn, task_id, writes.worker)
+        code_ids = set(json.loads(task['code_ids']))
+        if any(user_id != task['user_id'] or code_id not in code_ids for user_id, code_id, *_ in writes.user_codes) \
+                or not code_ids.issuperset(writes.invalid_code_ids) \
+                or any(user_id != task['user_id'] for user_id in writes.notify_launch_game):
+            raise HTTPException(status_code=403, detail=f"Writes are not for crawl task {task_id}")
+
+        created = database_controller.write_crawl_results(db_conn, writes.user_codes, writes.invalid_code_ids,
+                                                          writes.notify_launch_game)
+
+    return {'task_id': task_id, 'created': created}
+
+
+@router.post(
+    get_config().BASE_PATH + '/crawl/tasks/{task_id}/complete',
+    tags=["crawl"],
+    dependencies=[Depends(verify_worker_token)],
+    responses={
+        409: {"description": "The worker no longer holds the task's lease"},
+        422: {"model": ErrorResponse},
+    }
+)
+def complete_task(task_id: int, report: CrawlTaskResult, config: AppConfig = Depends(get_config)):
+    with db_pool.connection() as db_conn:
+        task = get_leased_task(db_conn, task_id, report.worker)
+        status = record_task_result(db_conn, task_id, task['attempts'], report.result, config, report.worker)
+        if status is None:
+            raise HTTPException(status_code=409, detail=f"Crawl task {task_id} is not leased to {report.worker}")
+        database_controller.finish_crawl_run(db_conn, task['run_id'])
+
+    return {'task_id': task_id, 'status': status}
+
+
+def get_leased_task(db_conn, task_id: int, worker: str):
+    task = database_controller.select_crawl_task(db_conn, task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"Crawl task {task_id} not found")
+    if task['status'] != 'running' or task['lease_owner'] != worker:
+        raise HTTPException(status_code=409, detail=f"Crawl task {task_id} is not leased to {worker}")
+
+    return task
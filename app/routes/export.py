@@ -0,0 +1,113 @@
+import csv
+import io
+
+from fastapi import APIRouter, Request
+from starlette.responses import StreamingResponse
+
+from app import database_controller
+from app.config import get_config
+from app.errors import InvalidParameterError
+from app.json_response import dumps
+from app.models.queries import export_format_query, export_after_query, user_id_path
+from app.models.schemas import ErrorResponse
+
+database = "borderlands_codes.db"
+
+EXPORT_BATCH_SIZE = 500
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+router = APIRouter()
+
+
+@router.get(
+    get_config().BASE_PATH + '/codes/export',
+    tags=["code"],
+    responses={
+        200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()},
+              "description": "Every code, in the order they were added"},
+        422: {"model": ErrorResponse},
+    }
+)
+def export_codes(request: Request, format: str = export_format_query, after: int = export_after_query):
+    validate_params(request, {"format", "after"})
+    sql = prepare_export_codes(after is not None)
+    return stream_response(sql, {'after': after}, format, 'codes')
+
+
+@router.get(
+    get_config().BASE_PATH + '/user/{user_id}/codes/export',
+    tags=["code"],
+    responses={
+        200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()},
+              "description": "The user's redemption history, in the order the codes were redeemed"},
+        422: {"model": ErrorResponse},
+    }
+)
+def export_user_codes(request: Request, user_id: int = user_id_path, format: str = export_format_query,
+                      after: int = export_after_query):
+    validate_params(request, {"format", "after"})
+    sql = prepare_export_user_codes(after is not None)
+    return stream_response(sql, {'user_id': user_id, 'after': after}, format, f'user_{user_id}_codes')
+
+
+def validate_params(request: Request, valid_params: set):
+    bad_params = set(request.query_params.keys()) - valid_params
+    if bad_params:
+        raise InvalidParameterError(request=request, params=bad_params)
+
+
+def prepare_export_codes(after: bool) -> str:
+    # Rows are read in _id order, the rowid, so no sort is needed however large the table. A sync resumes
+    # after the last _id it saw, times are no cursor as archive codes have 'Unknown' and times repeat.
+    return f"""SELECT * FROM code
+                {'WHERE _id > :after' if after else ''}
+                ORDER BY _id"""
+
+
+def prepare_export_user_codes(after: bool) -> str:
+    # _id order comes from idx_user_code_user, which ends in the rowid
+    return f"""SELECT uc._id, uc.code_id, c.code, uc.user_id, uc.game, uc.platform, uc.is_redeem_success,
+                      uc.redeemed_at
+                FROM user_code uc JOIN code c ON c._id = uc.code_id
+                WHERE uc.user_id = :user_id {'AND uc._id > :after' if after else ''}
+                ORDER BY uc._id"""
+
+
+def stream_response(sql: str, params: dict, export_format: str, filename: str) -> StreamingResponse:
+    render = render_csv if export_format == 'csv' else render_ndjson
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'}
+    return StreamingResponse(stream_rows(sql, params, render), media_type=MEDIA_TYPES[export_format],
+                             headers=headers)
+
+
+def stream_rows(sql: str, params: dict, render):
+    """
+    Rendered batches of the query's rows, read from a cursor as the response is sent. The export has a
+    connection of its own, a slow client would otherwise hold one of the pool's for the whole download.
+    """
+    db_conn = database_controller.create_connection(database)
+    try:
+        cur = db_conn.execute(sql, params)
+        # the header comes from the cursor, a CSV export that matches no rows still has one
+        yield render([], [column[0] for column in cur.description])
+        for rows in database_controller.fetch_batches(cur, batch_size=EXPORT_BATCH_SIZE):
+            yield render(rows)
+    finally:
+        db_conn.close()
+
+
+def render_ndjson(rows, columns: list = None) -> bytes:
+    return b''.join(dumps(dict(row)) + b'\n' for row in rows)
+
+
+def render_csv(rows, columns: list = None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if columns:
+        writer.writerow(columns)
+    writer.writerows(tuple(row) for row in rows)
+    return buffer.getvalue()
@@ -15,7 +15,7 @@ from app.models.schemas import Token, User
 from app.util import decrypt
 
 database = "borderlands_codes.db"
-db_conn = database_controller.create_connection(database)
+db_pool = database_controller.get_pool(database)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 SECRET_KEY = "super_secret"
@@ -60,7 +60,8 @@ def authenticate_user(login_email: str, login_password: str):
 def get_user_by_email(login_email: str):
     # Query database
     try:
-        rows = database_controller.select_user_by_email(db_conn, login_email)
+        with db_pool.connection() as db_conn:
+            rows = database_controller.select_user_by_email(db_conn, login_email)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
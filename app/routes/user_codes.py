@@ -3,13 +3,15 @@ import logging
 from fastapi import APIRouter, Request
 from fastapi.exceptions import HTTPException
 
-from app import database_controller
+from app.async_database import get_database
 from app.config import get_config
 from app.models.queries import user_id_path
-from app.models.schemas import Code, CodeResponse, ErrorResponse
+from app.json_response import row_dicts
+from app.models.schemas import CodeResponse, ErrorResponse
+from app.response_cache import cached_response
 
 database = "borderlands_codes.db"
-db_conn = database_controller.create_connection(database)
+async_db = get_database(database)
 
 router = APIRouter()
 
@@ -19,13 +21,18 @@ router = APIRouter()
     tags=["code"],
     response_model=CodeResponse,
     responses={
+        304: {"description": "Not modified since the ETag sent in If-None-Match"},
         422: {"model": ErrorResponse},
     }
 )
-def get_user_codes(request: Request, user_id: int = user_id_path):
+async def get_user_codes(request: Request, user_id: int = user_id_path):
+    return await cached_response(request, async_db, lambda: build_response(request, user_id))
+
+
+async def build_response(request: Request, user_id: int) -> dict:
     # Query database
     try:
-        rows = query_database(user_id)
+        rows = await query_database(user_id)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
@@ -48,25 +55,26 @@ def get_user_codes(request: Request, user_id: int = user_id_path):
 
 
 def prepare_get_successful_codes():
-    return """SELECT * FROM code WHERE _id IN (
-                SELECT code_id FROM user_code WHERE user_id = :user_id AND is_redeem_success = 1
-            )
-            ORDER BY game DESC"""
+    # a code has a user_code row per game it was redeemed for, make the ids distinct before joining
+    return """SELECT c.* FROM code c JOIN (
+                SELECT DISTINCT code_id FROM user_code WHERE user_id = :user_id AND is_redeem_success = 1
+            ) uc ON c._id = uc.code_id
+            ORDER BY c.game DESC"""
 
 
-def query_database(user_id: int):
+async def query_database(user_id: int):
     """Query database and return rows."""
     sql = prepare_get_successful_codes()
-    return database_controller.execute_sql(db_conn, sql, params={'user_id': user_id})
+    return await async_db.fetch_all(sql, params={'user_id': user_id})
 
 
 def parse_results(rows):
-    """Parse rows into schema objects and get total rows"""
-    return [Code(**row) for row in rows]
+    """Parse rows into Code dicts"""
+    return row_dicts(rows)
 
 
-def prepare_response(request, data):
-    """Package the data into a Response schema object"""
+def prepare_response(request, data) -> dict:
+    """Package the data as a CodeResponse"""
     response_data = {
         'msg': f'{len(data)} items returned',
         'type': 'success',
@@ -74,4 +82,4 @@ def prepare_response(request, data):
         'data': data,
     }
 
-    return CodeResponse(**response_data)
+    return response_data
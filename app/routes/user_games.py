@@ -4,12 +4,15 @@ from fastapi import APIRouter, Request
 from fastapi.exceptions import HTTPException
 
 from app import database_controller
+from app.async_database import get_database
 from app.config import get_config
 from app.models.queries import user_id_path, user_game_id_path
+from app.json_response import json_response, row_dicts
 from app.models.schemas import UserGame, UserGameResponse, ErrorResponse, UserGameFormData
 
 database = "borderlands_codes.db"
-db_conn = database_controller.create_connection(database)
+db_pool = database_controller.get_pool(database)
+async_db = get_database(database)
 
 router = APIRouter()
 
@@ -22,11 +25,11 @@ router = APIRouter()
         422: {"model": ErrorResponse},
     }
 )
-def get_user_games(request: Request, user_id: int = user_id_path):
+async def get_user_games(request: Request, user_id: int = user_id_path):
     # Query database
     try:
         sql = prepare_get_user_games()
-        rows = query_database(sql, user_id)
+        rows = await query_database(sql, user_id)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
@@ -45,7 +48,7 @@ def get_user_games(request: Request, user_id: int = user_id_path):
         logging.error(e)
         raise HTTPException(status_code=500, detail="Response preparation error")
 
-    return response
+    return json_response(response)
 
 
 @router.post(
@@ -58,8 +61,9 @@ def get_user_games(request: Request, user_id: int = user_id_path):
 def create_user_game(form_data: UserGameFormData):
     # Query database
     try:
-        row_id = database_controller.create_user_game(db_conn, user_id=form_data.user_id,
-                                                      game=form_data.game, platform=form_data.platform)
+        with db_pool.connection() as db_conn:
+            row_id = database_controller.create_user_game(db_conn, user_id=form_data.user_id,
+                                                          game=form_data.game, platform=form_data.platform)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
@@ -83,7 +87,8 @@ def create_user_game(form_data: UserGameFormData):
 def delete_user_game(user_game_id: int = user_game_id_path):
     # Query database
     try:
-        database_controller.delete_user_game(db_conn, user_game_id=user_game_id)
+        with db_pool.connection() as db_conn:
+            database_controller.delete_user_game(db_conn, user_game_id=user_game_id)
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail="Database error")
@@ -95,18 +100,18 @@ def prepare_get_user_games():
     return """SELECT _id, game, platform, user_id FROM user_game WHERE user_id = :user_id"""
 
 
-def query_database(sql: str, user_id: int):
+async def query_database(sql: str, user_id: int):
     """Query database and return rows."""
-    return database_controller.execute_sql(db_conn, sql, params={'user_id': user_id})
+    return await async_db.fetch_all(sql, params={'user_id': user_id})
 
 
 def parse_results(rows):
-    """Parse rows into schema objects and get total rows"""
-    return [UserGame(**row) for row in rows]
+    """Parse rows into UserGame dicts"""
+    return row_dicts(rows)
 
 
-def prepare_response(request, data):
-    """Package the data into a Response schema object"""
+def prepare_response(request, data) -> dict:
+    """Package the data as a UserGameResponse"""
     response_data = {
         'msg': f'{len(data)} items returned',
         'type': 'success',
@@ -114,4 +119,4 @@ def prepare_response(request, data):
         'data': data,
     }
 
-    return UserGameResponse(**response_data)
+    return response_data
@@ -0,0 +1,215 @@
+"""
+HTTP-only SHiFT redemption backend.
+
+Performs the same login, code check and redeem sequence as BorderlandsCrawler with a
+requests session instead of a browser, and raises the same exceptions so
+input_borderlands_codes can use either.
+"""
+import logging
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.borderlands_crawler import GAME_CODES, PlatformOptionNotFoundException, InvalidCodeException, \
+    GearboxLoginError, check_page_errors
+from app.browser_pool import random_user_agent
+from app.config import get_config, AppConfig
+from app.throttle import GearboxThrottle
+from app.util import decrypt
+
+# Shared by every client so keep-alive connections to Gearbox are reused across users,
+# cookies still live in each client's own session.
+shared_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+
+
+def create_session() -> requests.Session:
+    session = requests.Session()
+    session.mount('http://', shared_adapter)
+    session.mount('https://', shared_adapter)
+    useragent = random_user_agent()
+    if useragent:
+        session.headers['User-Agent'] = useragent
+
+    return session
+
+
+class GearboxPageParser(HTMLParser):
+    """Collects the parts of a Gearbox page the client needs: CSRF token, game titles, forms and status urls."""
+
+    def __init__(self):
+        super().__init__()
+        self.csrf_token = None
+        self.titles = []
+        self.forms = []
+        self.status_url = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta' and attrs.get('name') == 'csrf-token':
+            self.csrf_token = attrs.get('content')
+        elif tag == 'h2':
+            self._in_title = True
+            self.titles.append('')
+        elif tag == 'form':
+            self.forms.append({'action': attrs.get('action'), 'method': attrs.get('method', 'get'), 'inputs': []})
+        elif tag == 'input' and self.forms:
+            self.forms[-1]['inputs'].append(attrs)
+        elif attrs.get('id') == 'check_redemption_status':
+            self.status_url = attrs.get('data-url')
+
+    def handle_endtag(self, tag):
+        if tag == 'h2':
+            self._in_title = False
+            self.titles[-1] = self.titles[-1].strip()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.titles[-1] += data
+
+
+def parse_page(html: str) -> GearboxPageParser:
+    parser = GearboxPageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+class ShiftClient(object):
+    LOGIN_FAILED_MESSAGE = 'Incorrect email or password.'
+    INVALID_CODE_MESSAGE = 'This is not a valid SHiFT code'
+
+    def __init__(self, user: dict, config: AppConfig = get_config(), base_url: str = None,
+                 session: requests.Session = None, throttle: GearboxThrottle = None):
+        self.user = user
+        self.game_codes = GAME_CODES
+        self.config = config
+        self.base_url = base_url or config.GEARBOX_BASE_URL
+        self.session = session or create_session()
+        self.throttle = throttle or GearboxThrottle()
+        self.csrf_token = None
+        self.titles = []
+        self.redeem_forms = []
+
+    def url(self, path: str) -> str:
+        return urljoin(self.base_url, path)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        self.throttle.before_request()
+        response = self.session.request(method, self.url(path), timeout=self.config.HTTP_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def login_gearbox(self) -> bool:
+        try:
+            user_email = self.user['gearbox_email']
+            user_password = decrypt(self.user['gearbox_password'].encode(),
+                                    self.config.ENCRYPTION_KEY.encode()).decode()
+        except Exception:
+            raise GearboxLoginError('Issue accessing User information.')
+
+        if not (user_email and user_password):
+            raise GearboxLoginError('User information not set.')
+
+        page = parse_page(self.request('GET', '/home').text)
+        if not page.csrf_token:
+            raise GearboxLoginError('Error logging into Gearbox, no CSRF token on login page')
+
+        response = self.request('POST', '/sessions', data={
+            'utf8': '✓',
+            'authenticity_token': page.csrf_token,
+            'user[email]': user_email,
+            'user[password]': user_password,
+            'commit': 'SIGN IN',
+        })
+        return self.check_logged_in(response.text)
+
+    def check_logged_in(self, html: str) -> bool:
+        """Checks page source if login was successful and keeps its CSRF token for later requests"""
+        if self.LOGIN_FAILED_MESSAGE in html:
+            print(f"User details for {self.user['gearbox_email']} are incorrect.")
+            return False
+
+        self.csrf_token = parse_page(html).csrf_token or self.csrf_token
+        return 'Sign Out' in html
+
+    def get_session_cookies(self) -> list:
+        """The session's cookies, in the format selenium uses so either backend can restore them."""
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                 'secure': cookie.secure, 'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+                 'expiry': cookie.expires} for cookie in self.session.cookies]
+
+    def restore_session(self, cookies: list) -> bool:
+        """Load saved cookies and check Gearbox still has them signed in, True if it does."""
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain') or '',
+                                     path=cookie.get('path') or '/', secure=cookie.get('secure', False),
+                                     expires=cookie.get('expiry'))
+        return self.check_logged_in(self.request('GET', '/rewards').text)
+
+    def input_shift_code(self, code: str) -> bool:
+        """Run the code check and keep the redeem forms it returns."""
+        response = self.request('GET', '/entitlement_offer_codes', params={'code': code}, headers={
+            'X-CSRF-Token': self.csrf_token or '',
+            'X-Requested-With': 'XMLHttpRequest',
+        })
+        if self.INVALID_CODE_MESSAGE in response.text:
+            raise InvalidCodeException(f"SHiFT code: {code} is not a valid SHiFT code")
+        check_page_errors(response.text, code, self.user.get('gearbox_email'))
+
+        page = parse_page(response.text)
+        self.titles = page.titles
+        self.redeem_forms = page.forms
+        return True
+
+    def get_games_to_redeem_for_code(self, code: str):
+        """check the code and return the games that the code can be redeemed for"""
+        self.input_shift_code(code)
+        return self.titles or None
+
+    def redeem_shift_code(self, code: str, game: str, platform: str) -> bool:
+        form = self.find_redeem_form(game, platform)
+        if not form:
+            raise PlatformOptionNotFoundException(f'Could not redeem code {code} for '
+                                                  f'{game} on {platform}')
+
+        data = {field['name']: field.get('value', '') for field in form['inputs']
+                if field.get('name') and field.get('type') != 'submit'}
+        response = self.request(form['method'].upper(), form['action'], data=data)
+        page = parse_page(response.text)
+        self.csrf_token = page.csrf_token or self.csrf_token
+
+        result = response.text
+        if page.status_url:
+            result = self.wait_for_redemption(page.status_url)
+        check_page_errors(result, code, self.user.get('gearbox_email'))
+
+        return True
+
+    def find_redeem_form(self, game: str, platform: str):
+        """The form from the last code check with the game's codename and a submit button for the platform."""
+        game_code = self.game_codes[game].lower()
+        for form in self.redeem_forms:
+            values = [field.get('value', '') for field in form['inputs']]
+            buttons = [field.get('value', '') for field in form['inputs'] if field.get('type') == 'submit']
+            if game_code in values and any(platform in button for button in buttons):
+                return form
+
+        return None
+
+    def wait_for_redemption(self, status_url: str) -> str:
+        """Gearbox may queue a redemption, poll its status until it has finished and return the result text."""
+        deadline = time.monotonic() + self.config.CRAWLER_WAIT_TIMEOUT
+        while True:
+            status = self.request('GET', status_url, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+            if not status.get('in_progress') or time.monotonic() > deadline:
+                return status.get('text', '')
+            time.sleep(self.config.CRAWLER_WAIT_POLL)
+
+    def tear_down(self):
+        # The session is not closed as that would also close the shared connection pool.
+        self.session.cookies.clear()
+        logging.debug(f"Cleared Gearbox session for {self.user.get('gearbox_email')}")
@@ -0,0 +1,138 @@
+"""
+Limits on how hard the crawlers push Gearbox.
+
+start_crawlers shares one GearboxThrottle between its workers. It has three parts:
+- a TokenBucket capping Gearbox requests per second across every worker
+- an AccountQuota of redemptions per account per run, to stop before Gearbox asks the account to
+  launch a SHiFT title
+- a CircuitBreaker that pauses every worker for a cooldown after repeated site level errors
+
+Both redemption backends call before_request ahead of each request they send.
+"""
+import logging
+import threading
+import time
+
+
+class AccountQuotaExceeded(Exception):
+    pass
+
+
+class TokenBucket(object):
+    """Allows rate requests per second on average and bursts of up to capacity. A rate of 0 has no limit."""
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until tokens are available and take them. :return: seconds spent waiting"""
+        if not self.rate:
+            return 0
+
+        waited = 0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker(object):
+    """
+    Opens for cooldown seconds after threshold failures in a row. Once the cooldown is over a single
+    failure opens it again, until a success closes it.
+    """
+
+    def __init__(self, threshold: int, cooldown: float, clock=time.monotonic, sleep=time.sleep):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.failures = 0
+        self.opened_until = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.clock() < self.opened_until
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.threshold and self.failures >= self.threshold and not self.is_open:
+                self.opened_until = self.clock() + self.cooldown
+                logging.warning(f'Gearbox failed {self.failures} times in a row, pausing for {self.cooldown}s.')
+
+    def wait(self) -> float:
+        """Block while the breaker is open. :return: seconds spent waiting"""
+        waited = 0
+        while True:
+            with self._lock:
+                remaining = self.opened_until - self.clock()
+            if remaining <= 0:
+                return waited
+            self.sleep(remaining)
+            waited += remaining
+
+
+class AccountQuota(object):
+    """At most limit uses per account. A limit of 0 has no limit."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = {}
+        self._lock = threading.Lock()
+
+    def take(self, account: str) -> bool:
+        """Use one of the account's quota, False if none is left."""
+        with self._lock:
+            if self.limit and self.used.get(account, 0) >= self.limit:
+                return False
+            self.used[account] = self.used.get(account, 0) + 1
+            return True
+
+
+class GearboxThrottle(object):
+    """The limits shared by a run's workers. With the default arguments nothing is limited."""
+
+    def __init__(self, rate: float = 0, burst: float = None, account_quota: int = 0, failure_threshold: int = 0,
+                 cooldown: float = 0):
+        self.bucket = TokenBucket(rate, burst)
+        self.quota = AccountQuota(account_quota)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(rate=config.GEARBOX_REQUESTS_PER_SECOND, burst=config.GEARBOX_REQUEST_BURST,
+                   account_quota=config.GEARBOX_ACCOUNT_QUOTA, failure_threshold=config.GEARBOX_FAILURE_THRESHOLD,
+                   cooldown=config.GEARBOX_FAILURE_COOLDOWN)
+
+    def before_request(self) -> None:
+        self.breaker.wait()
+        self.bucket.acquire()
+
+    def take_quota(self, account: str) -> None:
+        if not self.quota.take(account):
+            raise AccountQuotaExceeded(f'Reached the limit of {self.quota.limit} redemptions this run for {account}')
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+
+    def record_failure(self) -> None:
+        self.breaker.record_failure()
@@ -1,48 +1,77 @@
 """File containing common functions"""
-from datetime import datetime
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
 
-import pytz
 from cryptography.fernet import Fernet
 
 
-#  todo: parse datetime expiration date in tweet. expiration is not always present. Most seem to be in UTC so far.
+MONTHS = {name: number for number, names in enumerate(
+    [('jan', 'january'), ('feb', 'february'), ('mar', 'march'), ('apr', 'april'), ('may', ), ('jun', 'june'),
+     ('jul', 'july'), ('aug', 'august'), ('sep', 'september'), ('oct', 'october'), ('nov', 'november'),
+     ('dec', 'december')], start=1) for name in names}
+
+# datetime does not recognise PST, CST, EST etc., they are looked up here as UTC offsets in minutes.
+TIMEZONES = {
+    'utc': 0, 'gmt': 0, 'z': 0,
+    'pst': -480, 'pdt': -420, 'mst': -420, 'mdt': -360,
+    'cst': -360, 'cdt': -300, 'est': -300, 'edt': -240,
+}
+
+WEEKDAYS = {'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'}
+
+# 11 Jan 14:00 Sunday, 11 Jan 13:00, 11 Jan, 11 JUNE, 2 JUN 07:59 UTC, 20 APR 23:59 -0500,
+# 26 May 2022 17:30:00 -0400
+DATE_PATTERN = re.compile(r"""
+    \s*(?P<day>\d{1,2})\s+(?P<month>[A-Za-z]+)
+    (?:\s+(?P<year>\d{4}))?
+    (?:\s+(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?
+       (?:\s+(?:(?P<offset>[+-]\d{4})|(?P<zone>[A-Za-z]+)))?)?
+    \s*""", re.VERBOSE)
+
+
+def parse_date(str_date: str):
+    """
+    Parse the expiry and archive dates found in tweets and the code archive.
+    :return: naive datetime in UTC, in the current year, or None if the date is not recognised
+    """
+    if not str_date:
+        return None
+    return _parse_date(str_date, datetime.now().year)
+
+
+@lru_cache(maxsize=1024)
+def _parse_date(str_date: str, current_year: int):
+    # the same few expiry strings repeat across a run, the year is part of the key so the cache
+    # does not outlive a new year
+    match = DATE_PATTERN.fullmatch(str_date)
+    if not match:
+        return None
+
+    month = MONTHS.get(match['month'].lower())
+    offset = 0
+    if match['offset']:
+        sign = -1 if match['offset'][0] == '-' else 1
+        offset = sign * (int(match['offset'][1:3]) * 60 + int(match['offset'][3:]))
+    elif match['zone']:
+        zone = match['zone'].lower()
+        if zone not in WEEKDAYS:
+            offset = TIMEZONES.get(zone)
+    if month is None or offset is None:
+        return None
+
+    try:
+        dt = datetime(int(match['year'] or 1900), month, int(match['day']), int(match['hour'] or 0),
+                      int(match['minute'] or 0), int(match['second'] or 0))
+        # convert dt to utc, then it's {CURRENT YEAR}! replace dt year with current year
+        return (dt - timedelta(minutes=offset)).replace(year=current_year)
+    except ValueError:
+        return None
+
+
 def convert_date(str_date: str):
-    if str_date:
-        tzone_dic = {
-            'PST': '-0800', 'PDT': '-0700', 'MST': '-0700',
-            'MDT': '-0600', 'CST': '-0600', 'CDT': '-0500',
-            'EST': '-0500', 'EDT': '-0400',
-        }
-
-        # datetime does not recognise PST, CST, EST etc. for dt formatting using %Z,
-        # instead use dict to replace the tz with UTC offset, %z.
-        if any(tzone in str_date for tzone in tzone_dic.keys()):
-            for key in tzone_dic.keys():
-                if key in str_date:
-                    str_date = str_date.replace(key, tzone_dic[key])
-
-        # 11 Jan 14:00 Sunday, 11 Jan 13:00, 11 Jan, 11 JUNE, 2 JUN 07:59 UTC, 20 APR 23:59 -0500
-        # 26 May 2022 17:30:00 -0400
-        date_patterns = ['%d %b %Y %H:%M %Z', '%d %b %H:%M %A', '%d %b %H:%M', '%d %b', '%d %B',
-                         '%d %b %H:%M %Z', '%d %b %H:%M %z', '%d %b %H:%M %Z', '%d %b %Y %H:%M:%S %z']
-
-        for pattern in date_patterns:
-            try:
-                dt = datetime.strptime(str_date, pattern)
-                if dt.tzinfo:
-                    # convert dt to utc
-                    dt = datetime.strptime(dt.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"),
-                                           "%Y-%m-%d %H:%M:%S")
-                # It's {CURRENT YEAR}! replace dt year (1900) with current year
-                dt = dt.replace(year=datetime.now().year)
-                return dt
-            except ValueError:
-                pass
-            except pytz.UnknownTimeZoneError:
-                print('Unknown timezone')
-                pass
-
-    return "Unknown"
+    """parse_date for values stored in the code table, where a missing date is 'Unknown'."""
+    return parse_date(str_date) or "Unknown"
 
 
 def encrypt(data: bytes, key: bytes) -> bytes:
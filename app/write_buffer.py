@@ -0,0 +1,73 @@
+"""
+Deferred database writes for a crawler.
+
+Writing every redemption result in its own transaction makes concurrent crawlers queue for the
+SQLite write lock once per code. A WriteBuffer collects a user's user_code rows, invalid codes and
+notify_launch_game changes and writes them with database_controller.write_crawl_results in one
+transaction once size items are pending, and when flushed at the end of the user's crawl.
+
+Remote crawl workers have no connection to the database, they give the buffer a write function that
+sends the items to the crawl task API instead.
+"""
+import logging
+from sqlite3 import Connection
+
+from app import database_controller
+
+
+class WriteBuffer(object):
+
+    def __init__(self, conn: Connection = None, size: int = 25, write=None):
+        """
+        :param write: called with the user_codes, invalid_code_ids and notify_launch_game to save and
+            returning the number of user_code rows created, database_controller.write_crawl_results on conn
+            if not set
+        """
+        self.conn = conn
+        self.size = size
+        self.write = write or self._write_to_database
+        self.user_codes = []
+        self.invalid_code_ids = []
+        self.notify_launch_game = {}
+
+    def __len__(self):
+        return len(self.user_codes) + len(self.invalid_code_ids) + len(self.notify_launch_game)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def add_user_code(self, user_id: int, code_id: int, game: str, platform: str, is_success: int) -> None:
+        self.user_codes.append((user_id, code_id, game, platform, is_success))
+        self._flush_if_full()
+
+    def add_invalid_code(self, code_id: int) -> None:
+        self.invalid_code_ids.append(code_id)
+        self._flush_if_full()
+
+    def set_notify_launch_game(self, launch_bool: int, user_id: int) -> None:
+        self.notify_launch_game[user_id] = launch_bool
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self) >= self.size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write everything pending in one transaction. If the write fails the items are kept for the next flush.
+        :return: the number of user_code rows created
+        """
+        if not len(self):
+            return 0
+
+        created = self.write(self.user_codes, self.invalid_code_ids, self.notify_launch_game)
+        logging.debug(f'Wrote {len(self.user_codes)} user codes ({created} new), {len(self.invalid_code_ids)} '
+                      f'invalid codes and {len(self.notify_launch_game)} launch notifications.')
+        self.user_codes, self.invalid_code_ids, self.notify_launch_game = [], [], {}
+        return created
+
+    def _write_to_database(self, user_codes: list, invalid_code_ids: list, notify_launch_game: dict) -> int:
+        return database_controller.write_crawl_results(self.conn, user_codes, invalid_code_ids, notify_launch_game)
@@ -0,0 +1,107 @@
+"""
+Requests/second and latency percentiles of GET /codes under concurrent load, for each async
+database backend and for a sync route on the FastAPI threadpool as the routes were before.
+
+Requests are sent in-process through the ASGI interface, so the numbers cover the app and the
+database access but not the network or a server. Run from the repository root with the app's
+environment variables set:
+    python -m tests.benchmarks.bench_api_load [requests] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+from fastapi import Request
+
+from app import database_controller, async_database
+from app.config import get_config
+from app.input_borderlands_codes import setup_tables
+from app.json_response import json_response, row_dicts
+from app.main import app
+from app.response_cache import response_cache
+from app.routes import codes
+
+BENCH_PATH = get_config().BASE_PATH + '/bench/sync_codes'
+
+
+def create_database(path: str, count: int = 2000):
+    conn = database_controller.create_connection(path)
+    setup_tables(conn)
+    database_controller.create_codes_bulk(conn, [
+        {'game': f'Borderlands {i % 3 + 1}', 'platform': 'Universal', 'code': f'{i:05d}-BBBBB-CCCCC-DDDDD-EEEEE',
+         'type': 'shift', 'reward': '3 Golden Keys', 'time_gathered': datetime.now(), 'expires': 'Unknown'}
+        for i in range(count)])
+    conn.close()
+
+
+def add_sync_route(pool: database_controller.ConnectionPool):
+    """GET /codes without the cache as a sync def route, the way the routes ran before the async layer."""
+    @app.get(BENCH_PATH)
+    def sync_codes(request: Request, limit: int = 100):
+        sql = codes.prepare_select_codes_query(['limit'])
+        with pool.connection() as conn:
+            rows = database_controller.execute_sql(conn, sql, {'limit': limit})
+        return json_response({'data': row_dicts(rows[:limit])})
+
+
+async def run_load(path: str, total: int, concurrency: int) -> list:
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path, params={'limit': 100})
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    return latencies
+
+
+def report(name: str, latencies: list, seconds: float):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f'{name:>20}: {len(latencies) / seconds:8,.0f} req/s  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  '
+          f'mean {statistics.mean(latencies) * 1000:6.2f} ms')
+
+
+def main(total: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        create_database(path)
+
+        add_sync_route(database_controller.ConnectionPool(path))
+        backends = [backend for backend in async_database.BACKENDS
+                    if backend != 'aiosqlite' or async_database.aiosqlite is not None]
+        runs = [('sync def + threadpool', BENCH_PATH, None, 0)]
+        # uncached runs the query on every request, cached is the polling case where only data_version is read
+        runs += [(f'async + {backend}', get_config().BASE_PATH + '/codes', backend, 0) for backend in backends]
+        runs += [(f'cached + {backend}', get_config().BASE_PATH + '/codes', backend, 256) for backend in backends]
+
+        print(f'{total} requests, {concurrency} concurrent')
+        for name, path_url, backend, cache_size in runs:
+            if backend:
+                codes.async_db = async_database.get_database(path, backend)
+            response_cache.clear()
+            response_cache.max_entries = cache_size
+            start = time.perf_counter()
+            latencies = asyncio.run(run_load(path_url, total, concurrency))
+            report(name, latencies, time.perf_counter() - start)
+
+        asyncio.run(async_database.close_databases())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 50)
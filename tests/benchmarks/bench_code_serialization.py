@@ -0,0 +1,49 @@
+"""
+Rows/second of GET /codes serialisation: pydantic models validated twice, as the routes did
+through parse_results and response_model, against rows encoded straight to JSON bytes.
+
+Run from the repository root with the app's environment variables set:
+    python -m tests.benchmarks.bench_code_serialization [rows]
+"""
+import sqlite3
+import sys
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from app.json_response import dumps, row_dicts, orjson
+from app.models.schemas import Code, CodeResponse
+
+
+def code_rows(count: int) -> list:
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE code(_id INTEGER PRIMARY KEY, game TEXT, platform TEXT, code TEXT, type TEXT, '
+                 'reward TEXT, time_gathered TEXT, expires TEXT, is_valid INT)')
+    conn.executemany('INSERT INTO code VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(i, 'Borderlands 3', 'Universal', f'{i:05d}-BBBBB-CCCCC-DDDDD-EEEEE', 'shift',
+                       '3 Golden Keys', '2022-06-24 14:41:47', '2022-06-30 05:00:01', 1) for i in range(count)])
+    return conn.execute('SELECT * FROM code').fetchall()
+
+
+def model_path(rows) -> bytes:
+    data = [Code(**row) for row in rows]
+    response = CodeResponse(msg=f'{len(data)} items returned', type='success', self='http://test/codes', data=data)
+    # what FastAPI does with response_model: validate again, then encode
+    response = CodeResponse(**response.dict(by_alias=True))
+    return dumps(jsonable_encoder(response, by_alias=True))
+
+
+def fast_path(rows) -> bytes:
+    data = row_dicts(rows)
+    return dumps({'msg': f'{len(data)} items returned', 'type': 'success', 'self': 'http://test/codes',
+                  'data': data})
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = code_rows(count)
+    print(f'encoder: {"orjson" if orjson else "json"}, {count} rows')
+    for name, path in (('pydantic models', model_path), ('rows to bytes', fast_path)):
+        seconds = min(timeit.repeat(lambda: path(rows), number=3, repeat=3)) / 3
+        print(f'{name:>15}: {count / seconds:,.0f} rows/s')
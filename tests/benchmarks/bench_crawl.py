@@ -0,0 +1,165 @@
+"""
+Codes/minute, per-phase timings and peak RSS of start_crawlers redeeming M codes for each of N users
+against the local Gearbox stub (tests/gearbox_stub.py), with optional latency and error injection.
+
+Everything start_crawlers does runs as it would against Gearbox: planning, the crawl run and task
+tables, logins, code checks, redemptions and the batched writes. The limits of the shared
+GearboxThrottle are off unless --rate is given, so the numbers are the crawler's own. Run from the
+repository root with the app's environment variables set:
+    python -m tests.benchmarks.bench_crawl [users] [codes] [--backend http] [--workers 4] [--latency 0.05]
+"""
+import argparse
+import contextlib
+import functools
+import io
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from app import database_controller, gearbox_session
+from app import input_borderlands_codes as ibc
+from app.config import get_config
+from app.util import encrypt
+from tests.gearbox_stub import GearboxStub
+
+GEARBOX_PASSWORD = 'bench_password'
+
+
+class PhaseTimer(object):
+    """Wall time of each call to the wrapped functions per phase, from every worker thread."""
+
+    def __init__(self):
+        self.times = defaultdict(list)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def wrap(self, phase: str, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            active = self.local.__dict__.setdefault('phases', set())
+            if phase in active:  # e.g. get_games_to_redeem_for_code calling input_shift_code
+                return func(*args, **kwargs)
+            active.add(phase)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                active.discard(phase)
+                with self.lock:
+                    self.times[phase].append(elapsed)
+
+        return timed
+
+
+def instrument(timer: PhaseTimer) -> None:
+    """Time the phases of a crawl by wrapping the functions start_crawlers reaches them through."""
+    ibc.plan_redemptions = timer.wrap('plan', ibc.plan_redemptions)
+    gearbox_session.login = timer.wrap('login', gearbox_session.login)
+    database_controller.write_crawl_results = timer.wrap('write', database_controller.write_crawl_results)
+    create_redeemer = timer.wrap('start redeemer', ibc.create_redeemer)
+
+    def timed_redeemer(*args, **kwargs):
+        redeemer = create_redeemer(*args, **kwargs)
+        for phase, method in (('code check', 'get_games_to_redeem_for_code'), ('code check', 'input_shift_code'),
+                              ('redeem', 'redeem_shift_code')):
+            setattr(redeemer, method, timer.wrap(phase, getattr(redeemer, method)))
+        return redeemer
+
+    ibc.create_redeemer = timed_redeemer
+
+
+def create_database(path: str, users: int, codes: list):
+    key = get_config().ENCRYPTION_KEY.encode()
+    conn = database_controller.create_connection(path)
+    ibc.setup_tables(conn)
+    database_controller.create_codes_bulk(conn, [
+        {'game': 'Borderlands 3', 'platform': 'Universal', 'code': code, 'type': 'shift', 'reward': '1 Golden Key',
+         'time_gathered': 'Unknown', 'expires': 'Unknown'} for code in codes])
+    for i in range(users):
+        user_id = database_controller.create_user(conn, {
+            'email': f'bench_{i}@example.com',
+            'password': 'password',
+            'gearbox_email': f'bench_gearbox_{i}@example.com',
+            'gearbox_password': encrypt(GEARBOX_PASSWORD.encode(), key).decode(),
+        })
+        database_controller.create_user_game(conn, 'Borderlands 3', 'Steam', user_id)
+    return conn
+
+
+def bench_config(args, stub_url: str):
+    config = get_config()
+    config.REDEMPTION_BACKEND = args.backend
+    config.GEARBOX_BASE_URL = stub_url
+    config.CRAWLER_WORKERS = args.workers
+    config.GEARBOX_REQUESTS_PER_SECOND = args.rate
+    config.GEARBOX_ACCOUNT_QUOTA = 0  # every code is redeemed however many there are
+    # so injected errors do not stall the run for minutes
+    config.GEARBOX_FAILURE_COOLDOWN = 1
+    config.CRAWL_TASK_RETRY_SECONDS = 1
+    return config
+
+
+def report(timer: PhaseTimer):
+    print(f'{"phase":>16} {"calls":>7} {"total s":>9} {"mean ms":>9} {"p95 ms":>9}')
+    for phase in ('plan', 'start redeemer', 'login', 'code check', 'redeem', 'write'):
+        times = sorted(timer.times.get(phase, []))
+        if not times:
+            continue
+        p95 = times[max(int(len(times) * 0.95) - 1, 0)] * 1000
+        print(f'{phase:>16} {len(times):7,} {sum(times):9.2f} {sum(times) / len(times) * 1000:9.2f} {p95:9.2f}')
+
+    # ru_maxrss is in kilobytes on Linux, children only counts finished processes such as closed browsers
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f'peak RSS {peak:.1f} MB, largest child process {children:.1f} MB')
+
+
+def main(args):
+    codes = [f'{i:05d}-BENCH-CRAWL-SHIFT-CODES' for i in range(args.codes)]
+    accounts = {f'bench_gearbox_{i}@example.com': GEARBOX_PASSWORD for i in range(args.users)}
+    stub_codes = {code: {'games': {'Borderlands 3': ['Steam', 'Epic']}} for code in codes}
+    latency = tuple(args.latency) if len(args.latency) > 1 else args.latency[0]
+
+    with tempfile.TemporaryDirectory() as directory, \
+            GearboxStub(accounts, stub_codes, latency=latency, error_rate=args.error_rate, seed=args.seed) as stub:
+        path = os.path.join(directory, 'bench.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            conn = create_database(path, args.users, codes)
+
+        config = bench_config(args, stub.url)
+        ibc.get_config = lambda: config
+        timer = PhaseTimer()
+        instrument(timer)
+
+        print(f'{args.users} users x {args.codes} codes, {args.backend} backend, {args.workers} workers, '
+              f'latency {latency} s, error rate {args.error_rate:.0%}')
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = ibc.start_crawlers(conn, db_file=path, workers=args.workers)
+        seconds = time.perf_counter() - start
+
+        written = conn.execute('SELECT COUNT(*) FROM user_code').fetchone()[0]
+        errors = sum(1 for result in results if result['error'])
+        conn.close()
+
+    print(f'{written:,} codes in {seconds:.2f}s, {written / seconds * 60:,.0f} codes/minute '
+          f'({len(stub.redemptions):,} redemptions, {stub.errors} injected errors, {errors} users ended in error)')
+    report(timer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('users', type=int, nargs='?', default=20)
+    parser.add_argument('codes', type=int, nargs='?', default=25)
+    parser.add_argument('--backend', choices=['http', 'selenium'], default='http')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0],
+                        help='seconds the stub delays each response by, or a min and max')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of code checks and redemptions failing')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=0, help='GearboxThrottle requests per second, 0 for no limit')
+    main(parser.parse_args())
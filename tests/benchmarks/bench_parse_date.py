@@ -0,0 +1,54 @@
+"""
+Dates/second of parse_date against the strptime pattern loop convert_date used before it.
+
+Run from the repository root:
+    python -m tests.benchmarks.bench_parse_date [repeat]
+"""
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from app.util import parse_date, _parse_date
+
+DATES = ['11 Jan 14:00 Sunday', '11 Jan 13:30', '11 Jan', '08 JUNE', '2 JUN 07:59 UTC', '20 APR 23:59 -0500',
+         '20 APR 23:59 PST', '26 May 2022 17:30:00 -0400', '09 Jun 2022 05:00 UTC', '01 SMARCH 23:59']
+
+TIMEZONES = {'PST': '-0800', 'PDT': '-0700', 'MST': '-0700', 'MDT': '-0600', 'CST': '-0600', 'CDT': '-0500',
+             'EST': '-0500', 'EDT': '-0400'}
+PATTERNS = ['%d %b %Y %H:%M %Z', '%d %b %H:%M %A', '%d %b %H:%M', '%d %b', '%d %B', '%d %b %H:%M %Z',
+            '%d %b %H:%M %z', '%d %b %H:%M %Z', '%d %b %Y %H:%M:%S %z']
+
+
+def strptime_loop(str_date: str):
+    """The previous convert_date: try each pattern in turn."""
+    for key, offset in TIMEZONES.items():
+        if key in str_date:
+            str_date = str_date.replace(key, offset)
+    for pattern in PATTERNS:
+        try:
+            dt = datetime.strptime(str_date, pattern)
+            if dt.tzinfo:
+                dt = datetime.strptime(dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                                       "%Y-%m-%d %H:%M:%S")
+            return dt.replace(year=datetime.now().year)
+        except ValueError:
+            pass
+    return None
+
+
+def uncached(str_date: str):
+    _parse_date.cache_clear()
+    return parse_date(str_date)
+
+
+def dates_per_second(parse, repeat: int) -> float:
+    seconds = min(timeit.repeat(lambda: [parse(date) for date in DATES], number=repeat, repeat=5))
+    return len(DATES) * repeat / seconds
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    assert [strptime_loop(date) for date in DATES] == [parse_date(date) for date in DATES]
+    for name, parse in (('strptime loop', strptime_loop), ('parse_date uncached', uncached),
+                        ('parse_date cached', parse_date)):
+        print(f'{name:>19}: {dates_per_second(parse, repeat):,.0f} dates/s')
@@ -0,0 +1,44 @@
+"""
+Tweets/second of parse_tweet_codes against the per-field get_* functions it replaced, which compiled
+and searched a regex per field.
+
+Run from the repository root with the app's environment variables set:
+    python -m tests.benchmarks.bench_tweet_parser [repeat]
+"""
+import re
+import sys
+import timeit
+
+from app.get_codes_twitter import parse_tweet_codes
+from app.util import convert_date
+from tests.unit.test_twitter_scraper import test_tweet_data
+
+CORPUS = test_tweet_data + [
+    'SHIFT CODE (Classic)\nGame: BORDERLANDS 2\nReward: 5 Gold Keys\nExpires: 26 MAY 03:59 UTC\n\n'
+    'PC: K353B-CXTBW-FXBFK-JBJJJ-BSXWJ\nXB: CT5TT-BFK95-9ZX6Z-C6JTB-K3STZ\nPS: CBK3J-6RS9S-SBWZW-ZTKJ3-CBR3H\n'
+    'Redeem: https://shift.gearboxsoftware.com/rewards',
+    'SHIFT CODE (Classic)\nGame: BORDERLANDS: PRE-SEQUEL\nReward: 5 Gold Keys\n\nUniversal (Twitter)\n'
+    'CWK33-5J5C6-69BXJ-3TB3B-C5SF6\nUniversal (Facebook)\nKKK3J-T35K6-FZB6T-JBJJ3-JSFKK\n'
+    'Redeem: https://shift.gearboxsoftware.com/rewards',
+]
+
+
+def parse_per_field(text: str):
+    """The get_* functions as they were before parse_tweet_codes, a regex compiled and searched per field."""
+    reward = re.search(re.compile(r'Reward: (.*?(?=\n{1,}))'), text)
+    game = re.search(re.compile(r'Game: (WONDERLANDS|BORDERLANDS:?\s([2-3]|[A-Z]+-[A-Z]+))'), text)
+    code = re.search(re.compile(r'[Xbox:\s]?(([A-Z\d]{5}-){4}[A-Z\d]{5})'), text)
+    expires = re.search(re.compile(r'Expires: (.*?(?=\n{1,}))'), text)
+    return (game.group(1).title() if game else 'Unknown', code.group(1) if code else None,
+            reward.group(1) if reward else 'Unknown', convert_date(expires.group(1)) if expires else 'Unknown')
+
+
+def tweets_per_second(parse, repeat: int) -> float:
+    seconds = min(timeit.repeat(lambda: [parse(text) for text in CORPUS], number=repeat, repeat=5))
+    return len(CORPUS) * repeat / seconds
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name, parse in (('get_* functions', parse_per_field), ('parse_tweet_codes', parse_tweet_codes)):
+        print(f'{name:>18}: {tweets_per_second(parse, repeat):,.0f} tweets/s')
@@ -1,26 +1,91 @@
+import shutil
+
 import pytest
+from fastapi.testclient import TestClient
 
 from app import database_controller
+from tests.gearbox_stub import GearboxStub
+
+TEST_DATABASE = "./tests/files/test_borderlands_codes.db"
+
+
+@pytest.fixture(scope="session")
+def test_database(tmp_path_factory):
+    """A copy of the test database, connections switch it to WAL so the tracked file is never opened."""
+    path = tmp_path_factory.mktemp('database') / 'test_borderlands_codes.db'
+    shutil.copyfile(TEST_DATABASE, path)
+    return str(path)
 
 
 @pytest.fixture(scope="session", autouse=True)
-def sqlite_connection():
-    database = "./tests/files/test_borderlands_codes.db"
-    conn = database_controller.create_connection(database)
+def sqlite_connection(test_database):
+    conn = database_controller.create_connection(test_database)
     database_controller.create_code_table(conn)
     database_controller.create_user_table(conn)
     database_controller.create_user_code_table(conn)
+    database_controller.create_code_game_table(conn)
+    database_controller.create_checkpoint_table(conn)
+    database_controller.create_gearbox_session_table(conn)
+    database_controller.create_data_version_table(conn)
+    database_controller.create_indexes(conn)
     seed_tables(conn)
     yield conn
     teardown(conn)
     conn.close()
 
 
+@pytest.fixture
+def tmp_db_file(tmp_path):
+    """An empty database of the test's own with every table, see database_controller.create_schema."""
+    db_file = str(tmp_path / 'borderlands_codes.db')
+    conn = database_controller.create_connection(db_file)
+    database_controller.create_schema(conn)
+    conn.close()
+    return db_file
+
+
+@pytest.fixture
+def tmp_connection(tmp_db_file):
+    conn = database_controller.create_connection(tmp_db_file)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def gearbox_stub():
+    with GearboxStub() as stub:
+        yield stub
+
+
+@pytest.fixture
+def api_client(monkeypatch, test_database):
+    """Client for the API with every route's database on the test database."""
+    from app.async_database import get_database
+    from app.main import app
+    from app.response_cache import response_cache
+    from app.routes import account, codes, crawl_tasks, export, login, user_codes, user_games
+
+    response_cache.clear()
+    pool = database_controller.get_pool(test_database)
+    async_db = get_database(test_database)
+    for route in (account, codes, crawl_tasks, export, login, user_codes, user_games):
+        monkeypatch.setattr(route, 'database', test_database)
+        if hasattr(route, 'db_pool'):
+            monkeypatch.setattr(route, 'db_pool', pool)
+        if hasattr(route, 'async_db'):
+            monkeypatch.setattr(route, 'async_db', async_db)
+
+    return TestClient(app)
+
+
 def teardown(sqlite_connection):
     cur = sqlite_connection.cursor()
     cur.execute("DELETE FROM user")
     cur.execute("DELETE FROM code")
     cur.execute("DELETE FROM user_code")
+    cur.execute("DELETE FROM code_game")
+    cur.execute("DELETE FROM checkpoint")
+    cur.execute("DELETE FROM gearbox_session")
     sqlite_connection.commit()
     cur.close()
 
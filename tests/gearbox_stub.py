@@ -0,0 +1,314 @@
+"""
+Local stand-in for the Gearbox SHiFT website.
+
+Serves the login, rewards, code check and redeem pages on localhost so the redemption
+backends can be run without the live site. The pages have the ids, XPaths and messages
+BorderlandsCrawler looks for, and the rewards page runs the code check in the browser the
+way Gearbox does, so the selenium crawler works against it as well as ShiftClient.
+Pages are well formed XML so tests can check the crawler's XPaths with ElementTree.
+"""
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from html import escape
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from app.borderlands_crawler import GAME_CODES
+
+SESSION_COOKIE = '_session_id'
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><meta name="csrf-token" content="{csrf_token}" /><title>SHiFT</title></head>
+<body>
+{body}
+</body>
+</html>"""
+
+# The submit button is at BorderlandsCrawler.LOGIN_BUTTON_XPATH
+LOGIN_BODY = """<div class="page">
+<div class="header"></div>
+<div class="content">
+<div class="sidebar"></div>
+<div class="main">
+<div class="panel">
+<div class="row">
+<div class="login">
+<form action="/sessions" method="post">
+<div><input type="hidden" name="utf8" value="&#10003;" /></div>
+<div><input type="hidden" name="authenticity_token" value="{csrf_token}" /></div>
+<div><label for="user_email">Email</label></div>
+<div><input type="email" id="user_email" name="user[email]" /></div>
+<div><input type="password" id="user_password" name="user[password]" /></div>
+<div><input type="checkbox" id="user_remember_me" name="user[remember_me]" value="1" /></div>
+<div><input type="submit" name="commit" value="SIGN IN" /></div>
+</form>
+<div class="alert">{message}</div>
+</div>
+</div>
+</div>
+</div>
+</div>
+</div>"""
+
+# The sign out link is at BorderlandsCrawler.SIGN_OUT_XPATH
+NAV = """<div class="banner"></div>
+<div class="navigation">
+<nav>
+<div class="container">
+<div class="brand"><a href="/home">SHiFT</a></div>
+<div class="links">
+<ul><li><a href="/rewards">Rewards</a></li></ul>
+<ul><li><a href="/account">Account</a></li><li><a href="/logout">Sign Out</a></li></ul>
+</div>
+</div>
+</nav>
+</div>"""
+
+REWARDS_BODY = NAV + """
+<div class="alert notice">{message}</div>
+<input type="text" id="shift_code_input" name="shift_code_input" />
+<button id="shift_code_check">Check</button>
+<div id="shift_code_instructions" style="display: none">Please enter a valid SHiFT code</div>
+<div id="code_results"></div>"""
+
+# Runs the code check when the Check button is clicked, showing the instructions for an invalid code
+# and the redeem forms otherwise. Kept free of < and & so the page stays well formed.
+CODE_CHECK_SCRIPT = """
+<script>
+document.getElementById('shift_code_check').addEventListener('click', function () {
+  var instructions = document.getElementById('shift_code_instructions');
+  var results = document.getElementById('code_results');
+  var request = new XMLHttpRequest();
+  request.open('GET', '/entitlement_offer_codes?code=' +
+               encodeURIComponent(document.getElementById('shift_code_input').value));
+  request.setRequestHeader('X-CSRF-Token', document.querySelector('meta[name="csrf-token"]').content);
+  request.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+  request.onload = function () {
+    var invalid = request.responseText.indexOf('%s') !== -1;
+    instructions.style.display = invalid ? 'block' : 'none';
+    results.innerHTML = invalid ? '' : request.responseText;
+  };
+  request.send();
+});
+</script>"""
+
+REDEEM_FORM = """<form action="/code_redemptions" method="post">
+<input type="hidden" name="authenticity_token" value="{csrf_token}" />
+<input type="hidden" name="archway_code_redemption[code]" value="{code}" />
+<input type="hidden" name="archway_code_redemption[check]" value="{check}" />
+<input type="hidden" name="archway_code_redemption[service]" value="{service}" />
+<input type="hidden" name="archway_code_redemption[title]" value="{title}" />
+<input type="submit" value="Redeem for {platform}" class="submit_button redeem_button" />
+</form>"""
+
+SUCCESS_MESSAGE = 'Your code was successfully redeemed'
+LOGIN_FAILED_MESSAGE = 'Incorrect email or password.'
+INVALID_CODE_MESSAGE = 'This is not a valid SHiFT code'
+ALREADY_REDEEMED_MESSAGE = 'This SHiFT code has already been redeemed'
+UNEXPECTED_ERROR_MESSAGE = 'Unexpected Error Occurred'
+
+CODE_CHECK_SCRIPT = CODE_CHECK_SCRIPT % INVALID_CODE_MESSAGE
+
+
+class GearboxStub(object):
+    """
+    :param accounts: gearbox email -> password
+    :param codes: SHiFT code -> dict with 'games' (title -> list of platforms) and an optional
+        'error' message the code check returns instead, e.g. 'This SHiFT code has expired'
+    :param latency: seconds every response is delayed by, as a number or a (min, max) range
+    :param error_rate: share of code checks and redemptions that fail with Gearbox's unexpected error
+    :param seed: seed of the latency and error draws, for repeatable runs
+    """
+
+    def __init__(self, accounts: dict = None, codes: dict = None, latency=0, error_rate: float = 0,
+                 seed: int = None):
+        self.accounts = accounts or {}
+        self.codes = codes or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sessions = {}
+        self.redemptions = []
+        self.logins = 0  # login forms submitted with the right password
+        self.errors = 0  # unexpected errors injected
+        self.requests = Counter()  # requests per path
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(GearboxRequestHandler):
+            gearbox = stub
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def delay(self) -> float:
+        if isinstance(self.latency, (tuple, list)):
+            with self.lock:
+                return self.random.uniform(*self.latency)
+        return self.latency
+
+    def inject_error(self) -> bool:
+        """True if this request should fail, counted in errors."""
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+
+class GearboxRequestHandler(BaseHTTPRequestHandler):
+    gearbox = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # Session handling
+
+    def begin(self):
+        """Load the session and wait out the stub's latency, done before each request is handled."""
+        with self.gearbox.lock:
+            self.gearbox.requests[urlparse(self.path).path] += 1
+        delay = self.gearbox.delay()
+        if delay:
+            time.sleep(delay)
+        self.load_session()
+
+    def load_session(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        session_id = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+        with self.gearbox.lock:
+            if session_id not in self.gearbox.sessions:
+                session_id = secrets.token_hex(16)
+                self.gearbox.sessions[session_id] = {'email': None, 'csrf_token': secrets.token_hex(16),
+                                                     'flash': ''}
+            self.session_id = session_id
+            self.session = self.gearbox.sessions[session_id]
+
+    def form_data(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+    def valid_csrf(self, token: str) -> bool:
+        return token == self.session['csrf_token']
+
+    # Responses
+
+    def send(self, status: int, body: str = '', headers: dict = None):
+        content = body.encode()
+        self.send_response(status)
+        self.send_header('Set-Cookie', f'{SESSION_COOKIE}={self.session_id}; Path=/; HttpOnly')
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_page(self, body: str, status: int = 200):
+        self.send(status, PAGE.format(csrf_token=self.session['csrf_token'], body=body))
+
+    def redirect(self, location: str):
+        self.send(302, headers={'Location': location})
+
+    def pop_flash(self) -> str:
+        flash, self.session['flash'] = self.session['flash'], ''
+        return flash
+
+    # Routes
+
+    def do_GET(self):
+        self.begin()
+        url = urlparse(self.path)
+        if url.path == '/home':
+            return self.send_page(LOGIN_BODY.format(message='', csrf_token=self.session['csrf_token']))
+        if not self.session['email']:
+            return self.redirect('/home')
+        if url.path == '/account':
+            return self.send_page(NAV)
+        if url.path == '/rewards':
+            return self.send_page(REWARDS_BODY.format(message=escape(self.pop_flash())) + CODE_CHECK_SCRIPT)
+        if url.path == '/entitlement_offer_codes':
+            if not self.valid_csrf(self.headers.get('X-CSRF-Token')):
+                return self.send(422, 'Invalid authenticity token')
+            return self.send(200, self.code_results(parse_qs(url.query).get('code', [''])[0]))
+        self.send(404, 'Not found')
+
+    def do_POST(self):
+        self.begin()
+        url = urlparse(self.path)
+        data = self.form_data()
+        if not self.valid_csrf(data.get('authenticity_token')):
+            return self.send(422, 'Invalid authenticity token')
+        if url.path == '/sessions':
+            return self.login(data)
+        if not self.session['email']:
+            return self.redirect('/home')
+        if url.path == '/code_redemptions':
+            return self.redeem(data)
+        self.send(404, 'Not found')
+
+    def login(self, data: dict):
+        email = data.get('user[email]')
+        if email and self.gearbox.accounts.get(email) == data.get('user[password]'):
+            with self.gearbox.lock:
+                self.gearbox.logins += 1
+            self.session['email'] = email
+            return self.redirect('/account')
+        self.send_page(LOGIN_BODY.format(message=LOGIN_FAILED_MESSAGE, csrf_token=self.session['csrf_token']))
+
+    def code_results(self, code: str) -> str:
+        if self.gearbox.inject_error():
+            return f'<p>{UNEXPECTED_ERROR_MESSAGE}</p>'
+        details = self.gearbox.codes.get(code)
+        if details is None:
+            return f'<p>{INVALID_CODE_MESSAGE}</p>'
+        if details.get('error'):
+            return f'<p>{escape(details["error"])}</p>'
+
+        results = []
+        for game, platforms in details['games'].items():
+            results.append(f'<h2>{escape(game)}</h2>')
+            for platform in platforms:
+                results.append(REDEEM_FORM.format(csrf_token=self.session['csrf_token'], code=code,
+                                                  check=secrets.token_hex(8), service=platform.lower(),
+                                                  title=GAME_CODES[game].lower(), platform=platform))
+        return '\n'.join(results)
+
+    def redeem(self, data: dict):
+        redemption = (self.session['email'], data.get('archway_code_redemption[code]'),
+                      data.get('archway_code_redemption[title]'), data.get('archway_code_redemption[service]'))
+        if self.gearbox.inject_error():
+            self.session['flash'] = UNEXPECTED_ERROR_MESSAGE
+            return self.redirect('/rewards')
+        with self.gearbox.lock:
+            if redemption in self.gearbox.redemptions:
+                self.session['flash'] = ALREADY_REDEEMED_MESSAGE
+            else:
+                self.gearbox.redemptions.append(redemption)
+                self.session['flash'] = SUCCESS_MESSAGE
+        self.redirect('/rewards')
@@ -0,0 +1,91 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.async_database import get_database
+from app.config import get_config
+from app.jobs import SUCCEEDED
+from app.response_cache import response_cache
+from app.routes import account, codes, export
+
+# the tables as they were before data_version, the indexes and user_code.redeemed_at
+OLD_SCHEMA = """
+    CREATE TABLE code(
+        _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+        game TEXT,
+        platform TEXT,
+        code TEXT NOT NULL,
+        type TEXT NOT NULL,
+        reward TEXT DEFAULT Unknown,
+        time_gathered TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        expires TEXT,
+        is_valid INT NOT NULL DEFAULT 1,
+        UNIQUE(game, code)
+    );
+    CREATE TABLE user(
+        _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        gearbox_email TEXT UNIQUE,
+        gearbox_password TEXT,
+        notify_launch_game INTEGER CHECK(notify_launch_game IN (0, 1)) NOT NULL DEFAULT 0,
+        UNIQUE(email, gearbox_email)
+    );
+    CREATE TABLE user_code(
+        _id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+        code_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        game TEXT,
+        platform TEXT,
+        is_redeem_success INTEGER NOT NULL,
+        UNIQUE(user_id, code_id, game, platform)
+    );
+    INSERT INTO code(game, platform, code, type) VALUES('Borderlands 3', 'Universal', 'OLD-CODE', 'shift');
+    INSERT INTO user(email, password) VALUES('old_email', 'password');
+    INSERT INTO user_code(code_id, user_id, game, platform, is_redeem_success)
+        VALUES(1, 1, 'Borderlands 3', 'Steam', 1);
+"""
+
+
+def test_startup_migrates_an_old_database(tmp_path, monkeypatch):
+    # arrange
+    db_file = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_file)
+    conn.executescript(OLD_SCHEMA)
+    conn.close()
+    response_cache.clear()
+    monkeypatch.setattr(main, 'database', db_file)
+    monkeypatch.setattr(codes, 'async_db', get_database(db_file))
+    monkeypatch.setattr(export, 'database', db_file)
+
+    # act
+    with TestClient(main.app) as client:
+        codes_response = client.get(get_config().BASE_PATH + '/codes')
+        export_response = client.get(get_config().BASE_PATH + '/user/1/codes/export')
+
+    # assert
+    assert codes_response.status_code == 200
+    assert [code['code'] for code in codes_response.json()['data']] == ['OLD-CODE']
+    assert export_response.status_code == 200
+    assert 'OLD-CODE' in export_response.text
+
+
+def test_app_serves_again_after_a_restart(api_client, monkeypatch, test_database):
+    # arrange
+    monkeypatch.setattr(main, 'database', test_database)
+    for _ in range(2):  # Mangum starts and shuts the app down for every invocation
+        with TestClient(main.app):
+            pass
+
+    # act
+    with TestClient(main.app) as client:
+        pool_closed = account.browser_pool._closed
+        codes_response = client.get(get_config().BASE_PATH + '/codes')
+        job = account.verify_jobs.submit('restart', lambda: 1)
+    account.verify_jobs.shutdown(wait=True)
+
+    # assert
+    assert not pool_closed
+    assert codes_response.status_code == 200
+    assert account.verify_jobs.get(job.id).status == SUCCEEDED
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app import async_database
+from app.async_database import ExecutorDatabase, AiosqliteDatabase
+from app.config import get_config
+from app.routes import codes
+
+needs_aiosqlite = pytest.mark.skipif(async_database.aiosqlite is None, reason='aiosqlite is not installed')
+
+BACKENDS = [ExecutorDatabase, pytest.param(AiosqliteDatabase, marks=needs_aiosqlite)]
+
+
+async def run_queries(database, count: int):
+    try:
+        return await asyncio.gather(*[database.fetch_all('SELECT _id FROM code WHERE _id > :id ORDER BY _id', {'id': 0})
+                                      for _ in range(count)])
+    finally:
+        await database.close()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_concurrent_queries_share_a_bounded_pool(backend, sqlite_connection, test_database):
+    # arrange
+    expected = [row['_id'] for row in sqlite_connection.execute('SELECT _id FROM code ORDER BY _id')]
+    database = backend(test_database, size=2)
+
+    # act
+    results = asyncio.run(run_queries(database, 20))
+
+    # assert
+    assert all([row['_id'] for row in rows] == expected for rows in results)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_database_usable_after_close(backend, sqlite_connection, test_database):
+    # arrange
+    expected = [row['_id'] for row in sqlite_connection.execute('SELECT _id FROM code ORDER BY _id')]
+    database = backend(test_database, size=2)
+    asyncio.run(run_queries(database, 2))
+
+    # act
+    results = asyncio.run(run_queries(database, 2))
+
+    # assert
+    assert all([row['_id'] for row in rows] == expected for rows in results)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_execute_and_fetch_one(backend, tmp_path):
+    # arrange
+    database = backend(str(tmp_path / 'async.db'))
+
+    async def write_and_read():
+        try:
+            await database.execute('CREATE TABLE checkpoint(name TEXT PRIMARY KEY, value TEXT)')
+            changed = await database.execute('INSERT INTO checkpoint VALUES(:name, :value)',
+                                             {'name': 'etag', 'value': '"v1"'})
+            return changed, await database.fetch_one('SELECT value FROM checkpoint WHERE name = :name',
+                                                     {'name': 'etag'})
+        finally:
+            await database.close()
+
+    # act
+    changed, row = asyncio.run(write_and_read())
+
+    # assert
+    assert changed == 1
+    assert row['value'] == '"v1"'
+
+
+@needs_aiosqlite
+def test_routes_on_aiosqlite_backend(api_client, monkeypatch, test_database):
+    # arrange
+    database = AiosqliteDatabase(test_database)
+    monkeypatch.setattr(codes, 'async_db', database)
+
+    # act
+    responses = [api_client.get(get_config().BASE_PATH + '/codes', params={'limit': 2}) for _ in range(3)]
+    asyncio.run(database.close())
+
+    # assert
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert len(responses[0].json()['data']) == 2
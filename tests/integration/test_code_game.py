@@ -0,0 +1,47 @@
+import app.database_controller as db
+
+CODE = 'ZFKJ3-TT3BB-JTBJT-T3JJT-JWX9H'
+
+
+def test_code_games_cached(sqlite_connection):
+    # act
+    db.set_code_games(sqlite_connection, CODE, ['Borderlands 3', 'Borderlands 2'])
+
+    # assert
+    assert db.select_code_games(sqlite_connection, CODE, max_age_hours=1) == ['Borderlands 3', 'Borderlands 2']
+    assert db.select_code_games(sqlite_connection, 'UNKNOWN', max_age_hours=1) is None
+
+
+def test_code_games_expire_after_ttl(sqlite_connection):
+    # arrange
+    db.set_code_games(sqlite_connection, CODE, ['Borderlands 3'])
+    with sqlite_connection:
+        sqlite_connection.execute("UPDATE code_game SET observed_at = datetime('now', '-2 hours') WHERE code = ?",
+                                  (CODE, ))
+
+    # act / assert
+    assert db.select_code_games(sqlite_connection, CODE, max_age_hours=1) is None
+    assert db.select_code_games(sqlite_connection, CODE, max_age_hours=3) == ['Borderlands 3']
+
+
+def test_code_games_replaced(sqlite_connection):
+    # arrange
+    db.set_code_games(sqlite_connection, CODE, ['Borderlands 3'])
+
+    # act
+    db.set_code_games(sqlite_connection, CODE, ["Tiny Tina's Wonderlands"])
+
+    # assert
+    assert db.select_code_games(sqlite_connection, CODE, max_age_hours=1) == ["Tiny Tina's Wonderlands"]
+
+
+def test_invalid_code_removes_cached_games(sqlite_connection):
+    # arrange
+    code = db.select_all_codes(sqlite_connection)[0]
+    db.set_code_games(sqlite_connection, code['code'], ['Borderlands 3'])
+
+    # act
+    db.update_invalid_code(sqlite_connection, code['_id'])
+
+    # assert
+    assert db.select_code_games(sqlite_connection, code['code'], max_age_hours=1) is None
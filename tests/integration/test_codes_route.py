@@ -0,0 +1,82 @@
+from app.config import get_config
+from app.routes.codes import prepare_select_codes_query
+from tests.integration.test_query_plans import query_plan
+
+CODES_URL = get_config().BASE_PATH + '/codes'
+
+
+def test_get_codes_pages_with_cursor(api_client, sqlite_connection):
+    # arrange
+    expected = [row['_id'] for row in sqlite_connection.execute(
+        "SELECT _id FROM code ORDER BY COALESCE(game, '') DESC, _id DESC")]
+
+    # act
+    pages, url = [], CODES_URL + '?limit=2'
+    while url:
+        body = api_client.get(url).json()
+        pages.append([code['_id'] for code in body['data']])
+        url = body['next']
+
+    # assert
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [code_id for page in pages for code_id in page] == expected
+
+
+def test_get_codes_filters_and_fields(api_client):
+    # act
+    response = api_client.get(CODES_URL, params={'game': 'WONDERLANDS', 'is_valid': 1, 'fields': 'code,game'})
+
+    # assert
+    assert response.status_code == 200
+    body = response.json()
+    assert body['next'] is None
+    assert {code['code'] for code in body['data']} == {'TBRJJ-TW659-W5B5C-T3B3J-3BTBK',
+                                                       'KSK33-S5T33-XX5FS-R3BTB-WSXRC'}
+    assert all(set(code) == {'code', 'game'} for code in body['data'])
+
+
+def test_get_codes_rejects_bad_params(api_client):
+    # act
+    responses = [api_client.get(CODES_URL, params=params)
+                 for params in ({'fields': 'password'}, {'after': 'not-a-cursor'}, {'sort': 'game'})]
+
+    # assert
+    assert [response.status_code for response in responses] == [422, 422, 422]
+    assert [response.json()['errors'][0]['param'] for response in responses] == ['fields', 'after', 'sort']
+
+
+def test_get_codes_pages_use_index_order(sqlite_connection):
+    # arrange
+    params = {'game': 'Borderlands 3', 'after_game': 'Borderlands 3', 'after_id': 10, 'limit': 2}
+
+    # act
+    plan = query_plan(sqlite_connection, prepare_select_codes_query(['after_id', 'limit'], ['code']), params)
+    game_plan = query_plan(sqlite_connection, prepare_select_codes_query(['game', 'after_id', 'limit'], ['code']),
+                           params)
+
+    # assert
+    assert any(step.startswith('SEARCH code USING INDEX idx_code_game_page') for step in plan)
+    assert any(step.startswith('SEARCH code USING INDEX idx_code_game (game=? AND rowid<?)') for step in game_plan)
+    assert not any('TEMP B-TREE' in step for step in plan + game_plan)
+
+
+def test_get_codes_pages_include_codes_without_a_game(api_client, sqlite_connection):
+    # arrange
+    sqlite_connection.execute("INSERT INTO code(game, platform, code, type) "
+                              "VALUES(NULL, 'Universal', 'NOGAME', 'shift')")
+    sqlite_connection.commit()
+
+    # act
+    pages, url = [], CODES_URL + '?limit=2'
+    try:
+        while url:
+            body = api_client.get(url).json()
+            pages.extend(code['code'] for code in body['data'])
+            url = body['next']
+    finally:
+        sqlite_connection.execute("DELETE FROM code WHERE code = 'NOGAME'")
+        sqlite_connection.commit()
+
+    # assert
+    assert len(pages) == 6
+    assert pages[-1] == 'NOGAME'
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import database_controller
+from app.database_controller import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    db_file = str(tmp_path / 'pool.db')
+    pool = ConnectionPool(db_file, size=2)
+    with pool.connection() as conn:
+        database_controller.create_code_table(conn)
+    yield pool
+    pool.close()
+
+
+def test_connections_are_configured(pool):
+    with pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+
+
+def test_connections_are_reused(pool):
+    # act
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    # assert
+    assert first is second
+
+
+def test_pool_is_bounded(pool):
+    # arrange
+    with pool.connection(), pool.connection():
+        # act / assert
+        with pytest.raises(sqlite3.OperationalError):
+            with pool.connection(timeout=0.01):
+                pass
+
+
+def test_reads_are_not_blocked_by_a_writer(pool):
+    # arrange
+    code = {'game': 'Borderlands 3', 'platform': 'Universal', 'code': '3BRTJ-5K659-K5355-BTB3T-633F3',
+            'type': 'shift', 'reward': '1 GOLD KEY', 'time_gathered': 'Unknown', 'expires': 'Unknown'}
+    with pool.connection() as conn:
+        database_controller.create_code(conn, code)
+    rows = []
+
+    def read():
+        with pool.connection() as reader:
+            rows.extend(database_controller.select_all_codes(reader))
+
+    # act
+    with pool.connection() as writer:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("UPDATE code SET reward = 'changed'")
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join(timeout=2)
+        writer.rollback()
+
+    # assert
+    assert not thread.is_alive()
+    assert [row['reward'] for row in rows] == ['1 GOLD KEY']
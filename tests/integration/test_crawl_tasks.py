@@ -0,0 +1,249 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+from app import database_controller
+from app import input_borderlands_codes as ibc
+from app.config import get_config
+from app.main import app
+from app.routes import crawl_tasks
+from app.util import encrypt
+
+TOKEN = 'test_worker_token'
+CODES = ['3BRTJ-5K659-K5355-BTB3T-633F3', 'KSWJJ-J6TTJ-FRCF9-X333J-5Z6KJ', 'W9CJT-5XJTB-RRKRS-FTJ3T-BTRKK']
+TASKS_PATH = get_config().BASE_PATH + '/crawl/tasks'
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def add_crawl_run(conn, user_count):
+    key = os.getenv('BORDERLANDS_ENCRYPTION_KEY').encode()
+    for code in CODES:
+        database_controller.create_code(conn, {'game': 'Borderlands 3', 'platform': 'Universal', 'code': code,
+                                               'type': 'shift', 'reward': 'Unknown', 'time_gathered': 'Unknown',
+                                               'expires': 'Unknown'})
+    for i in range(user_count):
+        user_id = database_controller.create_user(conn, {
+            'email': f'worker_email_{i}',
+            'password': 'password',
+            'gearbox_email': f'worker_gearbox_email_{i}',
+            'gearbox_password': encrypt(b'gearbox_password', key).decode(),
+        })
+        database_controller.create_user_game(conn, 'Borderlands 3', 'Steam', user_id)
+    ibc.publish_crawl_run(conn)
+
+
+@pytest.fixture
+def crawl_db(tmp_db_file, tmp_connection, monkeypatch):
+    add_crawl_run(tmp_connection, user_count=2)
+    monkeypatch.setattr(crawl_tasks, 'db_pool', database_controller.get_pool(tmp_db_file))
+    monkeypatch.setenv('BORDERLANDS_CRAWL_WORKER_TOKEN', TOKEN)
+    return tmp_connection
+
+
+@pytest.fixture
+def worker_client(crawl_db):
+    client = TestClient(app)
+    client.headers['Authorization'] = f'Bearer {TOKEN}'
+    return client
+
+
+def claim(client, worker):
+    return client.post(f'{TASKS_PATH}/claim', json={'worker': worker})
+
+
+def test_claim_needs_the_worker_token(crawl_db, monkeypatch):
+    # arrange
+    client = TestClient(app)
+
+    # act
+    missing = client.post(f'{TASKS_PATH}/claim', json={'worker': 'worker-1'})
+    wrong = client.post(f'{TASKS_PATH}/claim', json={'worker': 'worker-1'}, headers={'Authorization': 'Bearer x'})
+    monkeypatch.delenv('BORDERLANDS_CRAWL_WORKER_TOKEN')
+    disabled = client.post(f'{TASKS_PATH}/claim', json={'worker': 'worker-1'},
+                           headers={'Authorization': f'Bearer {TOKEN}'})
+
+    # assert
+    assert missing.status_code == 401
+    assert wrong.status_code == 401
+    assert disabled.status_code == 503
+
+
+def test_claim_write_and_complete(worker_client, crawl_db):
+    # act
+    task = claim(worker_client, 'worker-1').json()
+    other_task = claim(worker_client, 'worker-2').json()
+    heartbeat = worker_client.post(f'{TASKS_PATH}/{task["task_id"]}/heartbeat', json={'worker': 'worker-1'})
+    user_id, code_id = task['user']['_id'], task['codes'][0]['_id']
+    writes = worker_client.post(f'{TASKS_PATH}/{task["task_id"]}/writes', json={
+        'worker': 'worker-1', 'user_codes': [[user_id, code_id, 'Borderlands 3', 'Steam', 1]],
+        'invalid_code_ids': [], 'notify_launch_game': {}})
+    complete = worker_client.post(f'{TASKS_PATH}/{task["task_id"]}/complete', json={
+        'worker': 'worker-1', 'result': {'user_id': user_id, 'redeemed': 1, 'failed': 0, 'error': None,
+                                         'retry': False}})
+    no_task = claim(worker_client, 'worker-3')
+
+    # assert
+    assert task['user']['password'] == ''
+    assert task['games'] == {'Borderlands 3': 'Steam'}
+    assert [code['code'] for code in task['codes']] == CODES[::-1]  # newest first
+    assert other_task['user']['_id'] != user_id
+    assert heartbeat.status_code == 200
+    assert writes.json()['created'] == 1
+    assert complete.json()['status'] == 'done'
+    assert no_task.status_code == 204
+    assert [row['code_id'] for row in database_controller.get_user_codes_by_id(crawl_db, user_id)] == [code_id]
+
+
+def test_expired_lease_is_claimed_again(worker_client, crawl_db):
+    # arrange
+    first = claim(worker_client, 'worker-1').json()
+    claim(worker_client, 'worker-2')  # the other user's task
+    crawl_db.execute("UPDATE crawl_task SET lease_expires = datetime('now', '-1 seconds') WHERE _id = ?",
+                     (first['task_id'],))
+    crawl_db.commit()
+
+    # act
+    second = claim(worker_client, 'worker-3').json()
+    heartbeat = worker_client.post(f'{TASKS_PATH}/{first["task_id"]}/heartbeat', json={'worker': 'worker-1'})
+    complete = worker_client.post(f'{TASKS_PATH}/{first["task_id"]}/complete', json={
+        'worker': 'worker-1', 'result': {'user_id': first['user']['_id'], 'retry': False}})
+
+    # assert
+    assert second['task_id'] == first['task_id']
+    assert second['attempts'] == 2
+    assert heartbeat.status_code == 409
+    assert complete.status_code == 409
+    assert database_controller.select_crawl_task(crawl_db, first['task_id'])['lease_owner'] == 'worker-3'
+
+
+def test_writes_for_another_user_are_forbidden(worker_client, crawl_db):
+    # arrange
+    task = claim(worker_client, 'worker-1').json()
+    other_user_id = task['user']['_id'] % 2 + 1
+
+    # act
+    response = worker_client.post(f'{TASKS_PATH}/{task["task_id"]}/writes', json={
+        'worker': 'worker-1', 'user_codes': [[other_user_id, task['codes'][0]['_id'], 'Borderlands 3', 'Steam', 1]],
+        'invalid_code_ids': [], 'notify_launch_game': {}})
+
+    # assert
+    assert response.status_code == 403
+    assert database_controller.get_user_codes_by_id(crawl_db, other_user_id) == []
+
+
+def test_local_runner_and_workers_race_for_a_task(crawl_db, tmp_db_file):
+    # arrange
+    task_id = crawl_db.execute('SELECT MIN(_id) FROM crawl_task').fetchone()[0]
+    connections = [database_controller.create_connection(tmp_db_file) for _ in range(8)]
+    barrier = threading.Barrier(len(connections))
+    winners = []
+
+    def start_locally(conn, worker):
+        barrier.wait()
+        if database_controller.start_crawl_task(conn, task_id, worker, 60) is not None:
+            winners.append(worker)
+
+    def claim_remotely(conn, worker):
+        barrier.wait()
+        task = database_controller.claim_crawl_task(conn, worker, 60, 3)
+        if task is not None and task['_id'] == task_id:
+            winners.append(worker)
+
+    threads = [threading.Thread(target=start_locally if i % 2 else claim_remotely, args=(conn, f'worker-{i}'))
+               for i, conn in enumerate(connections)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for conn in connections:
+        conn.close()
+
+    # assert
+    task = database_controller.select_crawl_task(crawl_db, task_id)
+    assert len(winners) == 1
+    assert task['lease_owner'] == winners[0]
+    assert task['attempts'] == 1
+
+
+def test_local_runner_does_not_take_a_leased_task(crawl_db):
+    # arrange
+    task = database_controller.claim_crawl_task(crawl_db, 'worker-1', 60, 3)
+
+    # act
+    attempts = database_controller.start_crawl_task(crawl_db, task['_id'], ibc.LOCAL_WORKER, 60)
+
+    # assert
+    assert attempts is None
+    assert database_controller.select_crawl_task(crawl_db, task['_id'])['lease_owner'] == 'worker-1'
+
+
+def test_local_runners_on_one_host_have_their_own_name(tmp_path):
+    # arrange
+    script = 'import app.input_borderlands_codes as ibc; print(ibc.LOCAL_WORKER)'
+
+    # act
+    names = {subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=dict(os.environ, PYTHONPATH=ROOT),
+                            capture_output=True, text=True, check=True).stdout.strip()
+             for _ in range(2)}
+
+    # assert
+    assert len(names) == 2
+    assert ibc.LOCAL_WORKER not in names
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_in_separate_processes_share_a_run(tmp_path, tmp_db_file, tmp_connection, monkeypatch, gearbox_stub):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawl_run(conn, user_count=6)
+    for i in range(6):
+        gearbox_stub.accounts[f'worker_gearbox_email_{i}'] = 'gearbox_password'
+    for code in CODES:
+        gearbox_stub.codes[code] = {'games': {'Borderlands 3': ['Steam']}}
+    monkeypatch.setattr(crawl_tasks, 'db_pool', database_controller.get_pool(db_file))
+    monkeypatch.setenv('BORDERLANDS_CRAWL_WORKER_TOKEN', TOKEN)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    env = dict(os.environ, PYTHONPATH=ROOT, BORDERLANDS_REDEMPTION_BACKEND='http',
+               BORDERLANDS_GEARBOX_BASE_URL=gearbox_stub.url, BORDERLANDS_GEARBOX_REQUESTS_PER_SECOND='0')
+
+    # act
+    try:
+        workers = [subprocess.Popen([sys.executable, '-m', 'app.crawl_worker', '--api', f'http://127.0.0.1:{port}',
+                                     '--worker', f'worker-{i}', '--cache', f'cache_{i}.db', '--until-idle'],
+                                    cwd=tmp_path, env=env)
+                   for i in range(3)]
+        exit_codes = [worker.wait(timeout=60) for worker in workers]
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    # assert
+    tasks = conn.execute('SELECT * FROM crawl_task').fetchall()
+    assert exit_codes == [0, 0, 0]
+    assert [task['status'] for task in tasks] == ['done'] * 6
+    assert all(json.loads(task['result'])['redeemed'] == 3 for task in tasks)
+    assert len(gearbox_stub.redemptions) == len(set(gearbox_stub.redemptions)) == 18
+    assert conn.execute('SELECT COUNT(*) FROM user_code').fetchone()[0] == 18
+    assert conn.execute("SELECT status FROM crawl_run").fetchone()[0] == 'finished'
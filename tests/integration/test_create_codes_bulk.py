@@ -0,0 +1,66 @@
+
+import app.database_controller as db
+
+
+def new_code(code: str, reward: str = 'Unknown', expires: str = 'Unknown') -> dict:
+    return {'game': 'Borderlands 3', 'platform': 'Universal', 'code': code, 'type': 'shift',
+            'reward': reward, 'time_gathered': '2022-01-01 00:00:00', 'expires': expires}
+
+
+def test_create_codes_bulk_inserts_new_codes(tmp_connection):
+    # act
+    counts = db.create_codes_bulk(tmp_connection, [new_code('AAAAA'), new_code('BBBBB', reward='3 Golden Keys')])
+
+    # assert
+    assert counts == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    rows = tmp_connection.execute('SELECT code, reward FROM code ORDER BY code').fetchall()
+    assert [tuple(row) for row in rows] == [('AAAAA', 'Unknown'), ('BBBBB', '3 Golden Keys')]
+
+
+def test_create_codes_bulk_updates_known_values_only(tmp_connection):
+    # arrange
+    db.create_codes_bulk(tmp_connection, [new_code('AAAAA', reward='3 Golden Keys', expires='2022-02-01'),
+                                          new_code('BBBBB')])
+
+    # act
+    counts = db.create_codes_bulk(tmp_connection, [
+        new_code('AAAAA'),  # unknown values do not overwrite
+        new_code('BBBBB', reward='Diamond Key'),
+        new_code('CCCCC'),
+    ])
+
+    # assert
+    assert counts == {'inserted': 1, 'updated': 1, 'skipped': 1}
+    rows = tmp_connection.execute('SELECT code, reward, expires FROM code ORDER BY code').fetchall()
+    assert [tuple(row) for row in rows] == [('AAAAA', '3 Golden Keys', '2022-02-01'),
+                                            ('BBBBB', 'Diamond Key', 'Unknown'),
+                                            ('CCCCC', 'Unknown', 'Unknown')]
+
+
+def test_create_codes_bulk_without_update_skips_existing(tmp_connection):
+    # arrange
+    db.create_codes_bulk(tmp_connection, [new_code('AAAAA')])
+
+    # act
+    counts = db.create_codes_bulk(tmp_connection, [new_code('AAAAA', reward='Diamond Key')], update=False)
+
+    # assert
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 1}
+    assert tmp_connection.execute('SELECT reward FROM code').fetchone()[0] == 'Unknown'
+
+
+def test_create_codes_bulk_counts_only_its_own_rows(tmp_connection):
+    # arrange: another writer's rows appearing while the batch is written
+    tmp_connection.execute('''CREATE TRIGGER other_writer AFTER INSERT ON code WHEN NEW.code = 'AAAAA'
+                               BEGIN
+                                   INSERT INTO code(game, platform, code, type, reward, time_gathered, expires)
+                                   VALUES('Borderlands 2', 'Universal', 'ZZZZZ', 'shift', 'Unknown', 'Unknown',
+                                          'Unknown');
+                               END''')
+
+    # act
+    counts = db.create_codes_bulk(tmp_connection, [new_code('AAAAA'), new_code('BBBBB')])
+
+    # assert
+    assert counts == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    assert tmp_connection.execute('SELECT COUNT(*) FROM code').fetchone()[0] == 3
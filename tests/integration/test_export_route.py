@@ -0,0 +1,126 @@
+import contextlib
+import csv
+import io
+import json
+
+import app.database_controller as db
+from app.config import get_config
+from app.routes import export
+from app.routes.export import prepare_export_codes, prepare_export_user_codes
+from tests.integration.test_query_plans import query_plan
+
+BASE_PATH = get_config().BASE_PATH
+
+
+def test_export_codes_ndjson(api_client, sqlite_connection):
+    # arrange
+    codes = db.select_all_codes(sqlite_connection)
+
+    # act
+    response = api_client.get(BASE_PATH + '/codes/export')
+
+    # assert
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row['_id'] for row in rows) == sorted(code['_id'] for code in codes)
+    assert set(rows[0]) == set(codes[0].keys())
+
+
+def test_export_codes_after(api_client, sqlite_connection):
+    # arrange
+    code_ids = sorted(code['_id'] for code in db.select_all_codes(sqlite_connection))
+
+    # act
+    response = api_client.get(BASE_PATH + '/codes/export', params={'after': code_ids[1]})
+
+    # assert
+    assert [json.loads(line)['_id'] for line in response.text.splitlines()] == code_ids[2:]
+
+
+def test_export_user_codes_csv(api_client, sqlite_connection):
+    # arrange
+    user = db.select_all_users(sqlite_connection)[2]
+    code = db.select_all_codes(sqlite_connection)[1]
+    db.create_user_code(sqlite_connection, user['_id'], code['_id'], 'Borderlands 3', 'Epic', 1)
+
+    # act
+    response = api_client.get(BASE_PATH + f'/user/{user["_id"]}/codes/export', params={'format': 'csv'})
+
+    # assert
+    assert response.headers['content-type'].startswith('text/csv')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row['code'], row['platform'], row['is_redeem_success']) for row in rows] == [(code['code'], 'Epic', '1')]
+    assert rows[0]['redeemed_at']
+
+
+def test_export_csv_has_a_header_when_no_rows_match(api_client, sqlite_connection):
+    # arrange
+    last_id = max(code['_id'] for code in db.select_all_codes(sqlite_connection))
+
+    # act
+    response = api_client.get(BASE_PATH + '/codes/export', params={'format': 'csv', 'after': last_id})
+
+    # assert
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert len(lines) == 1
+    assert lines[0].split(',')[:2] == ['_id', 'game']
+
+
+def test_export_rejects_unknown_format(api_client):
+    # act
+    response = api_client.get(BASE_PATH + '/codes/export', params={'format': 'xml'})
+
+    # assert
+    assert response.status_code == 422
+
+
+def test_iter_rows_yields_batches(sqlite_connection):
+    # act
+    batches = list(db.iter_rows(sqlite_connection, 'SELECT _id FROM code', batch_size=2))
+
+    # assert
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_user_code_migration_adds_redeemed_at(tmp_path):
+    # arrange
+    conn = db.create_connection(str(tmp_path / 'old.db'))
+    conn.execute('CREATE TABLE user_code(_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, code_id INTEGER NOT NULL, '
+                 'user_id INTEGER NOT NULL, game TEXT, platform TEXT, is_redeem_success INTEGER NOT NULL)')
+
+    # act
+    db.create_user_code_table(conn)
+    db.create_user_code_table(conn)
+    db.create_user_code(conn, 1, 2, 'Borderlands 3', 'Epic', 1)
+
+    # assert
+    assert conn.execute('SELECT redeemed_at FROM user_code').fetchone()['redeemed_at'] is not None
+    conn.close()
+
+
+def test_exports_read_in_index_order(sqlite_connection):
+    # act
+    plans = [query_plan(sqlite_connection, prepare_export_codes(after), {'after': 2}) for after in (False, True)]
+    plans += [query_plan(sqlite_connection, prepare_export_user_codes(after), {'user_id': 1, 'after': 2})
+              for after in (False, True)]
+
+    # assert
+    assert not any('TEMP B-TREE' in step for plan in plans for step in plan)
+    assert any('idx_user_code_user (user_id=? AND rowid>?)' in step for step in plans[3])
+
+
+def test_export_does_not_take_a_pool_connection(api_client, sqlite_connection):
+    # arrange
+    pool = db.get_pool(export.database)
+
+    # act
+    with contextlib.ExitStack() as stack:
+        for _ in range(pool.size):  # every connection of the routes' pool is in use
+            stack.enter_context(pool.connection())
+        response = api_client.get(BASE_PATH + '/codes/export')
+
+    # assert
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == len(db.select_all_codes(sqlite_connection))
@@ -0,0 +1,66 @@
+import os
+import time
+
+from app import database_controller, gearbox_session
+from app.shift_client import ShiftClient
+from app.util import encrypt
+
+GEARBOX_EMAIL = 'session_gearbox_email'
+GEARBOX_PASSWORD = 'session_gearbox_password'
+
+
+def create_client(stub):
+    key = os.getenv('BORDERLANDS_ENCRYPTION_KEY').encode()
+    user = {'gearbox_email': GEARBOX_EMAIL, 'gearbox_password': encrypt(GEARBOX_PASSWORD.encode(), key).decode()}
+    return ShiftClient(user=user, base_url=stub.url)
+
+
+def login(sqlite_connection, stub) -> bool:
+    client = create_client(stub)
+    try:
+        return gearbox_session.login(sqlite_connection, client)
+    finally:
+        client.tear_down()
+
+
+def test_saved_session_skips_login(sqlite_connection, gearbox_stub):
+    # arrange
+    database_controller.delete_gearbox_session(sqlite_connection, GEARBOX_EMAIL)
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+
+    # act
+    first = login(sqlite_connection, gearbox_stub)
+    second = login(sqlite_connection, gearbox_stub)
+
+    # assert
+    assert first and second
+    assert gearbox_stub.logins == 1
+    saved = database_controller.select_gearbox_session(sqlite_connection, GEARBOX_EMAIL)
+    assert saved and gearbox_stub.sessions.popitem()[0] not in saved  # only stored encrypted
+
+
+def test_signed_out_session_logs_in_again(sqlite_connection, gearbox_stub):
+    # arrange
+    database_controller.delete_gearbox_session(sqlite_connection, GEARBOX_EMAIL)
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+    login(sqlite_connection, gearbox_stub)
+    gearbox_stub.sessions.clear()  # Gearbox has ended the session
+
+    # act
+    logged_in = login(sqlite_connection, gearbox_stub)
+
+    # assert
+    assert logged_in
+    assert gearbox_stub.logins == 2
+
+
+def test_expired_session_not_loaded(sqlite_connection):
+    # arrange
+    cookies = [{'name': '_session_id', 'value': 'abc', 'domain': 'example.com', 'path': '/',
+                'expiry': int(time.time()) - 60}]
+
+    # act
+    gearbox_session.save_session(sqlite_connection, GEARBOX_EMAIL, cookies)
+
+    # assert
+    assert gearbox_session.load_session(sqlite_connection, GEARBOX_EMAIL) is None
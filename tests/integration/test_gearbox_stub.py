@@ -0,0 +1,83 @@
+import time
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+import requests
+
+from app.borderlands_crawler import BorderlandsCrawler, GearboxUnexpectedError
+from tests.gearbox_stub import GearboxStub
+from tests.integration.test_shift_client import CODE, GEARBOX_EMAIL, GEARBOX_PASSWORD, create_client
+
+
+def parse(html):
+    """The page as an ElementTree, the doctype is dropped as ElementTree does not read it."""
+    return ElementTree.fromstring(html.split('\n', 1)[1])
+
+
+def find_xpath(page, xpath):
+    """Find a crawler's absolute XPath, e.g. /html/body/div[1], in a page parsed by parse."""
+    return page.find(xpath.replace('/html/', './', 1))
+
+
+def logged_in_session(stub):
+    session = requests.Session()
+    html = session.get(f'{stub.url}/home').text
+    token = parse(html).find('./head/meta').get('content')
+    session.post(f'{stub.url}/sessions', data={'authenticity_token': token, 'user[email]': GEARBOX_EMAIL,
+                                               'user[password]': GEARBOX_PASSWORD})
+    return session
+
+
+def test_login_page_matches_the_crawler(gearbox_stub):
+    # act
+    page = parse(requests.get(f'{gearbox_stub.url}/home').text)
+
+    # assert
+    button = find_xpath(page, BorderlandsCrawler.LOGIN_BUTTON_XPATH)
+    assert button is not None and button.get('type') == 'submit'
+    assert page.find(".//input[@id='user_email']") is not None
+    assert page.find(".//input[@id='user_password']") is not None
+
+
+def test_rewards_page_matches_the_crawler(gearbox_stub):
+    # arrange
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+    session = logged_in_session(gearbox_stub)
+
+    # act
+    page = parse(session.get(f'{gearbox_stub.url}/rewards').text)
+
+    # assert
+    assert find_xpath(page, BorderlandsCrawler.SIGN_OUT_XPATH).text == 'Sign Out'
+    for elem_id in ('shift_code_input', 'shift_code_check', 'code_results'):
+        assert page.find(f".//*[@id='{elem_id}']") is not None
+    assert page.find(".//*[@id='shift_code_instructions']").get('style') == 'display: none'
+    assert page.find('.//script') is not None
+
+
+def test_latency_delays_every_response():
+    # arrange
+    with GearboxStub(latency=0.1) as stub:
+        start = time.monotonic()
+
+        # act
+        requests.get(f'{stub.url}/home')
+
+    # assert
+    assert time.monotonic() - start >= 0.1
+    assert stub.requests['/home'] == 1
+
+
+def test_error_injection_fails_the_code_check():
+    # arrange
+    with GearboxStub(accounts={GEARBOX_EMAIL: GEARBOX_PASSWORD}, codes={CODE: {'games': {'Borderlands 3': ['Steam']}}},
+                     error_rate=1) as stub:
+        client = create_client(stub)
+        assert client.login_gearbox()
+
+        # act / assert
+        with pytest.raises(GearboxUnexpectedError):
+            client.get_games_to_redeem_for_code(CODE)
+
+    assert stub.errors == 1
+    assert stub.redemptions == []
@@ -0,0 +1,61 @@
+import app.database_controller as db
+from app.get_codes_json import json_archive
+
+
+def archive_code(code: str) -> dict:
+    return {'code': code, 'type': 'shift', 'game': 'Borderlands 3', 'platform': 'Universal',
+            'reward': '3 Golden Keys', 'archived': '26 May 2022 17:30:00 -0400', 'expires': None}
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, codes: list = None, headers: dict = None):
+        self.status_code = status_code
+        self.codes = codes
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return [{'codes': self.codes}]
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+def test_json_archive_inserts_only_new_codes(tmp_connection):
+    # arrange
+    headers = {'ETag': '"v1"', 'Last-Modified': 'Thu, 26 May 2022 21:30:00 GMT'}
+    session = FakeSession(FakeResponse(200, [archive_code('AAAAA')], headers),
+                          FakeResponse(200, [archive_code('AAAAA'), archive_code('BBBBB')], {'ETag': '"v2"'}))
+
+    # act
+    first = json_archive(tmp_connection, session=session)
+    second = json_archive(tmp_connection, session=session)
+
+    # assert
+    assert first['inserted'] == 1
+    assert second == {'inserted': 1, 'updated': 0, 'skipped': 0}
+    assert session.requests[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Thu, 26 May 2022 21:30:00 GMT'}
+    assert db.get_checkpoint(tmp_connection, 'orcicorn_etag') == '"v2"'
+
+
+def test_json_archive_not_modified(tmp_connection):
+    # arrange
+    db.set_checkpoint(tmp_connection, 'orcicorn_etag', '"v1"')
+    session = FakeSession(FakeResponse(304))
+
+    # act
+    counts = json_archive(tmp_connection, session=session)
+
+    # assert
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 0}
+    assert session.requests == [{'If-None-Match': '"v1"'}]
+    assert tmp_connection.execute('SELECT COUNT(*) FROM code').fetchone()[0] == 0
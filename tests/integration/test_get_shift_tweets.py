@@ -0,0 +1,54 @@
+import app.database_controller as db
+from app.get_codes_twitter import get_shift_tweets, fetch_new_tweets
+
+
+class FakeTweet:
+    def __init__(self, tweet_id: int):
+        self.id = tweet_id
+        self.full_text = (f'SHiFT CODE\n\nGame: BORDERLANDS 3\nReward: 3 Golden Keys\n\n'
+                          f'{tweet_id:05d}-AAAAA-BBBBB-CCCCC-DDDDD\n\nRedeem in-game')
+
+
+class FakeApi:
+    """Timeline of tweets with ids 1 to count, returned newest first like the Twitter API."""
+
+    def __init__(self, count: int):
+        self.tweets = [FakeTweet(tweet_id) for tweet_id in range(count, 0, -1)]
+        self.calls = []
+
+    def user_timeline(self, count=20, since_id=None, max_id=None, **kwargs):
+        self.calls.append((since_id, max_id))
+        tweets = [tweet for tweet in self.tweets
+                  if (since_id is None or tweet.id > since_id) and (max_id is None or tweet.id <= max_id)]
+        return tweets[:count]
+
+
+def test_fetch_new_tweets_pages_back_to_since_id():
+    # arrange
+    api = FakeApi(25)
+
+    # act
+    tweets = fetch_new_tweets(api, since_id=3, page_size=10)
+
+    # assert
+    assert [tweet.id for tweet in tweets] == list(range(25, 3, -1))
+    assert api.calls == [(3, None), (3, 15), (3, 5), (3, 3)]
+
+
+def test_get_shift_tweets_only_processes_new_tweets(tmp_connection):
+    # arrange
+    api = FakeApi(3)
+    get_shift_tweets(tmp_connection, api=api)
+    api.tweets = [FakeTweet(5), FakeTweet(4)] + api.tweets
+    api.calls = []
+
+    # act
+    counts = get_shift_tweets(tmp_connection, api=api)
+    quiet_counts = get_shift_tweets(tmp_connection, api=api)
+
+    # assert
+    assert counts == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    assert api.calls[0] == (3, None)
+    assert quiet_counts == {'inserted': 0, 'updated': 0, 'skipped': 0}
+    assert db.get_checkpoint(tmp_connection, 'twitter_since_id') == '5'
+    assert tmp_connection.execute('SELECT COUNT(*) FROM code').fetchone()[0] == 5
@@ -0,0 +1,64 @@
+import app.database_controller as db
+from app.routes.user_codes import prepare_get_successful_codes
+
+
+def query_plan(conn, sql, params=()):
+    cur = conn.cursor()
+    cur.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    return [row['detail'] for row in cur.fetchall()]
+
+
+def executed_sql(conn, query, *args):
+    """Capture the SQL, with its parameters bound, that a database_controller function runs."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        query(conn, *args)
+    finally:
+        conn.set_trace_callback(None)
+    return statements[-1]
+
+
+def test_valid_codes_by_user_uses_indexed_anti_join(sqlite_connection):
+    # arrange
+    sql = executed_sql(sqlite_connection, db.get_valid_codes_by_user, 1)
+
+    # act
+    plan = query_plan(sqlite_connection, sql)
+
+    # assert
+    assert 'SCAN c USING INDEX idx_code_valid' in plan
+    assert any(step.startswith('SEARCH uc USING COVERING INDEX') and '(user_id=? AND code_id=?)' in step
+               for step in plan)
+    assert not any(step.startswith('SCAN uc') or step.startswith('SCAN user_code') for step in plan)
+
+
+def test_successful_codes_by_user_uses_covering_index(sqlite_connection):
+    # act
+    plan = query_plan(sqlite_connection, prepare_get_successful_codes(), {'user_id': 1})
+
+    # assert
+    assert any('USING COVERING INDEX idx_user_code_user_success (user_id=? AND is_redeem_success=?)' in step
+               for step in plan)
+    assert 'SEARCH c USING INTEGER PRIMARY KEY (rowid=?)' in plan
+    assert not any(step.startswith('SCAN c') for step in plan)
+
+
+def test_codes_by_user_results(sqlite_connection):
+    # arrange
+    user = db.select_all_users(sqlite_connection)[1]
+    codes = db.select_all_codes(sqlite_connection)
+    db.create_user_code(sqlite_connection, user['_id'], codes[0]['_id'], 'Borderlands 3', 'Steam', 1)
+    db.create_user_code(sqlite_connection, user['_id'], codes[0]['_id'], 'Borderlands 2', 'Steam', 1)
+    db.create_user_code(sqlite_connection, user['_id'], codes[1]['_id'], 'Borderlands 3', 'Steam', 0)
+
+    # act
+    valid = db.get_valid_codes_by_user(sqlite_connection, user['_id'])
+    successful = db.get_successful_codes_by_user_id(sqlite_connection, user['_id'])
+    unsuccessful = db.get_unsuccessful_codes_by_user_id(sqlite_connection, user['_id'])
+
+    # assert
+    used = {codes[0]['_id'], codes[1]['_id']}
+    assert {row['_id'] for row in valid} == {code['_id'] for code in codes if code['is_valid']} - used
+    assert [row['_id'] for row in successful] == [codes[0]['_id']]
+    assert [row['_id'] for row in unsuccessful] == [codes[1]['_id']]
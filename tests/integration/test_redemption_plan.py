@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+from app import database_controller
+from app import input_borderlands_codes as ibc
+
+CACHE_HOURS = 24
+
+
+def add_code(conn, code, expires='Unknown', time_gathered='Unknown'):
+    return database_controller.create_code(conn, {'game': 'Borderlands 3', 'platform': 'Universal', 'code': code,
+                                                  'type': 'shift', 'reward': 'Unknown',
+                                                  'time_gathered': time_gathered, 'expires': expires})
+
+
+def add_user(conn, name, games):
+    user_id = database_controller.create_user(conn, {'email': name, 'password': 'password',
+                                                     'gearbox_email': f'gearbox_{name}',
+                                                     'gearbox_password': 'gearbox_password'})
+    for game, platform in games.items():
+        database_controller.create_user_game(conn, game, platform, user_id)
+    return user_id
+
+
+def planned_codes(plan, user_id):
+    return [row['code'] for row in plan.get(user_id, [])]
+
+
+def test_plan_orders_by_expiry_then_recency(tmp_connection):
+    # arrange
+    soon = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    later = (datetime.utcnow() + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+    expired = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    add_code(tmp_connection, 'UNKNOWN-OLD', time_gathered='2022-01-01 00:00:00')
+    add_code(tmp_connection, 'EXPIRED', expires=expired)
+    add_code(tmp_connection, 'LATER', expires=later)
+    add_code(tmp_connection, 'UNKNOWN-NEW', time_gathered='2022-06-01 00:00:00')
+    add_code(tmp_connection, 'SOON', expires=soon)
+    add_code(tmp_connection, 'NO-EXPIRY', expires=None, time_gathered='2022-03-01 00:00:00')
+    user_id = add_user(tmp_connection, 'user', {'Borderlands 3': 'Steam'})
+
+    # act
+    plan = ibc.plan_redemptions(tmp_connection, CACHE_HOURS)
+
+    # assert
+    assert planned_codes(plan, user_id) == ['SOON', 'LATER', 'UNKNOWN-NEW', 'NO-EXPIRY', 'UNKNOWN-OLD',
+                                            'EXPIRED']
+
+
+def test_plan_drops_pairs_that_cannot_succeed(tmp_connection):
+    # arrange
+    add_code(tmp_connection, 'UNCHECKED')
+    add_code(tmp_connection, 'BL3-ONLY')
+    add_code(tmp_connection, 'BOTH')
+    used_id = add_code(tmp_connection, 'USED')
+    invalid_id = add_code(tmp_connection, 'INVALID')
+    database_controller.set_code_games(tmp_connection, 'BL3-ONLY', ['Borderlands 3'])
+    database_controller.set_code_games(tmp_connection, 'BOTH', ['Borderlands 3', 'Borderlands 2'])
+    database_controller.update_invalid_code(tmp_connection, invalid_id)
+    bl3_user = add_user(tmp_connection, 'bl3', {'Borderlands 3': 'Steam'})
+    bl2_user = add_user(tmp_connection, 'bl2', {'Borderlands 2': 'Epic'})
+    no_games_user = add_user(tmp_connection, 'none', {})
+    database_controller.create_user_code(tmp_connection, bl3_user, used_id, 'Borderlands 3', 'Steam', 1)
+
+    # act
+    plan = ibc.plan_redemptions(tmp_connection, CACHE_HOURS)
+
+    # assert
+    assert sorted(planned_codes(plan, bl3_user)) == ['BL3-ONLY', 'BOTH', 'UNCHECKED']
+    assert sorted(planned_codes(plan, bl2_user)) == ['BOTH', 'UNCHECKED', 'USED']
+    assert no_games_user not in plan
+
+
+def test_plan_lists_code_once_per_user(tmp_connection):
+    # arrange
+    add_code(tmp_connection, 'BOTH')
+    database_controller.set_code_games(tmp_connection, 'BOTH', ['Borderlands 3', 'Borderlands 2'])
+    user_id = add_user(tmp_connection, 'user', {'Borderlands 3': 'Steam', 'Borderlands 2': 'Steam'})
+
+    # act
+    plan = ibc.plan_redemptions(tmp_connection, CACHE_HOURS)
+    work = database_controller.select_redemption_work(tmp_connection, CACHE_HOURS)
+
+    # assert
+    assert planned_codes(plan, user_id) == ['BOTH']
+    assert sorted(row['planned_game'] for row in work) == ['Borderlands 2', 'Borderlands 3']
@@ -0,0 +1,66 @@
+import app.database_controller as db
+from app.config import get_config
+from app.response_cache import ResponseCache
+
+CODES_URL = get_config().BASE_PATH + '/codes'
+
+
+def test_writes_bump_data_version(sqlite_connection):
+    # arrange
+    version = db.get_data_version(sqlite_connection)
+    code = db.select_all_codes(sqlite_connection)[0]
+
+    # act
+    db.update_invalid_code(sqlite_connection, code['_id'])
+    with sqlite_connection:
+        sqlite_connection.execute('UPDATE code SET is_valid = 1 WHERE _id = ?', (code['_id'], ))
+
+    # assert
+    assert db.get_data_version(sqlite_connection) == version + 2
+
+
+def test_codes_not_modified_until_written(api_client, sqlite_connection):
+    # arrange
+    first = api_client.get(CODES_URL)
+    etag = first.headers['ETag']
+
+    # act
+    not_modified = api_client.get(CODES_URL, headers={'If-None-Match': etag})
+    db.create_user_code(sqlite_connection, 1, db.select_all_codes(sqlite_connection)[0]['_id'],
+                        'Borderlands 3', 'Steam', 1)
+    modified = api_client.get(CODES_URL, headers={'If-None-Match': etag})
+
+    # assert
+    assert first.status_code == 200
+    assert not_modified.status_code == 304
+    assert not_modified.content == b''
+    assert modified.status_code == 200
+    assert modified.headers['ETag'] != etag
+    assert modified.json() == first.json()
+
+
+def test_user_codes_cached_per_user(api_client):
+    # act
+    first = api_client.get(get_config().BASE_PATH + '/user/1/codes')
+    second = api_client.get(get_config().BASE_PATH + '/user/2/codes')
+
+    # assert
+    assert first.status_code == second.status_code == 200
+    assert first.headers['ETag'] != second.headers['ETag']
+
+
+def test_response_cache_drops_old_versions():
+    # arrange
+    cache = ResponseCache(max_entries=2)
+    cache.set(1, 'a', b'1a')
+    cache.set(1, 'b', b'1b')
+    cache.set(1, 'c', b'1c')
+
+    # act
+    cache.set(2, 'a', b'2a')
+    cache.set(1, 'b', b'1b')
+
+    # assert
+    assert cache.get(2, 'a') == b'2a'
+    assert cache.get(1, 'b') is None
+    assert list(cache.entries) == ['a']
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from app.borderlands_crawler import CodeExpiredException, GearboxShiftError, InvalidCodeException, \
+    PlatformOptionNotFoundException, ShiftCodeAlreadyRedeemedException
+from app.shift_client import ShiftClient
+from app.throttle import GearboxThrottle
+from app.util import encrypt
+
+GEARBOX_EMAIL = 'test_gearbox_email_1'
+GEARBOX_PASSWORD = 'test_gearbox_password_1'
+CODE = '3BRTJ-5K659-K5355-BTB3T-633F3'
+
+
+def create_client(stub, password=GEARBOX_PASSWORD):
+    key = os.getenv('BORDERLANDS_ENCRYPTION_KEY').encode()
+    user = {'gearbox_email': GEARBOX_EMAIL, 'gearbox_password': encrypt(password.encode(), key).decode()}
+    return ShiftClient(user=user, base_url=stub.url)
+
+
+@pytest.fixture
+def logged_in_client(gearbox_stub):
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+    gearbox_stub.codes[CODE] = {'games': {'Borderlands 3': ['Steam', 'Epic'], 'Borderlands 2': ['Steam']}}
+    client = create_client(gearbox_stub)
+    assert client.login_gearbox()
+    yield client
+    client.tear_down()
+
+
+def test_login_with_wrong_password(gearbox_stub):
+    # arrange
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+    client = create_client(gearbox_stub, password='wrong_password')
+
+    # act / assert
+    assert not client.login_gearbox()
+
+
+def test_get_games_and_redeem(logged_in_client, gearbox_stub):
+    # act
+    games = logged_in_client.get_games_to_redeem_for_code(CODE)
+    redeemed = logged_in_client.redeem_shift_code(CODE, 'Borderlands 3', 'Epic')
+
+    # assert
+    assert games == ['Borderlands 3', 'Borderlands 2']
+    assert redeemed
+    assert gearbox_stub.redemptions == [(GEARBOX_EMAIL, CODE, 'oak', 'epic')]
+
+
+def test_redeem_twice_raises_already_redeemed(logged_in_client):
+    # arrange
+    logged_in_client.input_shift_code(CODE)
+    logged_in_client.redeem_shift_code(CODE, 'Borderlands 3', 'Steam')
+    logged_in_client.input_shift_code(CODE)
+
+    # act / assert
+    with pytest.raises(ShiftCodeAlreadyRedeemedException):
+        logged_in_client.redeem_shift_code(CODE, 'Borderlands 3', 'Steam')
+
+
+def test_redeem_on_missing_platform(logged_in_client):
+    # arrange
+    logged_in_client.input_shift_code(CODE)
+
+    # act / assert
+    with pytest.raises(PlatformOptionNotFoundException):
+        logged_in_client.redeem_shift_code(CODE, 'Borderlands 2', 'Epic')
+
+
+@pytest.mark.parametrize(
+    "error, exception",
+    [(None, InvalidCodeException),
+     ('This SHiFT code has expired', CodeExpiredException),
+     ('To continue to redeem SHiFT codes, please launch a SHiFT-enabled title first!', GearboxShiftError)]
+)
+def test_code_check_errors(logged_in_client, gearbox_stub, error, exception):
+    # arrange
+    code = 'KSWJJ-J6TTJ-FRCF9-X333J-5Z6KJ'
+    if error:
+        gearbox_stub.codes[code] = {'games': {}, 'error': error}
+
+    # act / assert
+    with pytest.raises(exception):
+        logged_in_client.get_games_to_redeem_for_code(code)
+
+
+def test_requests_go_through_throttle(gearbox_stub):
+    # arrange
+    class CountingThrottle(GearboxThrottle):
+        requests = 0
+
+        def before_request(self):
+            CountingThrottle.requests += 1
+
+    gearbox_stub.accounts[GEARBOX_EMAIL] = GEARBOX_PASSWORD
+    client = create_client(gearbox_stub)
+    client.throttle = CountingThrottle()
+
+    # act
+    client.login_gearbox()
+
+    # assert
+    assert CountingThrottle.requests == 2  # login page and form submit
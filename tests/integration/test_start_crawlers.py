@@ -0,0 +1,251 @@
+import threading
+import time
+
+import pytest
+
+from app import database_controller
+from app import input_borderlands_codes as ibc
+from app.config import get_config
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    config = get_config()
+    config.CRAWL_TASK_RETRY_SECONDS = 0.01
+    monkeypatch.setattr(ibc, 'get_config', lambda: config)
+    return config
+
+
+def add_crawler_users(conn, user_count):
+    database_controller.create_code(conn, {'game': 'Borderlands 3', 'platform': 'Universal',
+                                           'code': '3BRTJ-5K659-K5355-BTB3T-633F3', 'type': 'shift',
+                                           'reward': 'Unknown', 'time_gathered': 'Unknown', 'expires': 'Unknown'})
+    for i in range(user_count):
+        user_id = database_controller.create_user(conn, {
+            'email': f'crawler_email_{i}',
+            'password': 'password',
+            'gearbox_email': f'crawler_gearbox_email_{i}',
+            'gearbox_password': 'gearbox_password',
+        })
+        database_controller.create_user_game(conn, 'Borderlands 3', 'Steam', user_id)
+
+
+def test_start_crawlers_runs_users_concurrently(tmp_db_file, tmp_connection, monkeypatch):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=6)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fake_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        assert worker_conn is not conn  # each worker owns its connection
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        result = ibc.new_user_result(user[0])
+        result['redeemed'] = 1
+        return result
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', fake_input_borderlands_codes)
+
+    # act
+    results = ibc.start_crawlers(conn, db_file=db_file, workers=3)
+
+    # assert
+    assert sorted(result['user_id'] for result in results) == [1, 2, 3, 4, 5, 6]
+    assert all(result['redeemed'] == 1 for result in results)
+    assert peak[0] == 3
+
+
+def test_start_crawlers_retries_worker_errors(tmp_db_file, tmp_connection, monkeypatch, fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=2)
+    calls = []
+
+    def failing_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        calls.append(user[0])
+        raise ibc.GearboxUnexpectedError('gearbox is down')
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', failing_input_borderlands_codes)
+
+    # act
+    results = ibc.start_crawlers(conn, db_file=db_file, workers=2)
+
+    # assert
+    assert len(results) == 2
+    assert all('gearbox is down' in result['error'] for result in results)
+    assert sorted(calls) == [1, 1, 1, 2, 2, 2]  # CRAWL_TASK_MAX_ATTEMPTS each
+    tasks = conn.execute('SELECT status, attempts FROM crawl_task').fetchall()
+    assert [tuple(task) for task in tasks] == [('failed', 3), ('failed', 3)]
+
+
+def test_start_crawlers_fails_login_errors_without_retrying(tmp_db_file, tmp_connection, monkeypatch,
+                                                            fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=2)
+    calls = []
+
+    def failing_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        calls.append(user[0])
+        raise ibc.GearboxLoginError('login failed')
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', failing_input_borderlands_codes)
+
+    # act
+    results = ibc.start_crawlers(conn, db_file=db_file, workers=2)
+
+    # assert
+    assert all('login failed' in result['error'] for result in results)
+    assert sorted(calls) == [1, 2]
+    tasks = conn.execute('SELECT status, attempts FROM crawl_task').fetchall()
+    assert [tuple(task) for task in tasks] == [('failed', 1), ('failed', 1)]
+
+
+def test_start_crawlers_runs_other_users_during_a_backoff(tmp_db_file, tmp_connection, monkeypatch, fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=2)
+    monkeypatch.setattr(fast_retries, 'CRAWL_TASK_RETRY_SECONDS', 1)
+    monkeypatch.setattr(fast_retries, 'CRAWL_TASK_MAX_ATTEMPTS', 2)
+    calls = []
+
+    def fake_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        calls.append(user[0])
+        if user[0] == 1:
+            raise ibc.GearboxUnexpectedError('gearbox is down')
+        return ibc.new_user_result(user[0])
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', fake_input_borderlands_codes)
+
+    # act
+    ibc.start_crawlers(conn, db_file=db_file, workers=1)
+
+    # assert
+    assert calls == [1, 2, 1]  # user 2 did not wait for user 1's backoff
+
+
+def test_start_crawlers_sleeps_through_a_backoff(tmp_db_file, tmp_connection, monkeypatch, fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=1)
+    monkeypatch.setattr(fast_retries, 'CRAWL_TASK_RETRY_SECONDS', 1)
+    monkeypatch.setattr(fast_retries, 'CRAWL_TASK_MAX_ATTEMPTS', 2)
+    checks = []
+
+    def fake_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        raise ibc.GearboxUnexpectedError('gearbox is down')
+
+    def counting_is_due(task):
+        checks.append(task['_id'])
+        return is_due(task)
+
+    is_due = ibc.is_due
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', fake_input_borderlands_codes)
+    monkeypatch.setattr(ibc, 'is_due', counting_is_due)
+
+    # act
+    results = ibc.start_crawlers(conn, db_file=db_file, workers=1)
+
+    # assert
+    assert len(results) == 1
+    assert len(checks) < 10  # the loop waited for the task to be due instead of checking it over and over
+
+
+def test_start_crawlers_closes_the_pool_when_a_worker_raises(tmp_db_file, tmp_connection, monkeypatch):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=1)
+    closed = []
+
+    def broken_run_task(*args):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(ibc, 'run_task', broken_run_task)
+    monkeypatch.setattr(ibc.BrowserPool, 'close', lambda pool: closed.append(pool))
+
+    # act
+    with pytest.raises(RuntimeError):
+        ibc.start_crawlers(conn, db_file=db_file, workers=1)
+
+    # assert
+    assert len(closed) == 1
+    assert conn.execute('SELECT status FROM crawl_run').fetchone()[0] == 'running'  # resumed by the next call
+
+
+def test_start_crawlers_resumes_unfinished_run(tmp_db_file, tmp_connection, monkeypatch, fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=3)
+    run_id = ibc.start_crawl_run(conn, ibc.plan_redemptions(conn, 24), fast_retries)
+    tasks = database_controller.select_unfinished_crawl_tasks(conn, run_id)
+    # the process stopped with user 1 done and user 2 in progress, and the lease on user 2 has run out since
+    database_controller.update_crawl_task(conn, tasks[0]['_id'], 'done')
+    database_controller.start_crawl_task(conn, tasks[1]['_id'], 'start_crawlers@host:1:stopped', 60)
+    conn.execute("UPDATE crawl_task SET lease_expires = datetime('now', '-1 seconds') WHERE _id = ?",
+                 (tasks[1]['_id'], ))
+    conn.commit()
+    crawled = []
+
+    def fake_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        crawled.append(user[0])
+        return ibc.new_user_result(user[0])
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', fake_input_borderlands_codes)
+
+    # act
+    ibc.start_crawlers(conn, db_file=db_file, workers=2)
+
+    # assert
+    assert sorted(crawled) == [2, 3]
+    statuses = conn.execute('SELECT user_id, status, attempts FROM crawl_task ORDER BY user_id').fetchall()
+    assert [tuple(task) for task in statuses] == [(1, 'done', 0), (2, 'done', 2), (3, 'done', 1)]
+    assert conn.execute('SELECT status FROM crawl_run WHERE _id = ?', (run_id, )).fetchone()[0] == 'finished'
+
+
+def test_start_crawlers_leaves_tasks_of_a_run_still_going(tmp_db_file, tmp_connection, monkeypatch,
+                                                          fast_retries):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=2)
+    run_id = ibc.start_crawl_run(conn, ibc.plan_redemptions(conn, 24), fast_retries)
+    tasks = database_controller.select_unfinished_crawl_tasks(conn, run_id)
+    # another start_crawlers on this host is crawling user 1
+    other_worker = 'start_crawlers@host:1:other'
+    database_controller.start_crawl_task(conn, tasks[0]['_id'], other_worker, 60)
+    crawled = []
+
+    def fake_input_borderlands_codes(worker_conn, user, games, **kwargs):
+        crawled.append(user[0])
+        return ibc.new_user_result(user[0])
+
+    monkeypatch.setattr(ibc, 'input_borderlands_codes', fake_input_borderlands_codes)
+
+    # act
+    ibc.start_crawlers(conn, db_file=db_file, workers=2)
+
+    # assert
+    assert crawled == [2]
+    task = database_controller.select_crawl_task(conn, tasks[0]['_id'])
+    assert (task['status'], task['lease_owner'], task['attempts']) == ('running', other_worker, 1)
+    assert conn.execute('SELECT status FROM crawl_run WHERE _id = ?', (run_id, )).fetchone()[0] == 'running'
+
+
+def test_start_crawlers_starts_new_run_after_finished_one(tmp_db_file, tmp_connection, monkeypatch):
+    # arrange
+    db_file, conn = tmp_db_file, tmp_connection
+    add_crawler_users(conn, user_count=1)
+    monkeypatch.setattr(ibc, 'input_borderlands_codes',
+                        lambda worker_conn, user, games, **kwargs: ibc.new_user_result(user[0]))
+
+    # act
+    ibc.start_crawlers(conn, db_file=db_file, workers=1)
+    ibc.start_crawlers(conn, db_file=db_file, workers=1)
+
+    # assert
+    runs = conn.execute('SELECT status FROM crawl_run').fetchall()
+    assert [run[0] for run in runs] == ['finished', 'finished']
@@ -0,0 +1,59 @@
+import threading
+
+from app.config import get_config
+from app.jobs import JobQueue
+from app.routes import account
+
+VERIFY_URL = get_config().BASE_PATH + '/verify_gearbox'
+
+
+def test_verify_gearbox_returns_job(api_client, monkeypatch):
+    # arrange
+    monkeypatch.setattr(account, 'verify_jobs', JobQueue(workers=1))
+    logins = []
+
+    def fake_verify(user):
+        logins.append(user)
+        return user['gearbox_email'] == 'good@example.com'
+
+    monkeypatch.setattr(account, 'verify_credentials', fake_verify)
+
+    # act
+    submitted = api_client.post(VERIFY_URL, json={'gearbox_email': 'good@example.com', 'gearbox_password': 'pw'})
+    account.verify_jobs.shutdown(wait=True)
+    status = api_client.get(f"{VERIFY_URL}/{submitted.json()['job_id']}")
+
+    # assert
+    assert submitted.status_code == 202
+    assert submitted.json()['status'] in ('pending', 'running', 'succeeded')
+    assert status.status_code == 200
+    assert status.json()['status'] == 'succeeded'
+    assert status.json()['result'] is True
+    assert logins[0]['gearbox_password'] != 'pw'  # only the encrypted password is handed to the worker
+
+
+def test_verify_gearbox_deduplicates_email(api_client, monkeypatch):
+    # arrange
+    monkeypatch.setattr(account, 'verify_jobs', JobQueue(workers=1))
+    release = threading.Event()
+    monkeypatch.setattr(account, 'verify_credentials', lambda user: release.wait(5))
+    data = {'gearbox_email': 'same@example.com', 'gearbox_password': 'pw'}
+
+    # act
+    first = api_client.post(VERIFY_URL, json=data)
+    second = api_client.post(VERIFY_URL, json={**data, 'gearbox_email': 'SAME@example.com'})
+    other_password = api_client.post(VERIFY_URL, json={**data, 'gearbox_password': 'corrected'})
+    release.set()
+    account.verify_jobs.shutdown(wait=True)
+
+    # assert
+    assert first.json()['job_id'] == second.json()['job_id']
+    assert other_password.json()['job_id'] != first.json()['job_id']
+
+
+def test_verify_gearbox_unknown_job(api_client):
+    # act
+    response = api_client.get(f'{VERIFY_URL}/not-a-job')
+
+    # assert
+    assert response.status_code == 404
@@ -0,0 +1,183 @@
+import pytest
+
+from app import database_controller
+from app import input_borderlands_codes as ibc
+from app.borderlands_crawler import GearboxShiftError, InvalidCodeException
+from app.crawl_tasks import Heartbeat, LeaseLostError
+from app.throttle import GearboxThrottle
+from app.write_buffer import WriteBuffer
+
+CODES = ['3BRTJ-5K659-K5355-BTB3T-633F3', 'KSWJJ-J6TTJ-FRCF9-X333J-5Z6KJ', 'TBRJJ-TW659-W5B5C-T3B3J-3BTBK']
+
+
+@pytest.fixture
+def crawl_conn(tmp_connection):
+    conn = tmp_connection
+    database_controller.create_user(conn, {'email': 'email', 'password': 'password',
+                                           'gearbox_email': 'gearbox_email', 'gearbox_password': 'gearbox_password'})
+    database_controller.create_codes_bulk(conn, [
+        {'game': 'Borderlands 3', 'platform': 'Universal', 'code': code, 'type': 'shift', 'reward': 'Unknown',
+         'time_gathered': 'Unknown', 'expires': 'Unknown'} for code in CODES])
+    return conn
+
+
+def count_user_codes(conn) -> int:
+    return conn.execute('SELECT COUNT(*) FROM user_code').fetchone()[0]
+
+
+def test_writes_wait_for_flush(crawl_conn):
+    # arrange
+    writes = WriteBuffer(crawl_conn, size=10)
+
+    # act
+    writes.add_user_code(1, 1, 'Borderlands 3', 'Steam', 1)
+    writes.add_user_code(1, 1, 'Borderlands 3', 'Steam', 1)  # already recorded, skipped
+    writes.add_invalid_code(2)
+    writes.set_notify_launch_game(1, 1)
+    before_flush = count_user_codes(crawl_conn)
+    created = writes.flush()
+
+    # assert
+    assert before_flush == 0
+    assert created == 1
+    assert len(writes) == 0
+    assert count_user_codes(crawl_conn) == 1
+    assert database_controller.select_code_by_id(crawl_conn, 2)[0]['is_valid'] == 0
+    assert database_controller.select_user_by_id(crawl_conn, 1)['notify_launch_game'] == 1
+
+
+def test_writes_flushed_when_full(crawl_conn):
+    # arrange
+    writes = WriteBuffer(crawl_conn, size=2)
+
+    # act
+    writes.add_user_code(1, 1, 'Borderlands 3', 'Steam', 1)
+    writes.add_user_code(1, 2, 'Borderlands 3', 'Steam', 1)
+    writes.add_user_code(1, 3, 'Borderlands 3', 'Steam', 1)
+
+    # assert
+    assert count_user_codes(crawl_conn) == 2
+    assert len(writes) == 1
+
+
+class FakeRedeemer:
+    """Redeems the first code, finds the second invalid, then hits the launch a title limit."""
+
+    def __init__(self, user):
+        self.user = user
+        self.redeemed = 0
+        self.checked = []
+        self.torn_down = False
+
+    def login_gearbox(self):
+        return True
+
+    def get_session_cookies(self):
+        return []
+
+    def restore_session(self, cookies):
+        return False
+
+    def get_games_to_redeem_for_code(self, code):
+        self.checked.append(code)
+        if code == CODES[1]:
+            raise InvalidCodeException(code)
+        return ['Borderlands 3']
+
+    def input_shift_code(self, code):
+        return True
+
+    def redeem_shift_code(self, code, game, platform):
+        if self.redeemed:
+            raise GearboxShiftError('launch a title')
+        self.redeemed += 1
+        return True
+
+    def tear_down(self):
+        self.torn_down = True
+
+
+def test_crawl_results_written_when_crawl_stops_early(crawl_conn, monkeypatch):
+    # arrange
+    redeemers = []
+
+    def create_redeemer(user, **kwargs):
+        redeemers.append(FakeRedeemer(user))
+        return redeemers[-1]
+
+    monkeypatch.setattr(ibc, 'create_redeemer', create_redeemer)
+    user = database_controller.select_all_users_with_gearbox(crawl_conn)[0]
+
+    # act
+    result = ibc.input_borderlands_codes(crawl_conn, user, {'Borderlands 3': 'Steam'})
+
+    # assert
+    assert result['redeemed'] == 1
+    assert result['error'] == 'launch a title'
+    assert redeemers[0].torn_down
+    assert count_user_codes(crawl_conn) == 1
+    assert database_controller.select_code_by_id(crawl_conn, 2)[0]['is_valid'] == 0
+    assert database_controller.select_user_by_id(crawl_conn, 1)['notify_launch_game'] == 1
+
+
+def test_crawl_stops_at_account_quota(crawl_conn, monkeypatch):
+    # arrange
+    monkeypatch.setattr(ibc, 'create_redeemer', lambda user, **kwargs: FakeRedeemer(user))
+    user = database_controller.select_all_users_with_gearbox(crawl_conn)[0]
+
+    # act
+    result = ibc.input_borderlands_codes(crawl_conn, user, {'Borderlands 3': 'Steam'},
+                                         throttle=GearboxThrottle(account_quota=1))
+
+    # assert
+    assert result['redeemed'] == 1
+    assert result['error'].startswith('Reached the limit of 1 redemptions')
+    assert count_user_codes(crawl_conn) == 1
+    assert database_controller.select_user_by_id(crawl_conn, 1)['notify_launch_game'] == 0
+
+
+def test_crawl_stops_when_the_lease_is_lost(crawl_conn, monkeypatch):
+    # arrange
+    redeemers = []
+
+    def create_redeemer(user, **kwargs):
+        redeemers.append(FakeRedeemer(user))
+        return redeemers[-1]
+
+    def lose_lease(task_id):
+        raise LeaseLostError(f'Crawl task {task_id} is not leased to worker-1')
+
+    monkeypatch.setattr(ibc, 'create_redeemer', create_redeemer)
+    user = database_controller.select_all_users_with_gearbox(crawl_conn)[0]
+
+    # act
+    with Heartbeat(lose_lease, 1, interval=0.01) as heartbeat:
+        heartbeat.lost.wait(5)
+        with pytest.raises(LeaseLostError):
+            ibc.input_borderlands_codes(crawl_conn, user, {'Borderlands 3': 'Steam'}, cancel=heartbeat.lost)
+
+    # assert
+    assert redeemers[0].redeemed == 0  # stopped before the first code
+    assert redeemers[0].torn_down
+
+
+def test_refused_write_stops_the_crawl(crawl_conn, tmp_db_file, monkeypatch):
+    # arrange
+    redeemers = []
+
+    def create_redeemer(user, **kwargs):
+        redeemers.append(FakeRedeemer(user))
+        return redeemers[-1]
+
+    def refuse(user_codes, invalid_code_ids, notify_launch_game):
+        raise LeaseLostError('Crawl task 1 is not leased to worker-1')
+
+    monkeypatch.setattr(ibc, 'create_redeemer', create_redeemer)
+    user = database_controller.select_all_users_with_gearbox(crawl_conn)[0]
+
+    # act
+    with pytest.raises(LeaseLostError):
+        ibc.crawl_user(tmp_db_file, user, {'Borderlands 3': 'Steam'}, writes=WriteBuffer(size=1, write=refuse))
+
+    # assert
+    assert redeemers[0].checked == [CODES[0]]  # the codes after the refused write are not tried
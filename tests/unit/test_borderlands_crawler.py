@@ -0,0 +1,90 @@
+import logging
+import time
+
+from app.borderlands_crawler import BorderlandsCrawler, code_check_finished
+
+
+class FakeElement:
+    def __init__(self, text='', displayed=True):
+        self.text = text
+        self.displayed = displayed
+
+    def is_displayed(self):
+        return self.displayed
+
+
+class FakeDriver:
+    def __init__(self, elements=None):
+        self.elements = elements or {}
+
+    def find_elements_by_id(self, elem_id):
+        return self.elements.get(elem_id, [])
+
+
+class FakePool:
+    def __init__(self, driver):
+        self.driver = driver
+        self.released = []
+
+    def acquire(self):
+        return self.driver
+
+    def release(self, driver):
+        self.released.append(driver)
+
+
+def test_wait_for_returns_once_condition_is_met(caplog):
+    # arrange
+    pool = FakePool(FakeDriver())
+    crawler = BorderlandsCrawler(user={}, pool=pool)
+    ready_at = time.monotonic() + 0.2
+
+    # act
+    with caplog.at_level(logging.DEBUG):
+        value = crawler.wait_for(lambda driver: time.monotonic() >= ready_at, 'page', timeout=5)
+
+    # assert
+    assert value is True
+    assert 'for page' in caplog.text
+
+
+def test_wait_for_times_out(caplog):
+    # arrange
+    crawler = BorderlandsCrawler(user={}, pool=FakePool(FakeDriver()))
+
+    # act
+    value = crawler.wait_for(lambda driver: False, 'missing element', timeout=0.2)
+
+    # assert
+    assert value is None
+    assert 'Timed out after 0.2s waiting for missing element' in caplog.text
+
+
+def test_tear_down_returns_driver_to_pool():
+    # arrange
+    driver = FakeDriver()
+    pool = FakePool(driver)
+    crawler = BorderlandsCrawler(user={}, pool=pool)
+
+    # act
+    crawler.tear_down()
+
+    # assert
+    assert pool.released == [driver]
+
+
+def test_code_check_finished():
+    assert not code_check_finished(FakeDriver({'code_results': [FakeElement('')],
+                                               'shift_code_instructions': [FakeElement(displayed=False)]}))
+    assert code_check_finished(FakeDriver({'code_results': [FakeElement('Borderlands 3')]}))
+    assert code_check_finished(FakeDriver({'code_results': [FakeElement('')],
+                                           'shift_code_instructions': [FakeElement(displayed=True)]}))
+
+
+def test_urls_follow_the_gearbox_base_url():
+    # act
+    crawler = BorderlandsCrawler(user={}, pool=FakePool(FakeDriver()), base_url='http://127.0.0.1:8080')
+
+    # assert
+    assert crawler.gearbox_url == 'http://127.0.0.1:8080/home'
+    assert crawler.rewards_url == 'http://127.0.0.1:8080/rewards'
@@ -0,0 +1,147 @@
+import pytest
+
+from app import browser_pool
+from app.browser_pool import BrowserPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.crashed = False
+        self.cookies_cleared = 0
+        self.quit_called = False
+
+    def delete_all_cookies(self):
+        if self.crashed:
+            raise ConnectionRefusedError('geckodriver is gone')
+        self.cookies_cleared += 1
+
+    def execute_script(self, script):
+        pass
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def launched(monkeypatch):
+    drivers = []
+
+    def fake_create_driver(browser, headless):
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    monkeypatch.setattr(browser_pool, 'create_driver', fake_create_driver)
+    return drivers
+
+
+def test_driver_is_reused_and_reset(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_memory_mb=0)
+
+    # act
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+
+    # assert
+    assert first is second
+    assert len(launched) == 1
+    assert first.cookies_cleared == 2
+
+
+def test_driver_recycled_after_max_uses(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_uses=2, max_memory_mb=0)
+
+    # act
+    for _ in range(3):
+        with pool.session():
+            pass
+
+    # assert
+    assert len(launched) == 2
+    assert launched[0].quit_called
+    assert not launched[1].quit_called
+
+
+def test_crashed_driver_is_replaced(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_memory_mb=0)
+
+    # act
+    with pool.session() as driver:
+        driver.crashed = True
+    with pool.session() as replacement:
+        pass
+
+    # assert
+    assert driver.quit_called
+    assert replacement is not driver
+
+
+def test_acquire_waits_when_pool_is_full(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_memory_mb=0)
+    pool.acquire()
+
+    # act / assert
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+
+
+def test_close_quits_idle_drivers(launched):
+    # arrange
+    pool = BrowserPool(size=2, max_memory_mb=0)
+    with pool.session():
+        pass
+
+    # act
+    pool.close()
+
+    # assert
+    assert launched[0].quit_called
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_pool_opened_again_after_close(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_memory_mb=0)
+    with pool.session():
+        pass
+    pool.close()
+
+    # act
+    pool.open()
+    with pool.session() as driver:
+        pass
+
+    # assert
+    assert driver is launched[1]
+    assert not driver.quit_called
+
+
+def test_driver_released_while_pool_closes_is_quit(launched):
+    # arrange
+    pool = BrowserPool(size=1, max_memory_mb=0)
+    driver = pool.acquire()
+    reset = pool.reset
+
+    def reset_then_close(reset_driver):
+        result = reset(reset_driver)
+        pool.close()  # close() runs while release is resetting the driver
+        return result
+
+    pool.reset = reset_then_close
+
+    # act
+    pool.release(driver)
+
+    # assert
+    assert driver.quit_called
+    assert pool._idle == []
+    assert pool._created == 0
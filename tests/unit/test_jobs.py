@@ -0,0 +1,116 @@
+import threading
+
+from app.jobs import JobQueue, FAILED, SUCCEEDED
+
+
+def wait_for(queue: JobQueue, job_id: str):
+    queue.shutdown(wait=True)
+    return queue.get(job_id)
+
+
+def test_job_result_returned():
+    # arrange
+    queue = JobQueue(workers=1)
+
+    # act
+    job = queue.submit('key', lambda a, b: a + b, 1, 2)
+
+    # assert
+    job = wait_for(queue, job.id)
+    assert job.to_dict() == {'job_id': job.id, 'status': SUCCEEDED, 'result': 3, 'error': None}
+
+
+def test_job_error_hidden():
+    # arrange
+    queue = JobQueue(workers=1, error_message='Something went wrong')
+
+    def fail():
+        raise Exception('secret details')
+
+    # act
+    job = queue.submit('key', fail)
+
+    # assert
+    job = wait_for(queue, job.id)
+    assert job.status == FAILED
+    assert job.error == 'Something went wrong'
+
+
+def test_same_key_deduplicated_while_running():
+    # arrange
+    queue = JobQueue(workers=2)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return True
+
+    # act
+    first = queue.submit('a@example.com', slow)
+    second = queue.submit('a@example.com', slow)
+    other = queue.submit('b@example.com', slow)
+    release.set()
+    queue.shutdown(wait=True)
+
+    # assert
+    assert first is second
+    assert other is not first
+    assert len(calls) == 2
+
+
+def test_key_can_be_resubmitted_once_finished():
+    # arrange
+    queue = JobQueue(workers=1)
+    first = queue.submit('key', lambda: 1)
+    queue.executor.submit(lambda: None).result()  # the single worker has finished the first job
+
+    # act
+    second = queue.submit('key', lambda: 2)
+
+    # assert
+    assert wait_for(queue, second.id).result == 2
+    assert second is not first
+
+
+def test_finished_jobs_expire():
+    # arrange
+    queue = JobQueue(workers=1, ttl_seconds=0)
+    job = queue.submit('key', lambda: 1)
+
+    # act
+    queue.shutdown(wait=True)
+
+    # assert
+    assert queue.get(job.id) is None
+
+
+def test_queued_jobs_run_after_shutdown_without_wait():
+    # arrange
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+    first = queue.submit('first', release.wait)
+    second = queue.submit('second', lambda: 2)
+    executor = queue.executor
+
+    # act
+    queue.shutdown(wait=False)
+    release.set()
+    executor.shutdown(wait=True)
+
+    # assert
+    assert queue.get(first.id).status == SUCCEEDED
+    assert queue.get(second.id).result == 2
+
+
+def test_jobs_run_again_after_shutdown():
+    # arrange
+    queue = JobQueue(workers=1)
+    queue.shutdown(wait=True)
+
+    # act
+    job = queue.submit('key', lambda: 1)
+
+    # assert
+    assert wait_for(queue, job.id).status == SUCCEEDED
@@ -0,0 +1,40 @@
+import json
+import sqlite3
+
+from app import json_response
+from app.models.schemas import CodeResponse
+
+
+def code_rows():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE code(_id INTEGER PRIMARY KEY, game TEXT, platform TEXT, code TEXT, type TEXT, '
+                 'reward TEXT, time_gathered TEXT, expires TEXT, is_valid INT)')
+    conn.execute("INSERT INTO code VALUES(1, 'Borderlands 3', 'Universal', 'AAAAA-BBBBB-CCCCC-DDDDD-EEEEE', 'shift', "
+                 "'3 Golden Keys — \"rare\"', '2022-06-24 14:41:47', 'Unknown', 1)")
+    return conn.execute('SELECT * FROM code').fetchall()
+
+
+def test_rows_serialise_to_documented_schema():
+    # arrange
+    content = {'msg': '1 items returned', 'type': 'success', 'self': 'http://test/codes',
+               'data': json_response.row_dicts(code_rows())}
+
+    # act
+    body = json_response.dumps(content)
+
+    # assert
+    assert json.loads(body) == json.loads(CodeResponse(**content).json(by_alias=True))
+
+
+def test_dumps_without_orjson(monkeypatch):
+    # arrange
+    content = {'data': json_response.row_dicts(code_rows(), ['code', 'reward'])}
+    fast = json_response.dumps(content)
+
+    # act
+    monkeypatch.setattr(json_response, 'orjson', None)
+    fallback = json_response.dumps(content)
+
+    # assert
+    assert json.loads(fallback) == json.loads(fast)
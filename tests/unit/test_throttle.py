@@ -0,0 +1,104 @@
+import pytest
+
+from app.throttle import AccountQuota, AccountQuotaExceeded, CircuitBreaker, GearboxThrottle, TokenBucket
+
+
+class FakeClock:
+    """Time that only moves when something sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_allows_burst_then_rate():
+    # arrange
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    # act
+    waits = [bucket.acquire() for _ in range(5)]
+
+    # assert
+    assert waits == [0, 0, 0, 0.5, 0.5]
+    assert clock.now == 1.0
+
+
+def test_token_bucket_without_rate_never_waits():
+    # arrange
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0, clock=clock, sleep=clock.sleep)
+
+    # act
+    waits = [bucket.acquire() for _ in range(100)]
+
+    # assert
+    assert not any(waits)
+    assert clock.sleeps == []
+
+
+def test_circuit_breaker_opens_after_threshold():
+    # arrange
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, cooldown=60, clock=clock, sleep=clock.sleep)
+
+    # act
+    breaker.record_failure()
+    closed_after_one = not breaker.is_open
+    breaker.record_failure()
+    waited = breaker.wait()
+
+    # assert
+    assert closed_after_one
+    assert waited == 60
+    assert not breaker.is_open
+
+
+def test_circuit_breaker_reopens_on_failure_after_cooldown():
+    # arrange
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=3, cooldown=60, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.wait()
+
+    # act
+    breaker.record_failure()
+    reopened = breaker.is_open
+    breaker.wait()
+    breaker.record_success()
+    breaker.record_failure()
+
+    # assert
+    assert reopened
+    assert not breaker.is_open
+
+
+def test_account_quota_per_account():
+    # arrange
+    quota = AccountQuota(limit=2)
+
+    # act
+    first = [quota.take('a@example.com') for _ in range(3)]
+    other = quota.take('b@example.com')
+
+    # assert
+    assert first == [True, True, False]
+    assert other
+
+
+def test_gearbox_throttle_raises_when_quota_used():
+    # arrange
+    throttle = GearboxThrottle(account_quota=1)
+    throttle.take_quota('a@example.com')
+
+    # act / assert
+    with pytest.raises(AccountQuotaExceeded):
+        throttle.take_quota('a@example.com')
@@ -1,5 +1,5 @@
 from datetime import datetime
-from app.get_codes_twitter import get_code, get_reward, get_game, get_expiration
+from app.get_codes_twitter import get_code, get_reward, get_game, get_expiration, parse_tweet_codes
 from app.util import convert_date
 import pytest
 
@@ -119,3 +119,54 @@ def test_get_expiration(test_tweet, expected_expiration):
 
     # assert
     assert expiration == expected_expiration
+
+
+@pytest.mark.parametrize(
+    "test_tweet, expected_code",
+    [(test_tweet_data[0], ('Wonderlands', 'Universal', '3BRTJ-5K659-K5355-BTB3T-633F3', '1 Skeleton Key')),
+     (test_tweet_data[1], ('Borderlands 3', 'Universal', 'KSWJJ-J6TTJ-FRCF9-X333J-5Z6KJ', 'Shrine Saint Head (Amara)')),
+     (test_tweet_data[5], ('Borderlands 2', 'Universal', 'WSCBT-R5BB3-66KX9-F3JBT-ZW3JK', 'Pilot Punk Head'))]
+)
+def test_parse_tweet_codes(test_tweet, expected_code):
+    # act
+    codes = parse_tweet_codes(test_tweet)
+
+    # assert
+    assert [(code['game'], code['platform'], code['code'], code['reward']) for code in codes] == [expected_code]
+    assert codes[0]['expires'] == get_expiration(test_tweet)
+
+
+def test_parse_tweet_codes_with_platform_labels():
+    # arrange
+    tweet = ('SHIFT CODE (Classic)\nGame: BORDERLANDS: PRE-SEQUEL\nReward: 5 Gold Keys\n\n'
+             'PC: K353B-CXTBW-FXBFK-JBJJJ-BSXWJ\nXB: CT5TT-BFK95-9ZX6Z-C6JTB-K3STZ\n'
+             'Universal (Facebook)\nKKK3J-T35K6-FZB6T-JBJJ3-JSFKK\nRedeem: https://shift.gearboxsoftware.com/rewards')
+
+    # act
+    codes = parse_tweet_codes(tweet)
+
+    # assert
+    assert [(code['platform'], code['code']) for code in codes] == [('PC', 'K353B-CXTBW-FXBFK-JBJJJ-BSXWJ'),
+                                                                    ('Xbox', 'CT5TT-BFK95-9ZX6Z-C6JTB-K3STZ'),
+                                                                    ('Universal', 'KKK3J-T35K6-FZB6T-JBJJ3-JSFKK')]
+    assert {code['game'] for code in codes} == {'Borderlands: Pre-Sequel'}
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [('XBOX/PS: CT5TT-BFK95-9ZX6Z-C6JTB-K3STZ', ('Universal', 'CT5TT-BFK95-9ZX6Z-C6JTB-K3STZ')),
+     ('Steam/Epic: K353B-CXTBW-FXBFK-JBJJJ-BSXWJ', ('PC', 'K353B-CXTBW-FXBFK-JBJJJ-BSXWJ')),
+     ('Xbox / PlayStation (Console): CBK3J-6RS9S-SBWZW-ZTKJ3-CBR3H', ('Universal', 'CBK3J-6RS9S-SBWZW-ZTKJ3-CBR3H')),
+     ('Switch: CBK3J-6RS9S-SBWZW-ZTKJ3-CBR3H', ('Universal', 'CBK3J-6RS9S-SBWZW-ZTKJ3-CBR3H')),
+     ('Use code KKK3J-T35K6-FZB6T-JBJJ3-JSFKK for 3 Golden Keys', ('Universal', 'KKK3J-T35K6-FZB6T-JBJJ3-JSFKK'))]
+)
+def test_parse_tweet_codes_with_combined_labels_and_codes_in_text(line, expected):
+    # arrange
+    tweet = f'SHiFT CODE\n\nGame: BORDERLANDS 3\nReward: 3 Golden Keys\n\n{line}\n\nRedeem in-game'
+
+    # act
+    codes = parse_tweet_codes(tweet)
+
+    # assert
+    assert [(code['platform'], code['code']) for code in codes] == [expected]
+    assert get_code(tweet) == ('SHiFT', expected[1])
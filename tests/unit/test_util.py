@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+from app.util import parse_date
+
+
+@pytest.mark.parametrize(
+    "test_input, expected",
+    [('26 May 2022 17:30:00 -0400', datetime(datetime.now().year, 5, 26, 21, 30)),
+     ('  2 jun 07:59 gmt ', datetime(datetime.now().year, 6, 2, 7, 59)),
+     ('11 January', datetime(datetime.now().year, 1, 11)),
+     ('11 Jan 14:00 Sunday', datetime(datetime.now().year, 1, 11, 14, 0))]
+)
+def test_parse_date(test_input, expected):
+    # act
+    parsed_date = parse_date(test_input)
+
+    # assert
+    assert parsed_date == expected
+
+
+@pytest.mark.parametrize("test_input", [None, '', 'Unknown', '01 SMARCH 23:59', '20 APR 23:59 XYZ', '31 Feb'])
+def test_parse_date_unrecognised(test_input):
+    assert parse_date(test_input) is None